@@ -5,19 +5,165 @@
 # (See accompanying file LICENSE_1_0.txt or http://www.boost.org/LICENSE_1_0.txt)
 
 import argparse
+import concurrent.futures
+import contextlib
+import copy
+import ctypes
+import functools
+import glob
+import hashlib
+import io
 import itertools
+import json
 import math
+import mmap
+import multiprocessing
+import multiprocessing.connection
+import operator
+import os
+import random
+import shlex
+import signal
+import socketserver
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Dict, Hashable, Iterable, Iterator, List, NamedTuple, Optional, Set, TextIO, Tuple
+import numpy as np
 import z3
+try:
+    import pysat.solvers
+except ImportError:
+    pysat = None
 
 
 # type definitions
 Position = Tuple[int, int, int]
-Piece = List[Position]
 RGB = Tuple[float, float, float]
 
 
+class Piece(object):
+    """
+    An immutable piece, i.e. a sequence of positions. The coordinates are stored as packed
+    32-bit integers. The bounding box, the normalized form and the hash are computed once,
+    when they are needed for the first time. A piece can be used like a list of positions:
+    indexing and iterating yield tuples of integers in the original order, which is also
+    the order used by print_piece. Two pieces are equal if they contain the same positions.
+    Functions that expect a piece also accept a list of positions, which is converted with
+    Piece(positions).
+
+    Attributes:
+        coordinates (np.ndarray): A read-only (n, 3) array with the positions of the piece.
+        bbox (Tuple[Position, Position]): The minimum and the maximum corner of the bounding box.
+        normalized (np.ndarray): A read-only array with the distinct positions in sorted order,
+            translated such that the minimum corner of the bounding box is the origin.
+    """
+    __slots__ = ('_data', '_key', '_hash', '_bbox', '_canonical')
+
+    def __new__(cls, positions: Iterable[Position] = ()):
+        if isinstance(positions, Piece):
+            return positions
+        if not isinstance(positions, np.ndarray):
+            positions = list(positions)
+        return cls.from_array(np.array(positions, dtype=np.int32).reshape(-1, 3))
+
+    @classmethod
+    def from_array(cls, coordinates: np.ndarray, normalized: bool = False) -> 'Piece':
+        """
+        Creates a piece from an (n, 3) array of coordinates. If normalized is true, the
+        coordinates are known to be distinct, sorted and moved to the origin, like the
+        rows of normalized_rotations.
+        """
+        piece = object.__new__(cls)
+        piece._data = np.asarray(coordinates, dtype=np.int32).tobytes()
+        piece._key = None
+        piece._hash = None
+        piece._bbox = None
+        piece._canonical = None
+        if normalized:
+            piece._key = bytes(12) + piece._data
+        return piece
+
+    def _normalize(self) -> None:
+        # For small pieces this is much faster than the corresponding numpy operations
+        positions = sorted(set(self))
+        bmin = tuple(map(min, zip(*positions))) if positions else (0, 0, 0)
+        bmax = tuple(map(max, zip(*positions))) if positions else (0, 0, 0)
+        if self._key is None:
+            x0, y0, z0 = bmin
+            points = [value for x, y, z in positions for value in (x - x0, y - y0, z - z0)]
+            self._key = struct.pack(f'=3i{len(points)}i', *bmin, *points)
+        self._bbox = (bmin, bmax)
+
+    @property
+    def coordinates(self) -> np.ndarray:
+        return np.frombuffer(self._data, dtype=np.int32).reshape(-1, 3)
+
+    @property
+    def normalized(self) -> np.ndarray:
+        if self._key is None:
+            self._normalize()
+        return np.frombuffer(self._key, dtype=np.int32, offset=12).reshape(-1, 3)
+
+    @property
+    def bbox(self) -> Tuple[Position, Position]:
+        if self._bbox is None:
+            self._normalize()
+        return self._bbox
+
+    def canonical(self) -> Tuple[Position, ...]:
+        """
+        Returns the canonical form of the piece, see canonical_piece. It is computed once.
+        """
+        if self._canonical is None:
+            self._canonical = min(tuple(map(tuple, rotation)) for rotation in normalized_rotations(self.normalized).tolist())
+        return self._canonical
+
+    def __len__(self) -> int:
+        return len(self.coordinates)
+
+    def __iter__(self) -> Iterator[Position]:
+        return map(tuple, self.coordinates.tolist())
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return Piece.from_array(self.coordinates[key])
+        return tuple(self.coordinates[key].tolist())
+
+    def __contains__(self, position) -> bool:
+        return bool((self.coordinates == position).all(axis=1).any())
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Piece):
+            return NotImplemented
+        if self._key is None:
+            self._normalize()
+        if other._key is None:
+            other._normalize()
+        return self._key == other._key
+
+    def __hash__(self) -> int:
+        if self._hash is None:
+            if self._key is None:
+                self._normalize()
+            self._hash = hash(self._key)
+        return self._hash
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        return self.coordinates if dtype is None else self.coordinates.astype(dtype)
+
+    def __reduce__(self):
+        return Piece.from_array, (self.coordinates,)
+
+    def __repr__(self) -> str:
+        return f'Piece({list(self)})'
+
+
 COLORS = '''
 166,206,227
 31,120,180
@@ -77,13 +223,120 @@ def parse_pieces(text: str) -> List[Piece]:
     # Remove empty lines
     lines = [line for line in lines if line.strip()]
 
-    # Split each line into a list of color values, convert them to integers, and group them into blocks
-    pieces = [[tuple(map(int, lines[i].split()[j:j + 3])) for j in range(0, len(lines[i].split()), 3)] for i in range(len(lines))]
+    # Convert all values to integers at once, and split them into pieces of triples
+    tokens = [line.split() for line in lines]
+    values = np.array(list(itertools.chain.from_iterable(tokens)), dtype=np.int32)
+    ends = np.cumsum([len(line_tokens) for line_tokens in tokens], dtype=np.int64)
+    pieces = [Piece.from_array(values[end - len(line_tokens):end].reshape(-1, 3)) for line_tokens, end in zip(tokens, ends.tolist())]
 
     return pieces
 
 
+class PieceContainer(object):
+    """
+    A binary file with a sequence of groups of pieces, like the pieces of a puzzle, a goal
+    (a group with one piece) or a set of solutions (a group per solution). The file is
+    memory-mapped, so a group is only decoded when it is accessed.
+
+    The file starts with the magic bytes 'BLKC' and a 32-bit version number. Then the
+    coordinates of all pieces follow as 16-bit integer triples, then the offsets of the pieces
+    in the coordinates and the offsets of the groups in the pieces, both as 32-bit integers with
+    a final entry for the end. The file ends with the number of pieces, the number of groups and
+    the start of the offsets as 64-bit integers, followed by the magic bytes. All numbers are
+    little endian. Since the offsets are written last, groups can be written one at a time.
+
+    The memory map stays open until close is called, so a container is best used in a with
+    statement. Pieces that have been read remain valid after closing.
+
+    Attributes:
+        piece_offsets (np.ndarray): For each piece the index of its first position, plus the total.
+        group_offsets (np.ndarray): For each group the index of its first piece, plus the total.
+    """
+    MAGIC = b'BLKC'
+    VERSION = 1
+    SUFFIX = '.blk'
+
+    def __init__(self, filename: str):
+        with open(filename, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        trailer = len(self.buffer) - 28
+        if self.buffer[:4] != PieceContainer.MAGIC or self.buffer[trailer + 24:] != PieceContainer.MAGIC:
+            self.buffer.close()
+            raise ValueError(f"'{filename}' is not a valid piece container")
+        pieces, groups, start = np.frombuffer(self.buffer, dtype='<u8', count=3, offset=trailer).tolist()
+        self.piece_offsets = np.frombuffer(self.buffer, dtype='<u4', count=pieces + 1, offset=start)
+        self.group_offsets = np.frombuffer(self.buffer, dtype='<u4', count=groups + 1, offset=start + 4 * (pieces + 1))
+        self.coordinates = np.frombuffer(self.buffer, dtype='<i2', count=3 * int(self.piece_offsets[-1]), offset=8).reshape(-1, 3)
+
+    @staticmethod
+    def is_container(filename: str) -> bool:
+        """
+        Returns true if the file starts with the magic bytes of a piece container.
+        """
+        with open(filename, 'rb') as f:
+            return f.read(4) == PieceContainer.MAGIC
+
+    @staticmethod
+    def write(path: Path, groups: Iterable[List[Piece]]) -> int:
+        """
+        Writes groups of pieces to a container file, while they are generated. The
+        coordinates must fit in 16-bit integers.
+
+        Returns:
+            int: The number of groups.
+        """
+        piece_offsets = [0]
+        group_offsets = [0]
+        with path.open('wb') as f:
+            f.write(PieceContainer.MAGIC + struct.pack('<I', PieceContainer.VERSION))
+            for group in groups:
+                for piece in group:
+                    coordinates = np.asarray(Piece(piece))
+                    if len(coordinates) and (coordinates.min() < -2 ** 15 or coordinates.max() >= 2 ** 15):
+                        raise ValueError('The coordinates of a piece container must fit in 16 bits')
+                    f.write(coordinates.astype('<i2').tobytes())
+                    piece_offsets.append(piece_offsets[-1] + len(coordinates))
+                group_offsets.append(len(piece_offsets) - 1)
+            start = f.tell()
+            f.write(np.array(piece_offsets + group_offsets, dtype='<u4').tobytes())
+            f.write(struct.pack('<3Q', len(piece_offsets) - 1, len(group_offsets) - 1, start) + PieceContainer.MAGIC)
+        return len(group_offsets) - 1
+
+    def close(self) -> None:
+        """
+        Releases the memory map. The arrays that refer to it must be released first.
+        """
+        self.piece_offsets = self.group_offsets = self.coordinates = None
+        self.buffer.close()
+
+    def __enter__(self) -> 'PieceContainer':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.group_offsets) - 1
+
+    def __getitem__(self, i: int) -> List[Piece]:
+        if not -len(self) <= i < len(self):
+            raise IndexError('group index out of range')
+        i %= len(self)
+        offsets = self.piece_offsets[self.group_offsets[i]:self.group_offsets[i + 1] + 1].tolist()
+        return [Piece.from_array(self.coordinates[begin:end]) for begin, end in zip(offsets, offsets[1:])]
+
+    def __iter__(self) -> Iterator[List[Piece]]:
+        return (self[i] for i in range(len(self)))
+
+
 def load_pieces(filename: str) -> List[Piece]:
+    """
+    Reads pieces from a text file, or from the first group of a PieceContainer file.
+    The format is detected automatically.
+    """
+    if PieceContainer.is_container(filename):
+        with PieceContainer(filename) as container:
+            return container[0]
     text = Path(filename).read_text()
     return parse_pieces(text)
 
@@ -97,57 +350,65 @@ def make_cube(point: Position, color: RGB) -> str:
     return f'      KUBUS {{ translation {x} {y} {z} color {r} {g} {b} }}'
 
 
-def make_piece(name: str, piece: Piece, color: RGB, translation: Position) -> str:
+# For each side of a unit cube the direction of its normal, and its corners in doubled
+# coordinates, in counterclockwise order when viewed from the outside
+CUBE_FACES = [
+    ((1, 0, 0), [(1, -1, -1), (1, 1, -1), (1, 1, 1), (1, -1, 1)]),
+    ((-1, 0, 0), [(-1, -1, 1), (-1, 1, 1), (-1, 1, -1), (-1, -1, -1)]),
+    ((0, 1, 0), [(-1, 1, -1), (-1, 1, 1), (1, 1, 1), (1, 1, -1)]),
+    ((0, -1, 0), [(1, -1, -1), (1, -1, 1), (-1, -1, 1), (-1, -1, -1)]),
+    ((0, 0, 1), [(-1, -1, 1), (1, -1, 1), (1, 1, 1), (-1, 1, 1)]),
+    ((0, 0, -1), [(-1, 1, -1), (1, 1, -1), (1, -1, -1), (-1, -1, -1)]),
+]
+
+
+def make_face_set(piece: Piece, color: RGB) -> str:
+    """
+    Returns a piece in VRML format as a single IndexedFaceSet, that only contains the
+    sides of the cubes that are not shared with another cube of the piece.
+    """
+    positions = set(Piece(piece))
+    vertices: Dict[Position, int] = {}
+    faces = []
+    for (x, y, z) in sorted(positions):
+        for (dx, dy, dz), corners in CUBE_FACES:
+            if (x + dx, y + dy, z + dz) not in positions:
+                face = [vertices.setdefault((2 * x + cx, 2 * y + cy, 2 * z + cz), len(vertices)) for cx, cy, cz in corners]
+                faces.append(' '.join(map(str, face)) + ' -1')
+    points = ', '.join(f'{x / 2} {y / 2} {z / 2}' for x, y, z in vertices)
+    r, g, b = color
+    return (f'      Shape {{ appearance Appearance {{ material Material {{ diffuseColor {r} {g} {b} }} }}\n'
+            f'        geometry IndexedFaceSet {{ coord Coordinate {{ point [ {points} ] }}\n'
+            f'          coordIndex [ {", ".join(faces)} ] }} }}')
+
+
+def make_piece(name: str, piece: Piece, color: RGB, merge: bool = False) -> str:
     """
-    Returns a piece in VRML format
+    Returns the cubes of a piece in VRML format, as a node that can be reused with 'USE name'.
     """
-    text = '''DEF <NAME> Transform {
-       translation <TRANSLATION>
-       children [
-    <CUBES>
-       ]}
-        '''
-    x, y, z = translation
+    if merge:
+        return f'DEF {name} Group {{ children [\n{make_face_set(piece, color)}\n    ]}}'
     cubes = '\n'.join([make_cube(point, color) for point in piece])
-    text = text.replace('<NAME>', name)
-    text = text.replace('<TRANSLATION>', f'{x} {y} {z}')
-    text = text.replace('<CUBES>', cubes)
-    return text
+    return f'DEF {name} Group {{ children [\n{cubes}\n    ]}}'
 
 
 def bounding_box(pieces: List[Piece]) -> Tuple[Position, Position]:
-    min_x = 0
-    min_y = 0
-    min_z = 0
-    max_x = 0
-    max_y = 0
-    max_z = 0
+    bmin, bmax = (0, 0, 0), (0, 0, 0)
     for piece in pieces:
-        for (x, y, z) in piece:
-            min_x = min(x, min_x)
-            min_y = min(y, min_y)
-            min_z = min(z, min_z)
-            max_x = max(x, max_x)
-            max_y = max(y, max_y)
-            max_z = max(z, max_z)
-    return (min_x, min_y, min_z), (max_x, max_y, max_z)
+        piece_min, piece_max = Piece(piece).bbox
+        bmin = tuple(map(min, bmin, piece_min))
+        bmax = tuple(map(max, bmax, piece_max))
+    return bmin, bmax
 
 
 def center_of_gravity(pieces: List[Piece]) -> Tuple[float, float, float]:
-    sum_x = 0
-    sum_y = 0
-    sum_z = 0
     n = len(pieces)
-    for piece in pieces:
-        for (x, y, z) in piece:
-            sum_x += x
-            sum_y += y
-            sum_z += z
+    total = sum((np.asarray(Piece(piece), dtype=np.int64).sum(axis=0) for piece in pieces), np.zeros(3, dtype=np.int64))
+    sum_x, sum_y, sum_z = total.tolist()
     return sum_x / n, sum_y / n, sum_z / n
 
 
-def make_vrml(pieces: List[Piece], colors: List[RGB], grid: bool = True, scatter: float = 0) -> str:
-    text = '''#VRML V2.0 utf8
+VRML_HEADER = '''#VRML V2.0 utf8
 
 PROTO KUBUS [field SFVec3f translation 0 0 0 field SFColor color 1 0 0] {
 Transform {
@@ -160,8 +421,27 @@ Transform {
 
 '''
 
+
+def write_vrml(f: TextIO, pieces: List[Piece], colors: List[RGB], grid: bool = True, scatter: float = 0, merge: bool = False) -> None:
+    """
+    Writes pieces in VRML format to a file, one piece at a time. The cubes of each distinct
+    shape and color are defined once with DEF, at the origin, and the pieces refer to them
+    with USE and a translation. So the size of the output depends on the number of distinct
+    shapes, and not on the number of cubes.
+
+    Args:
+        f (TextIO): The output file.
+        pieces (List[Piece]): The pieces.
+        colors (List[RGB]): The colors, that are assigned to the pieces in turn.
+        grid (bool): If true, the pieces are placed in a 2-dimensional grid.
+        scatter (float): If non-zero, the pieces are moved away from the center of gravity.
+        merge (bool): If true, the cubes of a shape are merged into one IndexedFaceSet.
+    """
+    f.write(VRML_HEADER)
+    pieces = [Piece(piece) for piece in pieces]
     (min_x, min_y, min_z), (max_x, max_y, max_z) = bounding_box(pieces)
-    (cx, cy, cz) = center_of_gravity(pieces)
+    if scatter:
+        (cx, cy, cz) = center_of_gravity(pieces)
     size_x = max_x - min_x + 2
     size_y = max_y - min_y + 2
     N = round(math.sqrt(len(pieces)))
@@ -176,23 +456,37 @@ Transform {
         sz = scatter * (pz - cz) / factor
         return sx, sy, sz
 
-    def piece(i: int) -> str:
-        name = f'BLOCK{i}'
-        piece = pieces[i]
-        color = colors[i % len(colors)]
+    shapes: Dict[Tuple[bytes, int], str] = {}
+    for i, piece in enumerate(pieces):
+        color = i % len(colors)
         if grid:
             translation = (size_x * (i % N), size_y * (i // N), 0)
         elif scatter:
             translation = compute_scatter(piece)
         else:
             translation = (0, 0, 0)
-        return make_piece(name, piece, color, translation)
+        x, y, z = (t + m for t, m in zip(translation, piece.bbox[0]))
+        key = (piece.normalized.tobytes(), color)
+        if key in shapes:
+            shape = f'USE {shapes[key]}'
+        else:
+            shapes[key] = f'SHAPE{len(shapes)}'
+            shape = make_piece(shapes[key], Piece.from_array(piece.normalized), colors[color], merge)
+        separator = '\n' if i else ''
+        f.write(f'{separator}DEF BLOCK{i} Transform {{\n   translation {x} {y} {z}\n   children [\n    {shape}\n   ]}}\n')
+
 
-    return text + '\n\n'.join([piece(i) for i in range(len(pieces))])
+def make_vrml(pieces: List[Piece], colors: List[RGB], grid: bool = True, scatter: float = 0, merge: bool = False) -> str:
+    """
+    Returns pieces in VRML format, see write_vrml.
+    """
+    f = io.StringIO()
+    write_vrml(f, pieces, colors, grid, scatter, merge)
+    return f.getvalue()
 
 
-def cube_positions(X: int, Y: int, Z: int) -> List[Position]:
-    return [(x, y, z) for x in range(X) for y in range(Y) for z in range(Z)]
+def cube_positions(X: int, Y: int, Z: int) -> Piece:
+    return Piece(np.indices((X, Y, Z)).reshape(3, -1).T)
 
 
 def translate_object(obj: List[Position], translation: Position) -> List[Position]:
@@ -228,8 +522,7 @@ def is_inside_bbox(point: Position, bboxmin: Position, bboxmax: Position) -> boo
 
 
 def unique_orientations(pieces: List[Piece]) -> List[Piece]:
-    piece_tuples = set([tuple(sorted(piece)) for piece in pieces])
-    return [list(piece) for piece in piece_tuples]
+    return list(dict.fromkeys(Piece(piece) for piece in pieces))
 
 
 class Transformation(object):
@@ -417,26 +710,65 @@ def rotation_group() -> List[Transformation]:
             Rotation24()]
 
 
+def rotation_matrices() -> np.ndarray:
+    """
+    Returns the rotations of rotation_group as an array of 24 integer 3x3 matrices.
+    """
+    units = [(1, 0, 0), (0, 1, 0), (0, 0, 1)]
+    return np.array([[rotate(unit) for unit in units] for rotate in rotation_group()], dtype=np.int64).transpose(0, 2, 1)
+
+
+ROTATION_MATRICES = rotation_matrices()
+
+
 def move_to_origin(piece: Piece) -> Piece:
-    bmin, bmax = bounding_box([piece])
-    x, y, z = bmin
-    translate = Translation((-x, -y, -z))
-    return list(sorted([translate(pos) for pos in piece]))
+    piece = Piece(piece)
+    return Piece.from_array(piece.normalized)
 
 
-def rotated_pieces(piece: Piece) -> List[Piece]:
-    pieces = [[rotate(pos) for pos in piece] for rotate in rotation_group()]
-    pieces = [move_to_origin(piece) for piece in pieces]
-    piece_tuples = set(tuple(piece) for piece in pieces)
-    pieces = [list(piece) for piece in piece_tuples]
-    return pieces
+def normalized_rotations(piece: Piece, axis: Optional[int] = None) -> np.ndarray:
+    """
+    Applies all rotations to a piece in one batched operation, and moves the results
+    to the origin.
+
+    Args:
+        piece (Piece): A piece.
+        axis (Optional[int]): If given, only the rotations that map the piece into a plane
+            perpendicular to this axis are used. For a planar piece these are the 8
+            symmetries of the square, and a piece that is not planar has no such rotations.
+
+    Returns:
+        np.ndarray: An (m, n, 3) array with the m distinct rotations of the piece. The
+        positions of each rotation are sorted.
+    """
+    points = np.array(piece, dtype=np.int64).reshape(-1, 3)
+    matrices = ROTATION_MATRICES
+    if axis is not None:
+        # A rotation keeps the piece in the plane if it maps one of the flat axes of the piece onto the axis
+        flat = points.min(axis=0) == points.max(axis=0)
+        matrices = matrices[(np.abs(matrices[:, axis, :]) * flat).any(axis=1)]
+        if not len(matrices):
+            return np.zeros((0, len(points), 3), dtype=np.int64)
+    rotated = np.einsum('rij,nj->rni', matrices, points)
+    rotated -= rotated.min(axis=1, keepdims=True)
+
+    # Encode the positions as integers, such that sorting and removing duplicates is done on rows of integers
+    size = int(rotated.max()) + 1
+    keys = (rotated[:, :, 0] * size + rotated[:, :, 1]) * size + rotated[:, :, 2]
+    keys = np.unique(np.sort(keys, axis=1), axis=0)
+    return np.stack([keys // (size * size), keys // size % size, keys % size], axis=2)
+
+
+def rotated_pieces(piece: Piece, axis: Optional[int] = None) -> List[Piece]:
+    rotations = normalized_rotations(Piece(piece).normalized, axis).astype(np.int32)
+    return [Piece.from_array(rotation, normalized=True) for rotation in rotations]
 
 
 def is_sub_piece(piece: Piece, goal: Piece):
     """
     Returns true if piece is contained in goal
     """
-    return all(p in goal for p in piece)
+    return set(piece) <= set(goal)
 
 
 def find_translations(piece: Piece, goal: Piece) -> List[Translation]:
@@ -450,6 +782,743 @@ def find_translations(piece: Piece, goal: Piece) -> List[Translation]:
     return [Translation(pos) for pos in itertools.product(tx, ty, tz)]
 
 
+def mask_bits(mask: int) -> Iterator[int]:
+    """
+    Returns the indices of the bits that are set in a bitmask, in increasing order.
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def occupancy_grid(cells: Dict[Position, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Creates a dense grid of the bounding box of a target.
+
+    Args:
+        cells (Dict[Position, int]): Maps the positions of the target to bit indices.
+
+    Returns:
+        The minimum corner of the bounding box, and a 3D array that contains the bit
+        index of each position of the target, and -1 elsewhere.
+    """
+    points = np.array(list(cells), dtype=np.int64).reshape(-1, 3)
+    origin = points.min(axis=0)
+    points -= origin
+    grid = np.full(points.max(axis=0) + 1, -1, dtype=np.int64)
+    grid[points[:, 0], points[:, 1], points[:, 2]] = list(cells.values())
+    return origin, grid
+
+
+def find_placement_bits(piece: Piece, grid: np.ndarray, rotations: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Generates all possible placements of a piece inside a target, using rotations and translations.
+    For each rotation all translations are tested at once using the occupancy grid of the target.
+
+    Args:
+        piece (Piece): A piece.
+        grid (np.ndarray): The occupancy grid of the target, see occupancy_grid.
+        rotations (Optional[np.ndarray]): The normalized rotations of the piece. They are computed if they are not given.
+
+    Returns:
+        np.ndarray: A 2D array with in each row the sorted bit indices of the target positions
+        that are covered by a placement. The rows are sorted by the corresponding bitmasks.
+    """
+    points = Piece(piece).normalized
+    placements = [np.zeros((0, len(points)), dtype=np.int64)]
+    if rotations is None:
+        rotations = normalized_rotations(points)
+    for rotation in rotations:
+        extent = rotation.max(axis=0)
+        ranges = [np.arange(grid.shape[d] - extent[d]) for d in range(3)]
+        translations = np.stack(np.meshgrid(*ranges, indexing='ij'), axis=-1).reshape(-1, 1, 3)
+        positions = translations + rotation
+        bits = grid[positions[:, :, 0], positions[:, :, 1], positions[:, :, 2]]
+        placements.append(bits[(bits >= 0).all(axis=1)])
+    bits = np.sort(np.concatenate(placements), axis=1)
+
+    # Sort the rows by their highest bit index, then by the next highest one, etc.
+    return bits[np.lexsort(bits.T)]
+
+
+def bits_to_masks(bits: np.ndarray, size: int) -> List[int]:
+    """
+    Converts an array with in each row the bit indices of a placement to bitmasks.
+    """
+    masks = []
+    width = (size + 7) // 8
+    chunk_size = max(1, 2 ** 24 // max(width, 1))
+    for start in range(0, len(bits), chunk_size):
+        chunk = bits[start:start + chunk_size]
+        packed = np.zeros((len(chunk), width), dtype=np.uint8)
+        rows = np.arange(len(chunk))
+        # The bit indices within a row are distinct, so each column sets one bit of each row
+        for column in chunk.T:
+            packed[rows, column >> 3] |= (1 << (column & 7)).astype(np.uint8)
+        data = packed.tobytes()
+        masks.extend(int.from_bytes(data[i:i + width], 'little') for i in range(0, len(data), width))
+    return masks
+
+
+def compare_placements(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Compares placements given as rows of sorted bit indices, see find_placement_bits.
+
+    Returns:
+        np.ndarray: For each row -1, 0 or 1 if the bitmask of the row of a is smaller than,
+        equal to or larger than the one of b. Since all rows have the same number of bits,
+        this is decided by the highest bit index in which they differ.
+    """
+    difference = (a - b)[:, ::-1]
+    first = (difference != 0).argmax(axis=1)
+    return np.sign(difference[np.arange(len(a)), first])
+
+
+def canonical_piece(piece: Piece) -> Tuple[Position, ...]:
+    """
+    Returns a canonical form of a piece. Two pieces are congruent, i.e. one can be
+    rotated and translated onto the other, if and only if their canonical forms are equal.
+    """
+    return Piece(piece).canonical()
+
+
+def goal_symmetries(goal: Piece) -> List[List[int]]:
+    """
+    Computes the rotations of rotation_group that map the goal onto itself, after a translation.
+
+    Args:
+        goal (Piece): The goal of a puzzle.
+
+    Returns:
+        List[List[int]]: The symmetries, including the identity. Each symmetry is a
+        permutation of the indices of the goal positions.
+    """
+    goal = Piece(goal)
+    origin, grid = occupancy_grid({pos: i for i, pos in enumerate(goal)})
+    points = np.array(goal, dtype=np.int64)
+
+    # Rotate the goal, and translate it such that the minimum corner is the same as before
+    rotated = np.einsum('rij,nj->rni', ROTATION_MATRICES, points)
+    rotated -= rotated.min(axis=1, keepdims=True)
+    symmetries = []
+    for rotation in rotated:
+        if (rotation.max(axis=0) < grid.shape).all():
+            permutation = grid[rotation[:, 0], rotation[:, 1], rotation[:, 2]]
+            if (permutation >= 0).all():
+                symmetries.append(permutation.tolist())
+    return symmetries
+
+
+def apply_permutation(permutation: List[int], mask: int) -> int:
+    """
+    Applies a permutation of bit indices to a bitmask.
+    """
+    result = 0
+    for bit in mask_bits(mask):
+        result |= 1 << permutation[bit]
+    return result
+
+
+def planar_axis(goal: Piece) -> Optional[int]:
+    """
+    Returns the axis that is perpendicular to the plane that contains all positions of
+    the goal, or None if the goal is not planar. If there are several, the last one is used.
+    """
+    bmin, bmax = Piece(goal).bbox
+    return next((d for d in reversed(range(3)) if bmin[d] == bmax[d]), None)
+
+
+def is_planar(goal: Piece) -> bool:
+    """
+    Returns true if all positions of the goal lie in one plane parallel to the axes.
+    """
+    return planar_axis(goal) is not None
+
+
+def goal_neighbors(cells: Dict[Position, int]) -> List[int]:
+    """
+    Returns for each position of a goal the bitmask of its neighbors in the goal.
+    """
+    neighbors = [0] * len(cells)
+    for (x, y, z), bit in cells.items():
+        for pos in [(x - 1, y, z), (x + 1, y, z), (x, y - 1, z), (x, y + 1, z), (x, y, z - 1), (x, y, z + 1)]:
+            if pos in cells:
+                neighbors[bit] |= 1 << cells[pos]
+    return neighbors
+
+
+def subset_sums(sizes: List[int]) -> int:
+    """
+    Returns a bitmask that contains bit n if n is the sum of a subset of the given sizes.
+    """
+    reachable = 1
+    for size in sizes:
+        reachable |= reachable << size
+    return reachable
+
+
+def find_unfillable_region(empty: int, neighbors: List[int], reachable: int) -> Optional[Tuple[int, int]]:
+    """
+    Splits a set of empty goal positions into connected regions, and searches for a region
+    that cannot be filled, because its size is not one of the reachable sizes.
+
+    Args:
+        empty (int): The bitmask of the empty goal positions.
+        neighbors (List[int]): For each goal position the bitmask of its neighbors, see goal_neighbors.
+        reachable (int): The bitmask of the sizes that can be filled, see subset_sums.
+
+    Returns:
+        Optional[Tuple[int, int]]: The bitmask of an unfillable region and of the non-empty
+        positions along its border, or None if all regions can be filled.
+    """
+    remaining = empty
+    while remaining:
+        region = frontier = remaining & -remaining
+        border = 0
+        while frontier:
+            grown = 0
+            for bit in mask_bits(frontier):
+                grown |= neighbors[bit]
+            border |= grown & ~empty
+            frontier = grown & empty & ~region
+            region |= frontier
+        remaining &= ~region
+        if not (reachable >> bin(region).count('1')) & 1:
+            return region, border
+    return None
+
+
+class PlacementCache(object):
+    """
+    A persistent cache of piece placements on disk. The key of an entry consists of the
+    canonical form of a piece, a hash of the goal and a hash of the rotations that are
+    used, so congruent pieces share their entries. An entry is stored in a compact binary
+    format: a header with the number of goal positions, the number of placements and the
+    size of the piece, followed by the bit indices of the placements as 32-bit little
+    endian integers. It is loaded into an array without parsing. If the total size of the
+    entries exceeds the limit, the least recently used entries are removed. An entry that
+    cannot be read or is damaged, for example because it was truncated, counts as a miss
+    and is overwritten.
+
+    Attributes:
+        folder (Path): The folder containing the entries.
+        max_bytes (int): The maximum total size of the entries.
+        hits (int): The number of placement lists that were found in the cache.
+        misses (int): The number of placement lists that had to be computed.
+    """
+    MAGIC = b'BLKP'
+
+    def __init__(self, folder: Path, max_bytes: int = 100_000_000):
+        self.folder = Path(folder)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+    def path(self, piece: Piece, goal: Piece, rotations: np.ndarray) -> Path:
+        goal_hash = hashlib.sha256(repr(list(goal)).encode()).hexdigest()
+        rotations_hash = hashlib.sha256(repr(np.shape(rotations)).encode() + np.ascontiguousarray(rotations, dtype='<i8').tobytes()).hexdigest()
+        key = hashlib.sha256(f'{canonical_piece(piece)} {goal_hash} {rotations_hash}'.encode()).hexdigest()
+        return self.folder / f'{key}.bin'
+
+    def placement_bits(self, piece: Piece, goal: Piece, grid: np.ndarray, rotations: np.ndarray) -> np.ndarray:
+        """
+        Returns the placements of a piece inside the goal in the format of find_placement_bits,
+        using the given normalized rotations of the piece. They are read from the cache if
+        possible, and computed and stored otherwise.
+        """
+        path = self.path(piece, goal, rotations)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            data = b''
+        if len(data) >= 16 and data[:4] == PlacementCache.MAGIC:
+            header = np.frombuffer(data, dtype='<u4', count=4)
+            count, size = int(header[2]), int(header[3])
+            if header[1] == len(goal) and size == len(Piece(piece).normalized) and len(data) == 16 + 4 * count * size:
+                bits = np.frombuffer(data, dtype='<u4', count=count * size, offset=16).reshape(count, size)
+                if bits.max(initial=0) < len(goal):
+                    os.utime(path)
+                    self.hits += 1
+                    return bits.astype(np.int64)
+
+        self.misses += 1
+        bits = find_placement_bits(piece, grid, rotations)
+        header = np.array([0, len(goal), bits.shape[0], bits.shape[1]], dtype='<u4').tobytes()
+        data = PlacementCache.MAGIC + header[4:] + bits.astype('<u4').tobytes()
+        temporary_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        temporary_path.write_bytes(data)
+        os.replace(temporary_path, path)
+        self.evict()
+        return bits
+
+    def evict(self) -> None:
+        """
+        Removes the least recently used entries until the total size is within the limit.
+        """
+        entries = [(entry.stat(), entry) for entry in self.folder.glob('*.bin')]
+        size = sum(stat.st_size for stat, entry in entries)
+        for stat, entry in sorted(entries, key=lambda item: item[0].st_mtime):
+            if size <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            size -= stat.st_size
+
+    def __str__(self):
+        return f'Placement cache: {self.hits} hits, {self.misses} misses'
+
+
+# The placement cache that is used by PlacementIndex, or None if caching is disabled
+placement_cache: Optional[PlacementCache] = None
+
+
+class PlacementIndex(object):
+    """
+    Contains all placements of the pieces of a puzzle inside the goal. The positions
+    of the goal are mapped to bit positions, and each placement is stored as a bitmask.
+
+    If symmetry breaking is enabled, the placements of one anchor piece are restricted
+    to one representative of each orbit under the symmetries of the goal. Moreover, for
+    congruent pieces the attribute congruent refers to the first piece of its kind, and
+    the solvers only generate one of the permutations of congruent pieces. If all pieces
+    have a congruent copy, there is no anchor piece, and symmetric solutions are only
+    removed afterward by is_canonical.
+
+    If pruning is enabled, placements that split off a region of the goal that cannot be
+    filled by the other pieces are removed. For example, a pentomino in the corner of a
+    rectangle that leaves an isolated hole of 3 positions is never used.
+
+    If the global variable placement_cache is set, the placements are taken from that cache.
+    The normalized rotations of the pieces can be passed, to reuse them for several goals.
+    For a planar goal only the rotations that lie in its plane are used.
+
+    Attributes:
+        goal (Piece): The goal of the puzzle.
+        cells (Dict[Position, int]): Maps the positions of the goal to bit indices.
+        sizes (List[int]): The sizes of the pieces.
+        placements (List[Tuple[int, int]]): A list of (piece index, bitmask) pairs.
+        piece_placements (List[List[int]]): For each piece the indices of its placements.
+        cell_placements (List[List[int]]): For each goal position the indices of the placements covering it.
+        congruent (List[int]): For each piece the index of the first piece that is congruent to it.
+        symmetries (List[List[int]]): The symmetries of the goal, if symmetry breaking is enabled.
+        anchor (Optional[int]): The index of the anchor piece.
+        stabilizers (Dict[int, List[List[int]]]): For placements of the anchor piece that are
+            mapped onto themselves by a non-trivial goal symmetry, the list of those symmetries.
+    """
+    def __init__(self, pieces: List[Piece], goal: Piece, symmetry_breaking: bool = False, pruning: Optional[bool] = False, rotations: Optional[List[np.ndarray]] = None):
+        pieces = [Piece(piece) for piece in pieces]
+        self.goal = goal = Piece(goal)
+        self.cells = {pos: i for i, pos in enumerate(goal)}
+        self.sizes = [len(piece.normalized) for piece in pieces]
+        self.placements: List[Tuple[int, int]] = []
+        self.piece_placements: List[List[int]] = []
+        self.cell_placements: List[List[int]] = [[] for _ in goal]
+        self.congruent = list(range(len(pieces)))
+        self.symmetries: List[List[int]] = []
+        self.anchor: Optional[int] = None
+        self.stabilizers: Dict[int, List[List[int]]] = {}
+
+        origin, grid = occupancy_grid(self.cells)
+        axis = planar_axis(goal)
+        if not rotations:
+            rotations = [normalized_rotations(piece.normalized, axis) for piece in pieces]
+        elif axis is not None:
+            rotations = [rotation[rotation[:, :, axis].max(axis=1) == 0] for rotation in rotations]
+        if placement_cache is not None:
+            piece_bits = [placement_cache.placement_bits(piece, goal, grid, rotations[i]) for i, piece in enumerate(pieces)]
+        else:
+            piece_bits = [find_placement_bits(piece, grid, rotations[i]) for i, piece in enumerate(pieces)]
+        piece_masks = [bits_to_masks(bits, len(goal)) for bits in piece_bits]
+        if pruning is None:
+            pruning = is_planar(goal)
+        if pruning:
+            self._prune_regions(piece_masks, piece_bits)
+        if symmetry_breaking:
+            self._break_symmetries(pieces, piece_masks, piece_bits)
+
+        # Compute the inverted index from goal positions to placements using a stable sort
+        cell_bits = [np.zeros(0, dtype=np.int64)]
+        cell_ids = [np.zeros(0, dtype=np.int64)]
+        for i, (masks, bits) in enumerate(zip(piece_masks, piece_bits)):
+            assert len(set(masks)) == len(masks)
+            ids = np.arange(len(self.placements), len(self.placements) + len(masks))
+            self.piece_placements.append(ids.tolist())
+            self.placements.extend((i, mask) for mask in masks)
+            cell_bits.append(bits.ravel())
+            cell_ids.append(np.repeat(ids, bits.shape[1]))
+        cell_bits = np.concatenate(cell_bits)
+        cell_ids = np.concatenate(cell_ids)[np.argsort(cell_bits, kind='stable')]
+        counts = np.bincount(cell_bits, minlength=len(goal))
+        self.cell_placements = [ids.tolist() for ids in np.split(cell_ids, np.cumsum(counts)[:-1])]
+
+    def _prune_regions(self, piece_masks: List[List[int]], piece_bits: List[np.ndarray]) -> None:
+        neighbors = goal_neighbors(self.cells)
+        everything = (1 << len(self.goal)) - 1
+        for i, masks in enumerate(piece_masks):
+            reachable = subset_sums(self.sizes[:i] + self.sizes[i + 1:])
+            keep = [find_unfillable_region(everything & ~mask, neighbors, reachable) is None for mask in masks]
+            piece_masks[i] = [mask for mask, kept in zip(masks, keep) if kept]
+            piece_bits[i] = piece_bits[i][keep]
+
+    def _break_symmetries(self, pieces: List[Piece], piece_masks: List[List[int]], piece_bits: List[np.ndarray]) -> None:
+        forms = {}
+        for i, piece in enumerate(pieces):
+            self.congruent[i] = forms.setdefault(canonical_piece(piece), i)
+
+        symmetries = goal_symmetries(self.goal)
+        if len(symmetries) == 1:
+            return
+        self.symmetries = symmetries
+
+        # Find the piece that is not congruent to another one, for which the least
+        # placements are fixed by a symmetry, and the least placements remain.
+        # The images of all placements of a piece are computed at once from their bit indices.
+        permutations = np.array(symmetries, dtype=np.int64)
+        best = None
+        for i, (masks, bits) in enumerate(zip(piece_masks, piece_bits)):
+            if self.congruent.count(self.congruent[i]) > 1:
+                continue
+            order = np.array([compare_placements(bits, np.sort(permutation[bits], axis=1)) for permutation in permutations]).reshape(len(symmetries), len(bits))
+            is_representative = (order <= 0).all(axis=0)
+            fixing = order == 0
+            representatives = np.flatnonzero(is_representative)
+            stabilizers = {masks[k]: [symmetries[j] for j in np.flatnonzero(fixing[:, k])] for k in representatives if fixing[:, k].sum() > 1}
+            key = (len(stabilizers), len(representatives))
+            if best is None or key < best[0]:
+                best = (key, i, is_representative, stabilizers)
+
+        if best is not None:
+            _, self.anchor, is_representative, self.stabilizers = best
+            piece_masks[self.anchor] = [mask for mask, kept in zip(piece_masks[self.anchor], is_representative) if kept]
+            piece_bits[self.anchor] = piece_bits[self.anchor][is_representative]
+
+    def positions(self, mask: int) -> Piece:
+        """
+        Returns the goal positions corresponding to a bitmask.
+        """
+        return Piece.from_array(self.goal.coordinates[list(mask_bits(mask))])
+
+    def mask(self, piece: Piece) -> int:
+        """
+        Returns the bitmask corresponding to a placement of a piece inside the goal.
+        """
+        return sum(1 << self.cells[pos] for pos in set(piece))
+
+    def orientations(self, i: int) -> List[Piece]:
+        """
+        Returns all placements of the piece with index i as lists of positions.
+        """
+        bits = np.array([list(mask_bits(self.placements[k][1])) for k in self.piece_placements[i]], dtype=np.int64)
+        return [Piece.from_array(positions) for positions in self.goal.coordinates[bits.reshape(len(bits), -1)]]
+
+    def congruent_pairs(self) -> List[Tuple[int, int]]:
+        """
+        Returns the pairs (i, j) of congruent pieces with i < j, such that there is no
+        congruent piece in between. The solvers require that piece i is placed before
+        piece j, which removes the permutations of congruent pieces.
+        """
+        last = {}
+        pairs = []
+        for j, i in enumerate(self.congruent):
+            if i in last:
+                pairs.append((last[i], j))
+            last[i] = j
+        return pairs
+
+    def is_canonical(self, solution: List[Piece]) -> bool:
+        """
+        Returns true if the solution is the smallest one among its images under the
+        goal symmetries that fix the placement of the anchor piece, or under all goal
+        symmetries if there is no anchor piece. It is used to report every distinct
+        solution exactly once.
+        """
+        if self.anchor is None:
+            symmetries = self.symmetries
+        else:
+            symmetries = self.stabilizers.get(self.mask(solution[self.anchor]))
+        if not symmetries:
+            return True
+        masks = [(self.congruent[i], self.mask(piece)) for i, piece in enumerate(solution)]
+        key = sorted(masks)
+        return all(key <= sorted((i, apply_permutation(permutation, mask)) for i, mask in masks) for permutation in symmetries)
+
+    def decode(self, selected: List[int]) -> List[Piece]:
+        """
+        Returns the solution that consists of the selected placements, which are placements
+        of the first piece of each congruence class, like the rows of make_exact_cover.
+        The placements are distributed over the congruent pieces.
+        """
+        members = {}
+        for i, j in enumerate(self.congruent):
+            members.setdefault(j, []).append(i)
+        solution = [list() for _ in self.sizes]
+        for k in selected:
+            i, mask = self.placements[k]
+            solution[members[i].pop()] = self.positions(mask)
+        return solution
+
+    def restrict(self, pieces: List[int], placements: List[int], occupied: int) -> 'PlacementIndex':
+        """
+        Returns the index of a subproblem, that consists of the given pieces, the given
+        placements, and the goal positions that are not in the bitmask occupied. The pieces
+        and goal positions are renumbered in increasing order. The subproblem has no goal
+        symmetries; solutions must be checked using is_canonical of the original index.
+        """
+        bits = [bit for bit in range(len(self.goal)) if not (occupied >> bit) & 1]
+        renumbered = {bit: j for j, bit in enumerate(bits)}
+        piece_ids = {i: j for j, i in enumerate(pieces)}
+        index = PlacementIndex.__new__(PlacementIndex)
+        index.goal = Piece.from_array(self.goal.coordinates[bits].reshape(-1, 3))
+        index.cells = {pos: j for j, pos in enumerate(index.goal)}
+        index.sizes = [self.sizes[i] for i in pieces]
+        index.placements = []
+        index.piece_placements = [[] for _ in pieces]
+        index.cell_placements = [[] for _ in bits]
+        first = {}
+        index.congruent = [first.setdefault(self.congruent[i], j) for j, i in enumerate(pieces)]
+        index.symmetries = []
+        index.anchor = None
+        index.stabilizers = {}
+        for k in sorted(placements):
+            i, mask = self.placements[k]
+            bits = [renumbered[bit] for bit in mask_bits(mask)]
+            index.piece_placements[piece_ids[i]].append(len(index.placements))
+            for bit in bits:
+                index.cell_placements[bit].append(len(index.placements))
+            index.placements.append((piece_ids[i], sum(1 << bit for bit in bits)))
+        return index
+
+
+def parity_colorings() -> List[Tuple[str, List[int]]]:
+    """
+    Returns colorings of the positions that only depend on the parities of the coordinates.
+    A coloring is given as a name and, for each of the 8 parity classes 4 * (x % 2) +
+    2 * (y % 2) + z % 2, whether its positions are colored.
+    """
+    parities = [(x, y, z) for x in range(2) for y in range(2) for z in range(2)]
+    colorings = [('a checkerboard coloring', [(x + y + z) % 2 for x, y, z in parities])]
+    colorings += [(f'a coloring of the layers with odd {axis}', [pos[d] for pos in parities]) for d, axis in enumerate('xyz')]
+    colorings += [(f'a coloring of the columns with odd {axis1} + {axis2}', [(pos[d1] + pos[d2]) % 2 for pos in parities]) for d1, d2, axis1, axis2 in [(0, 1, 'x', 'y'), (0, 2, 'x', 'z'), (1, 2, 'y', 'z')]]
+    colorings += [(f'a coloring of the positions with coordinates {x} {y} {z} modulo 2', [int(pos == (x, y, z)) for pos in parities]) for x, y, z in parities]
+    return colorings
+
+
+PARITY_COLORINGS = parity_colorings()
+
+
+def find_infeasibility(pieces: List[Piece], goal: Piece, index: Optional[PlacementIndex] = None) -> Optional[str]:
+    """
+    Checks a number of necessary conditions for the existence of a solution, that are much
+    cheaper than solving the puzzle:
+
+    - the pieces have the same volume as the goal;
+    - every connected part of the goal can be filled by a subset of the pieces;
+    - for each coloring in PARITY_COLORINGS, the number of colored goal positions can be
+      covered: in every orientation and translation a piece covers one of a few numbers of
+      colored positions, and some combination of those numbers must add up to it;
+    - if an index is given, every piece has a placement, and every goal position is
+      covered by a placement.
+
+    Args:
+        pieces (List[Piece]): The pieces of the puzzle.
+        goal (Piece): The goal of the puzzle.
+        index (Optional[PlacementIndex]): The placements of the pieces.
+
+    Returns:
+        Optional[str]: The reason why the puzzle has no solution, or None if no reason was found.
+    """
+    pieces = [Piece(piece) for piece in pieces]
+    goal = Piece(goal)
+    sizes = [len(piece.normalized) for piece in pieces]
+    if sum(sizes) != len(goal.normalized):
+        return f'The pieces have {sum(sizes)} positions, but the goal has {len(goal.normalized)}'
+
+    cells = {pos: i for i, pos in enumerate(goal)}
+    neighbors = goal_neighbors(cells)
+    unfillable = find_unfillable_region((1 << len(goal)) - 1, neighbors, subset_sums(sizes))
+    if unfillable is not None:
+        return f'The goal has a connected part of {bin(unfillable[0]).count("1")} positions, that cannot be filled by a subset of the pieces'
+
+    # Count the positions of each parity class covered by the rotations of the pieces, for each parity of the translation
+    offsets = np.array([(x, y, z) for x in range(2) for y in range(2) for z in range(2)])
+    weights = np.array([4, 2, 1])
+    piece_counts = []
+    for piece in pieces:
+        rotations = normalized_rotations(piece.normalized)
+        classes = (rotations[None, :, :, :] + offsets[:, None, None, :]) % 2 @ weights
+        piece_counts.append(np.eye(8, dtype=np.int64)[classes.reshape(-1, len(piece.normalized))].sum(axis=1))
+    goal_counts = np.bincount(np.asarray(goal.normalized + goal.bbox[0], dtype=np.int64) % 2 @ weights, minlength=8)
+
+    for name, coloring in PARITY_COLORINGS:
+        target = int(goal_counts @ coloring)
+        reachable = 1
+        for counts in piece_counts:
+            reachable = functools.reduce(operator.or_, (reachable << value for value in set((counts @ coloring).tolist())))
+        if not (reachable >> target) & 1:
+            return f'With {name}, the goal has {target} colored positions, which cannot be covered by the pieces'
+
+    if index is not None:
+        return find_missing_placements(index)
+    return None
+
+
+def find_missing_placements(index: PlacementIndex) -> Optional[str]:
+    """
+    Returns the reason why a puzzle has no solution if a piece has no placement, or a goal
+    position is not covered by any placement, and None otherwise. These are the conditions
+    of find_infeasibility that depend on the index.
+    """
+    for i, placements in enumerate(index.piece_placements):
+        if not placements:
+            return f'Piece {i} does not fit in the goal'
+    for pos, placements in zip(index.goal, index.cell_placements):
+        if not placements:
+            return f'Goal position {pos} cannot be covered by any piece'
+    return None
+
+
+# The maximum number of placements for which ForcedPlacements probes all placements by default
+PROBING_LIMIT = 50_000
+
+
+class ForcedPlacements(object):
+    """
+    Simplifies a puzzle before it is solved, by committing the placements that are used
+    in every solution, and removing placements that cannot be part of a solution.
+    The following steps are repeated until nothing changes:
+
+    - if a goal position can be covered by only one placement, it is committed;
+    - if a piece has only one placement left, it is committed. For n congruent pieces
+      this is done if n placements are left;
+    - the placements that overlap with a committed placement are removed;
+    - if probing is enabled, a placement is removed if after using it, another piece or
+      a goal position next to it can no longer be covered. By default this is done if
+      there are at most PROBING_LIMIT placements, since the cost grows faster than linear.
+
+    The remaining pieces, placements and goal positions form a smaller subproblem, which
+    is passed to the solvers. The solutions of the puzzle are exactly the solutions of the
+    subproblem extended by the committed placements.
+
+    Attributes:
+        index (PlacementIndex): The placements of the original puzzle.
+        committed (Dict[int, int]): Maps pieces to the bitmasks of their committed placements.
+        pieces (List[int]): The pieces of the subproblem.
+        residual (PlacementIndex): The placements of the subproblem.
+        reason (Optional[str]): If it is found that there is no solution, the reason why.
+    """
+    def __init__(self, index: PlacementIndex, probing: Optional[bool] = None):
+        if probing is None:
+            probing = len(index.placements) <= PROBING_LIMIT
+        self.index = index
+        self.committed: Dict[int, int] = {}
+        self.reason: Optional[str] = None
+        placements = index.placements
+        members: Dict[int, List[int]] = {}
+        for i, j in enumerate(index.congruent):
+            members.setdefault(j, []).append(i)
+        neighbors = goal_neighbors(index.cells)
+        alive = [True] * len(placements)
+        cell_counts = [len(candidates) for candidates in index.cell_placements]
+        piece_counts = [len(candidates) for candidates in index.piece_placements]
+        occupied = 0
+
+        def remove(k: int) -> None:
+            alive[k] = False
+            i, mask = placements[k]
+            piece_counts[i] -= 1
+            for bit in mask_bits(mask):
+                cell_counts[bit] -= 1
+
+        def commit(j: int, mask: int) -> None:
+            nonlocal occupied
+            if mask & occupied:
+                self.reason = f'Piece {j} is forced onto positions that are already occupied'
+                return
+            i = members[j].pop()
+            self.committed[i] = mask
+            occupied |= mask
+            for k in index.piece_placements[i]:
+                if alive[k]:
+                    remove(k)
+            for bit in mask_bits(mask):
+                for k in index.cell_placements[bit]:
+                    if alive[k]:
+                        remove(k)
+
+        def compatible(candidates: List[int], i: int, mask: int) -> bool:
+            # Returns true if one of the candidates can be used together with placement (i, mask)
+            for k in candidates:
+                if alive[k] and placements[k][0] != i and not placements[k][1] & mask:
+                    return True
+            return False
+
+        probe = range(len(placements))
+        changed = True
+        while changed and self.reason is None:
+            changed = False
+            for j, pieces in members.items():
+                if not pieces or piece_counts[pieces[0]] > len(pieces):
+                    continue
+                masks = list(dict.fromkeys(placements[k][1] for k in index.piece_placements[pieces[0]] if alive[k]))
+                if len(masks) < len(pieces):
+                    self.reason = f'Piece {pieces[0]} does not fit in the goal, after placing the forced pieces'
+                    break
+                for mask in masks:
+                    commit(j, mask)
+                changed = True
+            for bit, candidates in enumerate(index.cell_placements):
+                if self.reason is not None or (occupied >> bit) & 1:
+                    continue
+                if cell_counts[bit] == 0:
+                    self.reason = f'Goal position {index.goal[bit]} cannot be covered, after placing the forced pieces'
+                elif cell_counts[bit] <= len(index.sizes):
+                    forced = {(index.congruent[placements[k][0]], placements[k][1]) for k in candidates if alive[k]}
+                    if len(forced) == 1:
+                        commit(*forced.pop())
+                        changed = True
+            if changed:
+                probe = range(len(placements))
+                continue
+            if not probing or self.reason is not None:
+                break
+
+            # At most 24 * size placements of a piece cover a given position, so a piece with more
+            # placements than that times the size of a placement always has a compatible one.
+            remaining = [j for pieces in members.values() for j in pieces]
+            removed = 0
+            for k in probe:
+                if not alive[k]:
+                    continue
+                i, mask = placements[k]
+                bits = list(mask_bits(mask))
+                border = functools.reduce(operator.or_, (neighbors[bit] for bit in bits)) & ~mask & ~occupied
+                if all(compatible(index.cell_placements[bit], i, mask) for bit in mask_bits(border)) and all(compatible(index.piece_placements[j], i, mask) for j in remaining if j != i and piece_counts[j] <= 24 * index.sizes[j] * len(bits)):
+                    continue
+                remove(k)
+                removed |= mask
+                changed = True
+
+            # Only the placements that cover or touch the removed placements need to be probed again
+            nearby = functools.reduce(operator.or_, (neighbors[bit] for bit in mask_bits(removed)), removed)
+            probe = sorted(set(itertools.chain.from_iterable(index.cell_placements[bit] for bit in mask_bits(nearby))))
+
+        self.pieces = sorted(i for pieces in members.values() for i in pieces)
+        if len(self.committed) or not all(alive):
+            self.residual = index.restrict(self.pieces, [k for k, kept in enumerate(alive) if kept], occupied)
+        else:
+            self.residual = index
+
+    def merge(self, solution: List[Piece]) -> List[Piece]:
+        """
+        Returns the solution of the puzzle corresponding to a solution of the subproblem.
+        """
+        result = [self.index.positions(self.committed[i]) if i in self.committed else None for i in range(len(self.index.sizes))]
+        for i, piece in zip(self.pieces, solution):
+            result[i] = piece
+        return result
+
+
 def find_orientations(piece: Piece, target: Piece) -> List[Piece]:
     """
     Generates all possible orientations of a piece such that it is contained in a given target.
@@ -461,146 +1530,2524 @@ def find_orientations(piece: Piece, target: Piece) -> List[Piece]:
     Returns:
         List[Piece]: A list of all possible orientations of the piece inside the target piece.
     """
+    return PlacementIndex([piece], target).orientations(0)
+
+
+def z3_apply(function, terms: List[z3.ExprRef], *args) -> z3.BoolRef:
+    """
+    Applies an n-ary function of the Z3 C API, like z3.Z3_mk_and, to a list of terms.
+    Unlike z3.And and z3.Or, the arguments are not converted and their sorts are not
+    checked, which is a lot faster for large puzzles. Since Z3 shares equal terms, the
+    result is the same term. The remaining arguments are passed after the terms.
+    """
+    ctx = terms[0].ctx if terms else z3.main_ctx()
+    array = (z3.Ast * len(terms))(*[term.as_ast() for term in terms])
+    return z3.BoolRef(function(ctx.ref(), len(terms), array, *args), ctx)
+
+
+def z3_binary(function, a: z3.ExprRef, b: z3.ExprRef) -> z3.BoolRef:
+    """
+    Applies a binary function of the Z3 C API, like z3.Z3_mk_implies, see z3_apply.
+    """
+    return z3.BoolRef(function(a.ctx.ref(), a.as_ast(), b.as_ast()), a.ctx)
 
-    # Apply all possible combinations of translations and rotations to the object
-    orientations = []
-    for rotated_piece in rotated_pieces(piece):
-        for translate in find_translations(rotated_piece, target):
-            translated_piece = [translate(pos) for pos in rotated_piece]
-            if is_sub_piece(translated_piece, target):
-                orientations.append(translated_piece)
 
-    assert len(unique_orientations(orientations)) == len(orientations)
-    return orientations
+def z3_constant(name: str, sort: z3.SortRef) -> z3.ExprRef:
+    """
+    Returns a constant like z3.Bool and z3.Int do, without creating the sort again.
+    """
+    ast = z3.Z3_mk_const(sort.ctx.ref(), z3.Z3_mk_string_symbol(sort.ctx.ref(), name), sort.ast)
+    return z3.BoolRef(ast, sort.ctx) if sort.kind() == z3.Z3_BOOL_SORT else z3.ArithRef(ast, sort.ctx)
+
+
+def z3_exactly_one(terms: List[z3.BoolRef]) -> z3.BoolRef:
+    """
+    Returns the pseudo-boolean constraint z3.PbEq([(term, 1) for term in terms], 1).
+    """
+    if not terms:
+        return z3.BoolVal(False)
+    return z3_apply(z3.Z3_mk_pbeq, terms, (ctypes.c_int * len(terms))(*[1] * len(terms)), 1)
+
+
+def puzzle_variables(index: PlacementIndex, encoding: str = 'int') -> List[z3.ExprRef]:
+    """
+    Returns the variables of the model created by make_puzzle: with encoding 'int' an integer
+    variable for each goal position, and with encoding 'bool' a boolean variable for each placement.
+    """
+    if encoding == 'bool':
+        sort = z3.BoolSort()
+        return [z3_constant(f'p_{i}_{k}', sort) for k, (i, mask) in enumerate(index.placements)]
+    sort = z3.IntSort()
+    return [z3_constant(f'x_{x}_{y}_{z}', sort) for (x, y, z) in index.goal]
+
+
+def piece_equalities(variables: List[z3.ExprRef], pieces: int) -> List[List[z3.BoolRef]]:
+    """
+    Returns for each goal position and piece i the term x == i, where x is the integer
+    variable of the position. Each term is created once, and shared by all placements.
+    """
+    values = [z3.IntVal(i, variables[0].ctx) for i in range(pieces)] if variables else []
+    return [[z3_binary(z3.Z3_mk_eq, x, value) for value in values] for x in variables]
+
+
+def puzzle_constraints(index: PlacementIndex, variables: List[z3.ExprRef], encoding: str = 'int') -> Iterator[z3.BoolRef]:
+    """
+    Generates the constraints of make_puzzle one at a time. Large terms are only created
+    when they are needed, and can be released as soon as they have been added to a solver.
+    """
+    sort = z3.BoolSort()
+    if encoding == 'bool':
+        # A piece or a goal position without placements makes the puzzle unsolvable.
+        for placements in index.piece_placements:
+            yield z3_exactly_one([variables[k] for k in placements])
+        for placements in index.cell_placements:
+            yield z3_exactly_one([variables[k] for k in placements])
+
+        # Congruent pieces have the same placements. Piece j may only use a placement after the one of piece i.
+        for i, j in index.congruent_pairs():
+            before = z3.BoolVal(False)
+            for t, (ki, kj) in enumerate(zip(index.piece_placements[i], index.piece_placements[j])):
+                yield z3_binary(z3.Z3_mk_implies, variables[kj], before)
+                placed = z3_constant(f'b_{i}_{t}', sort)
+                yield z3_binary(z3.Z3_mk_eq, placed, z3_apply(z3.Z3_mk_or, [before, variables[ki]]))
+                before = placed
+        return
+
+    pieces = len(index.piece_placements)
+    equal = piece_equalities(variables, pieces)
+    for x in variables:
+        yield z3.And(0 <= x, x < pieces)
+    for i, placements in enumerate(index.piece_placements):
+        yield z3_apply(z3.Z3_mk_or, [z3_apply(z3.Z3_mk_and, [equal[bit][i] for bit in mask_bits(index.placements[k][1])]) for k in placements])
+
+    # For congruent pieces i < j, the first goal position of piece i must come before the first one of piece j
+    for i, j in index.congruent_pairs():
+        before = z3.BoolVal(False)
+        for bit in range(len(variables)):
+            yield z3_binary(z3.Z3_mk_implies, equal[bit][j], before)
+            placed = z3_constant(f'b_{i}_{bit}', sort)
+            yield z3_binary(z3.Z3_mk_eq, placed, z3_apply(z3.Z3_mk_or, [before, equal[bit][i]]))
+            before = placed
+
+
+def make_puzzle(pieces: List[Piece], goal: Piece, index: Optional[PlacementIndex] = None, encoding: str = 'int'):
+    """
+    Creates the Z3 variables and constraints of a puzzle. Use add_puzzle to add them to a
+    solver without keeping all constraints in memory.
 
+    Args:
+        pieces (List[Piece]): The pieces of the puzzle.
+        goal (Piece): The goal of the puzzle.
+        index (Optional[PlacementIndex]): The placements of the pieces. It is computed if it is not given.
+        encoding (str): With encoding 'int' there is an integer variable for each goal position,
+            that contains the index of the piece covering it. With encoding 'bool' there is a
+            boolean variable for each placement, and pseudo-boolean constraints state that
+            each piece and each goal position is covered by exactly one placement.
 
-def make_puzzle(pieces: List[Piece], goal: Piece):
+    Returns:
+        The variables and the constraints, or None if the sizes of the pieces and the goal don't match.
+    """
     pieces_size = sum(len(piece) for piece in pieces)
     goal_size = len(goal)
     if pieces_size != goal_size:
         print('The size of the goal does not match with the pieces')
         return None
 
-    def var(pos: Position):
-        x, y, z = pos
-        return z3.Int(f'x_{x}_{y}_{z}')
+    if index is None:
+        index = PlacementIndex(pieces, goal)
+    variables = puzzle_variables(index, encoding)
+    return variables, list(puzzle_constraints(index, variables, encoding))
 
-    variables = [var(pos) for pos in goal]
 
-    constraints = [z3.And(0 <= x, x < len(pieces)) for x in variables]
-    for i, piece in enumerate(pieces):
-        orientations = find_orientations(piece, goal)
-        constraints.append(z3.Or([z3.And([var(pos) == i for pos in orientation]) for orientation in orientations]))
+def add_puzzle(solver: z3.Solver, pieces: List[Piece], goal: Piece, index: Optional[PlacementIndex] = None, encoding: str = 'int') -> Optional[Tuple[List[z3.ExprRef], int]]:
+    """
+    Adds the constraints of make_puzzle to a solver while they are generated, such that
+    each constraint can be released as soon as it has been added.
 
-    return variables, constraints
+    Returns:
+        The variables and the number of constraints, or None if the sizes of the pieces and the goal don't match.
+    """
+    pieces_size = sum(len(piece) for piece in pieces)
+    if pieces_size != len(goal):
+        print('The size of the goal does not match with the pieces')
+        return None
 
+    if index is None:
+        index = PlacementIndex(pieces, goal)
+    variables = puzzle_variables(index, encoding)
+    count = 0
+    for constraint in puzzle_constraints(index, variables, encoding):
+        z3.Z3_solver_assert(solver.ctx.ref(), solver.solver, constraint.as_ast())
+        count += 1
+    return variables, count
 
-def solve_puzzle(pieces: List[Piece], goal: Piece) -> Optional[List[Piece]]:
-    variables, constraints = make_puzzle(pieces, goal)
-    solver = z3.Solver()
-    solver.add(constraints)
-    if solver.check() == z3.sat:
-        print('--- solution ---')
-        model = solver.model()
-        solution = [list() for piece in pieces]
-        for pos, x in zip(goal, variables):
-            i = int(str(model.evaluate(x)))
-            print(f'{x} = {i}')
-            solution[i].append(pos)
-        return solution
-    else:
-        print('No solution possible')
-    return None
 
+class RegionPropagator(z3.UserPropagateBase):
+    """
+    A Z3 user propagator that prunes the search of a puzzle created by make_puzzle.
+    Whenever a placement is fixed, the empty positions of the goal are split into
+    connected regions. Since a piece cannot cross the border of a region, the size
+    of each region must be the total size of some of the remaining pieces. If this
+    is not the case, a conflict is reported, and the solver backtracks immediately.
+
+    The propagator observes the placement variables with encoding 'bool', and the
+    conjunctions that describe placements with encoding 'int'. Note that the Z3
+    Python API calls back for every fixed term, which makes the propagator expensive;
+    the static pruning of PlacementIndex removes most unfillable regions for free.
+    A reference to the propagator must be kept as long as the solver is used.
+
+    Attributes:
+        index (PlacementIndex): The placements of the pieces.
+        terms (List[z3.BoolRef]): For each placement the term that is true if it is used.
+        neighbors (List[int]): For each goal position the bitmask of its neighbors.
+        conflicts (int): The number of conflicts that have been reported.
+    """
+    def __init__(self, solver: Optional[z3.Solver], terms: List[z3.BoolRef], index: PlacementIndex, ctx: Optional[z3.Context] = None):
+        super().__init__(solver, ctx)
+        self.index = index
+        self.terms = terms
+        self.neighbors = goal_neighbors(index.cells)
+        self.placement_ids = {term.get_id(): k for k, term in enumerate(terms)}
+        self.trail: List[int] = []
+        self.scopes: List[int] = []
+        self.occupied = 0
+        self.conflicts = 0
+        self.add_fixed(self._fixed)
+        if solver is not None:
+            for term in terms:
+                self.add(term)
+
+    @staticmethod
+    def placement_terms(variables: List[z3.ExprRef], index: PlacementIndex, encoding: str = 'int') -> List[z3.BoolRef]:
+        """
+        Returns for each placement the term of the model created by make_puzzle that is true if it is used.
+        """
+        if encoding == 'bool':
+            return variables
+        equal = piece_equalities(variables, len(index.piece_placements))
+        return [z3_apply(z3.Z3_mk_and, [equal[bit][i] for bit in mask_bits(mask)]) for i, mask in index.placements]
+
+    def push(self):
+        self.scopes.append(len(self.trail))
+
+    def pop(self, num_scopes: int):
+        size = self.scopes[-num_scopes]
+        del self.scopes[-num_scopes:]
+        del self.trail[size:]
+        self.occupied = 0
+        for k in self.trail:
+            self.occupied |= self.index.placements[k][1]
+
+    def fresh(self, new_ctx: z3.Context):
+        return RegionPropagator(None, [term.translate(new_ctx) for term in self.terms], self.index, new_ctx)
+
+    def _unused_sizes(self, placements: List[int]) -> int:
+        """
+        Returns the subset sums of the sizes of the pieces that are not used by the given placements.
+        """
+        used = {self.index.placements[k][0] for k in placements}
+        return subset_sums([size for i, size in enumerate(self.index.sizes) if i not in used])
+
+    def _fixed(self, term: z3.BoolRef, value: z3.ExprRef):
+        if not z3.is_true(value):
+            return
+        k = self.placement_ids[term.get_id()]
+        self.trail.append(k)
+        self.occupied |= self.index.placements[k][1]
+
+        empty = ((1 << len(self.index.goal)) - 1) & ~self.occupied
+        unfillable = find_unfillable_region(empty, self.neighbors, self._unused_sizes(self.trail))
+        if unfillable is None:
+            return
+        region, border = unfillable
+
+        # The placements along the border enclose the region. They explain the conflict,
+        # unless the size of the region depends on other pieces being used elsewhere.
+        enclosing = [k for k in self.trail if self.index.placements[k][1] & border]
+        if (self._unused_sizes(enclosing) >> bin(region).count('1')) & 1:
+            enclosing = self.trail
+        self.conflicts += 1
+        self.conflict(deps=[self.terms[k] for k in enclosing])
+
+
+def exact_cover(columns: Dict[Hashable, Set[int]], rows: List[List[Hashable]], multiplicities: Optional[Dict[Hashable, int]] = None, partial: Optional[List[int]] = None, deadline: Optional['Deadline'] = None) -> Iterator[List[int]]:
+    """
+    Enumerates the solutions of an exact cover problem using Knuth's Algorithm X.
+    The columns are stored as sets of row indices, and covering and uncovering
+    a column is done in place, in the spirit of Dancing Links.
 
-def save_puzzle(path: Path, pieces: List[Piece]) -> None:
-    def print_position(pos: Position) -> str:
-        x, y, z = pos
-        return f'{x} {y} {z}'
+    Args:
+        columns (Dict[Hashable, Set[int]]): Maps each column to the set of rows that cover it.
+            It is modified during the search, and restored afterward.
+        rows (List[List[Hashable]]): For each row the list of columns that it covers.
+        multiplicities (Optional[Dict[Hashable, int]]): The number of rows that must cover a column,
+            if it is more than one. Such columns are not used for branching until a single row
+            remains to be chosen, so no permutations of those rows are generated.
+        partial (Optional[List[int]]): Compatible rows that are part of every solution.
+        deadline (Optional[Deadline]): If it expires, TimeoutError is raised. The columns
+            are not restored in that case.
 
-    def print_piece(piece: Piece) -> str:
-        return '   '.join(print_position(pos) for pos in piece)
+    Returns:
+        Iterator[List[int]]: The solutions, given as lists of row indices.
+    """
+    multiplicities = dict(multiplicities) if multiplicities else {}
+    solution = []
+
+    def select(r: int) -> List[Optional[Set[int]]]:
+        removed = []
+        for j in rows[r]:
+            if multiplicities.get(j, 1) > 1:
+                multiplicities[j] -= 1
+                removed.append(None)
+                continue
+            for i in columns[j]:
+                for k in rows[i]:
+                    if k != j:
+                        columns[k].remove(i)
+            removed.append(columns.pop(j))
+        return removed
+
+    def deselect(r: int, removed: List[Optional[Set[int]]]) -> None:
+        for j in reversed(rows[r]):
+            column = removed.pop()
+            if column is None:
+                multiplicities[j] += 1
+                continue
+            columns[j] = column
+            for i in columns[j]:
+                for k in rows[i]:
+                    if k != j:
+                        columns[k].add(i)
+
+    def search() -> Iterator[List[int]]:
+        if deadline is not None and deadline.expired():
+            raise TimeoutError
+        if not columns:
+            yield list(solution)
+            return
+
+        # Choose the column with the fewest rows
+        candidates = [j for j in columns if multiplicities.get(j, 1) == 1]
+        if not candidates:
+            return
+        c = min(candidates, key=lambda j: len(columns[j]))
+        for r in list(columns[c]):
+            solution.append(r)
+            removed = select(r)
+            yield from search()
+            deselect(r, removed)
+            solution.pop()
+
+    selected = []
+    for r in partial or []:
+        solution.append(r)
+        selected.append((r, select(r)))
+    yield from search()
+    for r, removed in reversed(selected):
+        deselect(r, removed)
+
+
+def make_exact_cover(index: PlacementIndex) -> Tuple[Dict[Hashable, Set[int]], List[List[Hashable]], Dict[Hashable, int]]:
+    """
+    Translates a puzzle into an exact cover problem. Each placement of a piece is
+    a row, and the columns are the positions of the goal and the indices of the pieces.
+    Congruent pieces share one column, that must be covered once for each of them.
 
-    text = '\n'.join(print_piece(piece) for piece in pieces)
-    path.write_text(text)
+    Args:
+        index (PlacementIndex): The placements of the pieces of the puzzle.
 
+    Returns:
+        The columns, rows and multiplicities of the exact cover problem. The rows
+        correspond to the placements of the index.
+    """
+    rows = [[('piece', index.congruent[i])] + [('cell', bit) for bit in mask_bits(mask)] for i, mask in index.placements]
+    used = [index.congruent[i] == i for i, mask in index.placements]
+    columns = {('cell', bit): set(k for k in placements if used[k]) for bit, placements in enumerate(index.cell_placements)}
+    columns.update({('piece', i): set(placements) for i, placements in enumerate(index.piece_placements) if index.congruent[i] == i})
+    multiplicities = {('piece', i): index.congruent.count(i) for i in set(index.congruent)}
+    return columns, rows, multiplicities
 
-def draw_pieces(path: Path, pieces: List[Piece], grid: bool, scatter: float = 0):
-    colors = parse_colors(COLORS)
-    text = make_vrml(pieces, colors, grid, scatter)
-    path.write_text(text)
 
+def enumerate_exact_cover(pieces: List[Piece], goal: Piece, index: Optional[PlacementIndex] = None, deadline: Optional['Deadline'] = None) -> Iterator[List[Piece]]:
+    """
+    Enumerates the solutions of a puzzle using the exact cover solver.
 
-def main():
-    cmdline_parser = argparse.ArgumentParser()
-    cmdline_parser.add_argument('--pieces', type=str, help='A file containing pieces. Each line contains a piece')
-    cmdline_parser.add_argument('--goal', type=str, help='A file containing the coordinates of a 3D object. It is the goal of a puzzle')
-    cmdline_parser.add_argument('--make-cube', type=str, help="A string like '4x4x4'. Writes the positions of a cube to a file")
-    cmdline_parser.add_argument('--output', type=str, help='A filename')
-    cmdline_parser.add_argument('--draw', help='Draws the pieces in VRML format to the given output file', action='store_true')
-    cmdline_parser.add_argument('--grid', help='Scatters the pieces to a grid when drawing them', action='store_true')
-    cmdline_parser.add_argument('--scatter', type=float, default=0, help='Moves the pieces away from the center of gravity')
-    cmdline_parser.add_argument('--solve', help='Solves a puzzle. The specified pieces are fitted into the goal', action='store_true')
-    cmdline_parser.add_argument('--smt', help='Save the problem in .smt format', action='store_true')
-    cmdline_parser.add_argument('--transform', help='Draws the transformed pieces to the given output file', action='store_true')
-    cmdline_parser.add_argument('--threads', type=int, default=1, help='The number of threads used for solving a puzzle')
-    args = cmdline_parser.parse_args()
+    Args:
+        pieces (List[Piece]): The pieces of the puzzle.
+        goal (Piece): The goal of the puzzle.
+        index (Optional[PlacementIndex]): The placements of the pieces. It is computed if it is not given.
+        deadline (Optional[Deadline]): If it expires, TimeoutError is raised.
 
-    if args.threads > 1:
-        # https://github.com/Z3Prover/z3/issues/2207
-        # https://stackoverflow.com/questions/59113886/is-there-any-way-to-make-z3-use-multiple-cores-multithreaded-for-big-problems
-        # https://theory.stanford.edu/~nikolaj/programmingz3.html
-        # N.B. This does not seem to have any effect.
-        print(f'Setting the number of threads to {args.threads}')
-        z3.set_option('parallel.enable', True)
-        z3.set_option('parallel.threads.max', args.threads)
+    Returns:
+        Iterator[List[Piece]]: The solutions. Each solution contains for each piece its position in the goal.
+    """
+    pieces_size = sum(len(piece) for piece in pieces)
+    if pieces_size != len(goal):
+        return
 
-    if args.draw:
-        pieces = load_pieces(args.pieces)
-        path = Path(args.pieces).with_suffix('.wrl')
-        print(f"Saving pieces to file '{path}'")
-        draw_pieces(path, pieces, args.grid, args.scatter)
+    if index is None:
+        index = PlacementIndex(pieces, goal)
+    columns, rows, multiplicities = make_exact_cover(index)
+    for selected in exact_cover(columns, rows, multiplicities, deadline=deadline):
+        yield index.decode(selected)
 
-    if args.make_cube:
-        X, Y, Z = map(int, args.make_cube.split('x'))
-        positions = [f'{x} {y} {z}' for (x, y, z) in cube_positions(X, Y, Z)]
-        text = '   '.join(positions)
-        if not args.output:
-            args.output = f'goals/{args.make_cube}.txt'
-        print(f"Saving {args.make_cube} cube to file '{args.output}'")
-        Path(args.output).write_text(text)
 
-    if args.smt:
-        pieces = load_pieces(args.pieces)
-        goal = load_pieces(args.goal)[0]
-        variables, constraints = make_puzzle(pieces, goal)
-        solver = z3.Solver()
-        solver.add(constraints)
-        text = solver.to_smt2()
-        path = Path(f'{Path(args.pieces).stem}-{Path(args.goal).stem}.smt')
-        print(f"Saving SMT formula to file '{path}'")
-        path.write_text(text)
+def solve_exact_cover(pieces: List[Piece], goal: Piece, index: Optional[PlacementIndex] = None, deadline: Optional['Deadline'] = None) -> Optional[List[Piece]]:
+    """
+    Solves a puzzle using the exact cover solver.
 
-    if args.solve:
-        pieces = load_pieces(args.pieces)
-        goal = load_pieces(args.goal)[0]
-        solution = solve_puzzle(pieces, goal)
-        if solution:
-            wrl_path = Path(args.output) if args.output else Path(f'{Path(args.pieces).stem}-{Path(args.goal).stem}.wrl')
-            print(f"Saving solution to file '{wrl_path}'")
-            draw_pieces(wrl_path, solution, False)
-            solution_path = wrl_path.with_suffix('.txt')
-            print(f"Saving solution coordinates to file '{solution_path}'")
-            save_puzzle(solution_path, solution)
+    Args:
+        pieces (List[Piece]): The pieces of the puzzle.
+        goal (Piece): The goal of the puzzle.
+        index (Optional[PlacementIndex]): The placements of the pieces. It is computed if it is not given.
+        deadline (Optional[Deadline]): If it expires, TimeoutError is raised.
 
-    if args.transform:
-        pieces = load_pieces(args.pieces)
-        goal = load_pieces(args.goal)[0]
-        for i, piece in enumerate(pieces):
-            transformed_pieces = find_orientations(piece, goal)
-            filename = f'{Path(args.pieces).stem}-{i}.wrl'
-            print(f"Saving {len(transformed_pieces)} piece orientations to file '{filename}'")
-            draw_pieces(Path(filename), transformed_pieces, True)
+    Returns:
+        Optional[List[Piece]]: For each piece its position in the goal, or None if there is no solution.
+    """
+    pieces_size = sum(len(piece) for piece in pieces)
+    if pieces_size != len(goal):
+        print('The size of the goal does not match with the pieces')
+        return None
+
+    return next(enumerate_exact_cover(pieces, goal, index, deadline), None)
+
+
+FRONTIER_CACHE_SIZE = 1_000_000
+
+
+class BitboardSolver(object):
+    """
+    A backtracking solver that stores the occupied goal positions in a Python int, and
+    always covers the first empty position, using only the placements of which it is the
+    first position. The goal positions are numbered along the shortest side first, which
+    keeps the number of candidate placements small. This makes it fast for planar puzzles,
+    in which a piece that is placed quickly leaves holes that cannot be covered.
+    Like make_exact_cover, only the placements of the first piece of each congruence
+    class are used, as many times as the class has members. Optionally only a subset of
+    the placements of the index is used.
+
+    Attributes:
+        index (PlacementIndex): The placements of the puzzle.
+        bits (List[int]): For each goal position of the index its bit in the bitboard.
+        starts (List[List[Tuple[int, int, int]]]): For each bit of the bitboard the placements
+            of which it is the lowest bit, as (piece index, bitboard, placement index) triples.
+        counts (Dict[int, int]): The number of pieces in each congruence class.
+        nodes (int): The number of search nodes that have been visited.
+    """
+    def __init__(self, index: PlacementIndex, placements: Optional[Iterable[int]] = None):
+        self.index = index
+        coordinates = index.goal.coordinates
+        extents = coordinates.max(axis=0) - coordinates.min(axis=0) if len(coordinates) else np.zeros(3)
+        # np.lexsort uses the last key as the primary one, so the shortest axis varies fastest
+        order = np.lexsort([coordinates[:, d] for d in np.argsort(extents, kind='stable')])
+        self.bits = bits = [0] * len(order)
+        for bit, position in enumerate(order.tolist()):
+            bits[position] = bit
+        self.starts: List[List[Tuple[int, int, int]]] = [[] for _ in bits]
+        for k in range(len(index.placements)) if placements is None else placements:
+            i, mask = index.placements[k]
+            if index.congruent[i] == i:
+                board = functools.reduce(operator.or_, (1 << bits[bit] for bit in mask_bits(mask)))
+                self.starts[(board & -board).bit_length() - 1].append((i, board, k))
+        self.counts = {i: index.congruent.count(i) for i in set(index.congruent)}
+        self.nodes = 0
+
+    def solutions(self, deadline: Optional['Deadline'] = None) -> Iterator[List[int]]:
+        """
+        Enumerates the solutions as lists of placement indices. If the deadline expires,
+        TimeoutError is raised.
+        """
+        full = (1 << len(self.starts)) - 1
+        counts = dict(self.counts)
+        selected = []
+
+        def search(occupied: int) -> Iterator[List[int]]:
+            self.nodes += 1
+            if deadline is not None and not self.nodes & 1023 and deadline.expired():
+                raise TimeoutError
+            if occupied == full:
+                yield list(selected)
+                return
+            first = (~occupied & (occupied + 1)).bit_length() - 1
+            for i, board, k in self.starts[first]:
+                if counts[i] and not board & occupied:
+                    counts[i] -= 1
+                    selected.append(k)
+                    yield from search(occupied | board)
+                    selected.pop()
+                    counts[i] += 1
+
+        yield from search(0)
+
+    def count(self, cache_size: Optional[int] = FRONTIER_CACHE_SIZE, symmetry: Optional[List[int]] = None, deadline: Optional['Deadline'] = None) -> int:
+        """
+        Counts the solutions without generating them. Since the goal positions are covered
+        in a fixed order, the positions before the first empty one are always occupied, and
+        the remaining search only depends on the occupied positions after it (the frontier)
+        and the numbers of unused pieces. The count of each such state is computed once, and
+        kept in a least recently used cache of at most cache_size states, or an unbounded
+        one if cache_size is None. For goals that are thin in all but one direction, the
+        number of states is much smaller than the number of solutions.
+
+        If a symmetry of the goal is given, as a permutation of the goal positions of the
+        index, only the solutions that it maps onto themselves are counted. These consist
+        of whole orbits of placements under the symmetry, which are placed at once.
+        If the deadline expires, TimeoutError is raised.
+        """
+        full = (1 << len(self.starts)) - 1
+        classes = {i: t for t, i in enumerate(self.counts)}
+        if symmetry is None:
+            starts = [[(classes[i], board, 1) for i, board, k in placements] for placements in self.starts]
+        else:
+            image = [0] * len(self.bits)
+            for bit, target in enumerate(symmetry):
+                image[self.bits[bit]] = self.bits[target]
+            starts = []
+            for placements in self.starts:
+                orbits = []
+                for i, board, k in placements:
+                    orbit, size, current = board, 1, board
+                    while True:
+                        current = functools.reduce(operator.or_, (1 << image[bit] for bit in mask_bits(current)))
+                        if current == board:
+                            orbits.append((classes[i], orbit, size))
+                            break
+                        if current & orbit:
+                            break
+                        orbit, size = orbit | current, size + 1
+                starts.append(orbits)
+
+        @functools.lru_cache(maxsize=cache_size)
+        def count(occupied: int, remaining: Tuple[int, ...]) -> int:
+            self.nodes += 1
+            if deadline is not None and not self.nodes & 1023 and deadline.expired():
+                raise TimeoutError
+            if occupied == full:
+                return 1
+            first = (~occupied & (occupied + 1)).bit_length() - 1
+            total = 0
+            for t, board, size in starts[first]:
+                if remaining[t] >= size and not board & occupied:
+                    total += count(occupied | board, remaining[:t] + (remaining[t] - size,) + remaining[t + 1:])
+            return total
+
+        return count(0, tuple(self.counts.values()))
+
+
+def enumerate_bitboard(pieces: List[Piece], goal: Piece, index: Optional[PlacementIndex] = None, deadline: Optional['Deadline'] = None) -> Iterator[List[Piece]]:
+    """
+    Enumerates the solutions of a puzzle using the BitboardSolver.
+
+    Args:
+        pieces (List[Piece]): The pieces of the puzzle.
+        goal (Piece): The goal of the puzzle.
+        index (Optional[PlacementIndex]): The placements of the pieces. It is computed if it is not given.
+        deadline (Optional[Deadline]): If it expires, TimeoutError is raised.
+
+    Returns:
+        Iterator[List[Piece]]: The solutions. Each solution contains for each piece its position in the goal.
+    """
+    pieces_size = sum(len(piece) for piece in pieces)
+    if pieces_size != len(goal):
+        return
+
+    if index is None:
+        index = PlacementIndex(pieces, goal)
+    for selected in BitboardSolver(index).solutions(deadline):
+        yield index.decode(selected)
+
+
+CARDINALITY_ENCODINGS = ['pairwise', 'sequential', 'commander']
+
+
+class CnfFormula(object):
+    """
+    A boolean formula in conjunctive normal form. Like in the DIMACS format, the variables
+    are numbered from 1, and a clause is a list of literals: variables or negated variables.
+
+    Attributes:
+        variables (int): The number of variables.
+        clauses (List[List[int]]): The clauses.
+    """
+    def __init__(self, variables: int = 0):
+        self.variables = variables
+        self.clauses: List[List[int]] = []
+
+    def new_variable(self) -> int:
+        self.variables += 1
+        return self.variables
+
+    def at_most_one(self, literals: List[int], cardinality: str = 'sequential') -> None:
+        """
+        Adds clauses stating that at most one of the literals is true. The cardinality encoding
+        is 'pairwise' (a clause for each pair of literals), 'sequential' (the sequential counter
+        of Sinz, with 3n clauses and n auxiliary variables) or 'commander' (the commander encoding
+        of Klieber and Kwon, with groups of three literals). The pairwise encoding has no auxiliary
+        variables, but its size is quadratic, so for large goals one of the others should be used.
+        Up to four literals the pairwise encoding is always used, since it is the smallest.
+        """
+        if cardinality not in CARDINALITY_ENCODINGS:
+            raise ValueError(f"Unknown cardinality encoding '{cardinality}'")
+        if cardinality == 'pairwise' or len(literals) <= 4:
+            self.clauses.extend([-a, -b] for a, b in itertools.combinations(literals, 2))
+        elif cardinality == 'sequential':
+            # s is true if one of the literals up to x is true
+            s = self.new_variable()
+            self.clauses.append([-literals[0], s])
+            for x in literals[1:-1]:
+                t = self.new_variable()
+                self.clauses += [[-x, t], [-s, t], [-x, -s]]
+                s = t
+            self.clauses.append([-literals[-1], -s])
+        else:
+            # Each commander is true if and only if one of the literals of its group is true
+            commanders = []
+            for start in range(0, len(literals), 3):
+                group = literals[start:start + 3]
+                commander = self.new_variable()
+                self.at_most_one(group, 'pairwise')
+                self.clauses.extend([-x, commander] for x in group)
+                self.clauses.append([-commander] + group)
+                commanders.append(commander)
+            self.at_most_one(commanders, cardinality)
+
+    def exactly_one(self, literals: List[int], cardinality: str = 'sequential') -> None:
+        """
+        Adds clauses stating that exactly one of the literals is true, see at_most_one.
+        """
+        self.clauses.append(list(literals))
+        self.at_most_one(literals, cardinality)
+
+    def at_most(self, literals: List[int], k: int) -> None:
+        """
+        Adds clauses stating that at most k of the literals are true, using the sequential
+        counter of Sinz, with O(nk) clauses and auxiliary variables.
+        """
+        if k >= len(literals):
+            return
+        if k == 0:
+            self.clauses.extend([-x] for x in literals)
+            return
+        # s[j] is true if more than j of the literals up to x are true
+        s = None
+        for x in literals[:-1]:
+            t = [self.new_variable() for _ in range(k)]
+            self.clauses.append([-x, t[0]])
+            if s is None:
+                self.clauses.extend([-t[j]] for j in range(1, k))
+            else:
+                self.clauses.extend([-s[j], t[j]] for j in range(k))
+                self.clauses.extend([-x, -s[j - 1], t[j]] for j in range(1, k))
+                self.clauses.append([-x, -s[k - 1]])
+            s = t
+        self.clauses.append([-literals[-1], -s[k - 1]])
+
+    def write_dimacs(self, out: TextIO, comments: Iterable[str] = ()) -> None:
+        """
+        Writes the formula in DIMACS format.
+        """
+        out.writelines(f'c {comment}\n' for comment in comments)
+        out.write(f'p cnf {self.variables} {len(self.clauses)}\n')
+        out.writelines(' '.join(map(str, clause)) + ' 0\n' for clause in self.clauses)
+
+
+def make_cnf(index: PlacementIndex, cardinality: str = 'sequential') -> Tuple[CnfFormula, List[int]]:
+    """
+    Translates a puzzle into a CNF formula. Like in make_exact_cover, there is a variable for
+    each placement of the first piece of each congruence class. Each goal position is covered
+    by exactly one placement, and each class has at most as many placements as it has pieces.
+    Since the sizes of the pieces and the goal match, this means that it has exactly as many.
+
+    Args:
+        index (PlacementIndex): The placements of the pieces of the puzzle.
+        cardinality (str): The encoding of the cardinality constraints, see CnfFormula.at_most_one.
+
+    Returns:
+        The formula, and for each variable the placement of the index it corresponds to.
+    """
+    placements = [k for k, (i, mask) in enumerate(index.placements) if index.congruent[i] == i]
+    variable = {k: v for v, k in enumerate(placements, 1)}
+    formula = CnfFormula(len(placements))
+    for cell_placements in index.cell_placements:
+        formula.exactly_one([variable[k] for k in cell_placements if k in variable], cardinality)
+    for i in sorted(set(index.congruent)):
+        literals = [variable[k] for k in index.piece_placements[i]]
+        count = index.congruent.count(i)
+        if count == 1:
+            formula.exactly_one(literals, cardinality)
+        else:
+            formula.at_most(literals, count)
+    return formula, placements
+
+
+def save_cnf(path: Path, index: PlacementIndex, cardinality: str = 'sequential') -> None:
+    """
+    Saves the formula of make_cnf in DIMACS format. For each placement variable there is a
+    comment line 'c placement <variable> piece <piece> <positions>', that can be used to
+    decode a model.
+    """
+    formula, placements = make_cnf(index, cardinality)
+    comments = [f'{Path(path).stem} cardinality={cardinality}']
+    for v, k in enumerate(placements, 1):
+        i, mask = index.placements[k]
+        comments.append(f'placement {v} piece {i} ' + '   '.join(f'{x} {y} {z}' for x, y, z in index.positions(mask)))
+    with open(path, 'w') as f:
+        formula.write_dimacs(f, comments)
+
+
+class SatSolver(object):
+    """
+    Solves CNF formulas, either in-process using the optional python-sat package, or by
+    running a DIMACS solver as a subprocess. An external solver must report its result in
+    the format of the SAT competition: a line 's SATISFIABLE' or 's UNSATISFIABLE', and
+    'v' lines that contain the model. This is the case for kissat, CaDiCaL and
+    cryptominisat5, and for glucose with the option -model.
+
+    Attributes:
+        command (str): 'pysat' for MiniSat 2.2 of python-sat, 'pysat:<name>' to select another
+            solver of python-sat, for example 'pysat:glucose4', or a command line like 'kissat -q',
+            to which the name of a DIMACS file is appended. Note that python-sat cannot interrupt
+            some of its solvers, like CaDiCaL, when the deadline expires.
+        cardinality (str): The encoding of the cardinality constraints, see CnfFormula.at_most_one.
+    """
+    def __init__(self, command: str = 'pysat', cardinality: str = 'sequential'):
+        self.command = command
+        self.cardinality = cardinality
+
+    def models(self, formula: CnfFormula, projection: int, deadline: Optional['Deadline'] = None) -> Iterator[Set[int]]:
+        """
+        Enumerates the models of a formula, as the sets of variables that are true. After each
+        model a clause is added that excludes its true variables up to projection, so the models
+        differ in those variables. If the deadline expires, TimeoutError is raised.
+        """
+        if self.command.partition(':')[0] == 'pysat':
+            yield from self._pysat_models(formula, projection, deadline)
+        else:
+            yield from self._external_models(formula, projection, deadline)
+
+    def _pysat_models(self, formula: CnfFormula, projection: int, deadline: Optional['Deadline']) -> Iterator[Set[int]]:
+        if pysat is None:
+            raise RuntimeError("The SAT solver 'pysat' requires the python-sat package; select an installed DIMACS solver instead")
+        with pysat.solvers.Solver(name=self.command.partition(':')[2] or 'minisat22', bootstrap_with=formula.clauses) as solver:
+            while True:
+                done = threading.Event()
+
+                def interrupt():
+                    while not done.wait(0.05):
+                        if deadline.expired():
+                            solver.interrupt()
+                            return
+
+                watcher = threading.Thread(target=interrupt, daemon=True) if deadline is not None else None
+                if watcher:
+                    watcher.start()
+                try:
+                    result = solver.solve_limited(expect_interrupt=True)
+                finally:
+                    done.set()
+                    if watcher:
+                        watcher.join()
+                if result is None:
+                    raise TimeoutError
+                if not result:
+                    return
+                model = set(v for v in solver.get_model() if v > 0)
+                yield model
+                solver.add_clause([-v for v in model if v <= projection])
+
+    def _external_models(self, formula: CnfFormula, projection: int, deadline: Optional['Deadline']) -> Iterator[Set[int]]:
+        formula = copy.copy(formula)
+        formula.clauses = list(formula.clauses)
+        with tempfile.TemporaryDirectory() as folder:
+            path = Path(folder) / 'puzzle.cnf'
+            while True:
+                with open(path, 'w') as f:
+                    formula.write_dimacs(f)
+                try:
+                    # In a new session the solver and the processes started by a wrapper script form one process group
+                    process = subprocess.Popen(shlex.split(self.command) + [str(path)], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, start_new_session=hasattr(os, 'killpg'))
+                except OSError as e:
+                    raise RuntimeError(f"The SAT solver '{self.command}' could not be started: {e}")
+                while True:
+                    try:
+                        output, _ = process.communicate(timeout=None if deadline is None else 0.05)
+                        break
+                    except subprocess.TimeoutExpired:
+                        if deadline.expired():
+                            # Also stop the processes that a wrapper script started, where process groups exist
+                            if hasattr(os, 'killpg'):
+                                os.killpg(process.pid, signal.SIGKILL)
+                            else:
+                                process.kill()
+                            process.communicate()
+                            raise TimeoutError
+                status = None
+                model = set()
+                for line in output.splitlines():
+                    if line.startswith('s '):
+                        status = line[2:].strip()
+                    elif line.startswith('v '):
+                        model.update(v for v in map(int, line[2:].split()) if v > 0)
+                if status == 'UNSATISFIABLE':
+                    return
+                if status != 'SATISFIABLE':
+                    if status == 'UNKNOWN':
+                        raise TimeoutError
+                    raise RuntimeError(f"The SAT solver '{self.command}' did not report a result")
+                yield model
+                formula.clauses.append([-v for v in model if v <= projection])
+
+
+sat_solver = SatSolver()
+
+
+def worker_settings() -> tuple:
+    """
+    Returns the global settings of this module that worker processes need, see
+    apply_worker_settings. A worker that is started with the spawn method imports
+    the module again, so it does not see the settings that were made by main.
+    """
+    return placement_cache, sat_solver
+
+
+def apply_worker_settings(settings: tuple) -> None:
+    global placement_cache, sat_solver
+    placement_cache, sat_solver = settings
+
+
+def enumerate_sat(pieces: List[Piece], goal: Piece, index: Optional[PlacementIndex] = None, deadline: Optional['Deadline'] = None) -> Iterator[List[Piece]]:
+    """
+    Enumerates the solutions of a puzzle using the formula of make_cnf, and the SAT solver
+    in the global variable sat_solver.
+
+    Args:
+        pieces (List[Piece]): The pieces of the puzzle.
+        goal (Piece): The goal of the puzzle.
+        index (Optional[PlacementIndex]): The placements of the pieces. It is computed if it is not given.
+        deadline (Optional[Deadline]): If it expires, TimeoutError is raised.
+
+    Returns:
+        Iterator[List[Piece]]: The solutions. Each solution contains for each piece its position in the goal.
+    """
+    pieces_size = sum(len(piece) for piece in pieces)
+    if pieces_size != len(goal):
+        return
+
+    if index is None:
+        index = PlacementIndex(pieces, goal)
+    formula, placements = make_cnf(index, sat_solver.cardinality)
+    for model in sat_solver.models(formula, len(placements), deadline):
+        yield index.decode([k for v, k in enumerate(placements, 1) if v in model])
+
+
+def select_backend(backend: str, goal: Piece) -> str:
+    """
+    Returns the backend that is used for a goal. The backend 'auto' selects the
+    bitboard solver for planar goals, and Z3 otherwise.
+    """
+    if backend == 'auto':
+        return 'bitboard' if is_planar(goal) else 'z3'
+    return backend
+
+
+def decode_model(model: z3.ModelRef, variables: List[z3.ExprRef], pieces: List[Piece], index: PlacementIndex, encoding: str = 'int') -> List[Piece]:
+    """
+    Extracts the solution of a puzzle from a Z3 model of the constraints created by make_puzzle.
+    """
+    solution = [list() for piece in pieces]
+    if encoding == 'bool':
+        for x, (i, mask) in zip(variables, index.placements):
+            if z3.is_true(model.evaluate(x)):
+                solution[i] = index.positions(mask)
+    else:
+        for pos, x in zip(index.goal, variables):
+            i = model.evaluate(x, model_completion=True).as_long()
+            solution[i].append(pos)
+        solution = [Piece(positions) for positions in solution]
+    return solution
+
+
+def print_solution(solution: List[Piece]) -> None:
+    print('--- solution ---')
+    for i, piece in enumerate(solution):
+        for (x, y, z) in piece:
+            print(f'x_{x}_{y}_{z} = {i}')
+
+
+class SolveStats(object):
+    """
+    Collects statistics about solving a puzzle. An instance can be passed to solve_puzzle
+    and enumerate_solutions, which fill it in.
+
+    Attributes:
+        phases (Dict[str, Dict[str, float]]): For each phase ('placements', 'constraints'
+            and 'solve') the accumulated wall clock and CPU time in seconds.
+        goal_cells (int): The number of positions of the goal.
+        rotations (List[int]): For each piece the number of distinct rotations that are
+            used, which are only the rotations within the plane for planar goals.
+        placements (List[int]): For each piece the number of placements inside the goal.
+        forced (Optional[int]): The number of placements committed by ForcedPlacements.
+        residual (Optional[int]): The number of placements that remain after ForcedPlacements.
+        constraints (Optional[int]): The number of Z3 constraints, or None if Z3 is not used.
+        solutions (int): The number of solutions that were found.
+        solver (Dict[str, float]): The statistics of the Z3 solver, like conflicts and decisions.
+    """
+    def __init__(self):
+        self.phases: Dict[str, Dict[str, float]] = {}
+        self.goal_cells = 0
+        self.rotations: List[int] = []
+        self.placements: List[int] = []
+        self.forced: Optional[int] = None
+        self.residual: Optional[int] = None
+        self.constraints: Optional[int] = None
+        self.solutions = 0
+        self.solver: Dict[str, float] = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """
+        Adds the wall clock and CPU time of a block of code to the given phase.
+        """
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            times = self.phases.setdefault(name, {'wall': 0.0, 'cpu': 0.0})
+            times['wall'] += time.perf_counter() - wall
+            times['cpu'] += time.process_time() - cpu
+
+    def timed(self, name: str, iterator: Iterator) -> Iterator:
+        """
+        Adds the time needed to generate the elements of an iterator to the given phase.
+        """
+        while True:
+            with self.phase(name):
+                element = next(iterator, None)
+            if element is None:
+                return
+            yield element
+
+    def record_index(self, pieces: List[Piece], index: PlacementIndex) -> None:
+        self.goal_cells = len(index.goal)
+        axis = planar_axis(index.goal)
+        self.rotations = [len(normalized_rotations(sorted(set(piece)), axis)) for piece in pieces]
+        self.placements = [len(placements) for placements in index.piece_placements]
+
+    def record_forced(self, forced: 'ForcedPlacements') -> None:
+        self.forced = len(forced.committed)
+        self.residual = len(forced.residual.placements)
+
+    def record_solver(self, solver: z3.Solver) -> None:
+        statistics = solver.statistics()
+        self.solver = {key: statistics.get_key_value(key) for key in statistics.keys()}
+
+    @staticmethod
+    def peak_memory() -> Optional[int]:
+        """
+        Returns the peak resident memory of the process in bytes, or None if it is not
+        available, since the resource module only exists on Unix.
+        """
+        try:
+            import resource
+        except ImportError:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+    def to_dict(self) -> dict:
+        return {
+            'phases': self.phases,
+            'goal_cells': self.goal_cells,
+            'rotations': self.rotations,
+            'placements': self.placements,
+            'forced': self.forced,
+            'residual': self.residual,
+            'constraints': self.constraints,
+            'solutions': self.solutions,
+            'peak_memory': self.peak_memory(),
+            'solver': self.solver,
+        }
+
+    def __str__(self):
+        lines = ['--- statistics ---']
+        for name, times in self.phases.items():
+            lines.append(f'{name + " time":<20} {times["wall"]:.3f}s wall, {times["cpu"]:.3f}s cpu')
+        lines.append(f'{"goal cells":<20} {self.goal_cells}')
+        lines.append(f'{"rotations":<20} {" ".join(map(str, self.rotations))}')
+        lines.append(f'{"placements":<20} {" ".join(map(str, self.placements))} (total {sum(self.placements)})')
+        if self.residual is not None:
+            lines.append(f'{"forced placements":<20} {self.forced}')
+            lines.append(f'{"residual placements":<20} {self.residual}')
+        if self.constraints is not None:
+            lines.append(f'{"constraints":<20} {self.constraints}')
+        lines.append(f'{"solutions":<20} {self.solutions}')
+        peak = self.peak_memory()
+        if peak is not None:
+            lines.append(f'{"peak memory":<20} {peak / 1_000_000:.1f} MB')
+        for key, value in self.solver.items():
+            lines.append(f'{"z3 " + key:<20} {value}')
+        return '\n'.join(lines)
+
+
+class Deadline(object):
+    """
+    A wall clock budget for solving puzzles, that can also be cancelled from another thread.
+    A running Z3 check is interrupted through its context, and the exact cover solver
+    checks the deadline at every step of the search.
+
+    Attributes:
+        end (Optional[float]): The time.monotonic() value at which the budget expires, or None.
+        cancelled (threading.Event): Is set by cancel.
+    """
+    def __init__(self, seconds: Optional[float] = None):
+        self.end = None if seconds is None else time.monotonic() + seconds
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+        self.contexts: List[z3.Context] = []
+
+    def remaining(self) -> Optional[float]:
+        """
+        Returns the number of seconds that are left, or None if there is no limit.
+        """
+        if self.cancelled.is_set():
+            return 0.0
+        return None if self.end is None else max(0.0, self.end - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.cancelled.is_set() or (self.end is not None and time.monotonic() >= self.end)
+
+    def fraction(self, fraction: float) -> 'Deadline':
+        """
+        Returns a deadline for a part of the remaining budget, that is cancelled together with this one.
+        """
+        deadline = copy.copy(self)
+        remaining = self.remaining()
+        if remaining is not None and fraction < 1.0:
+            deadline.end = time.monotonic() + remaining * fraction
+        return deadline
+
+    def cancel(self) -> None:
+        """
+        Stops the solvers that use this deadline. It can be called from any thread.
+        """
+        with self.lock:
+            self.cancelled.set()
+            for context in self.contexts:
+                context.interrupt()
+
+    @contextlib.contextmanager
+    def interruptible(self, context: z3.Context):
+        """
+        Makes a Z3 context interruptible by cancel, within a block of code.
+        """
+        with self.lock:
+            self.contexts.append(context)
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.contexts.remove(context)
+
+
+class SolveResult(NamedTuple):
+    """
+    The result of solving a puzzle.
+
+    Attributes:
+        status (str): 'solved', 'unsolvable' if it was proven that there is no solution, or
+            'unknown' if the solver gave up, for example because the time limit was exceeded.
+        solution (Optional[List[Piece]]): For each piece its position in the goal, if it was solved.
+        reason (Optional[str]): Why there is no solution, if find_infeasibility found a reason.
+    """
+    status: str
+    solution: Optional[List[Piece]] = None
+    reason: Optional[str] = None
+
+
+def find_solution(pieces: List[Piece], goal: Piece, index: PlacementIndex, backend: str = 'z3', encoding: str = 'int', propagate: bool = False, stats: Optional[SolveStats] = None, deadline: Optional[Deadline] = None, forcing: bool = True, checked: bool = False) -> SolveResult:
+    """
+    Searches a solution of a puzzle with one solver configuration, see solve_puzzle.
+    The search is stopped when the deadline expires. Puzzles for which find_infeasibility
+    finds a reason are not passed to a solver. If checked is true, the caller has already
+    called find_infeasibility without the index, and only find_missing_placements is
+    called. If forcing is true, only the subproblem that remains after ForcedPlacements
+    is passed to the solver.
+    """
+    if stats is None:
+        stats = SolveStats()
+    if deadline is None:
+        deadline = Deadline()
+    backend = select_backend(backend, index.goal)
+    stats.record_index(pieces, index)
+    reason = find_missing_placements(index) if checked else find_infeasibility(pieces, goal, index)
+    if reason:
+        return SolveResult('unsolvable', reason=reason)
+
+    def merge(solution: List[Piece]) -> List[Piece]:
+        return solution
+
+    if forcing:
+        with stats.phase('forcing'):
+            forced = ForcedPlacements(index)
+        stats.record_forced(forced)
+        if forced.reason:
+            return SolveResult('unsolvable', reason=forced.reason)
+        if not forced.pieces:
+            stats.solutions = 1
+            return SolveResult('solved', forced.merge([]))
+        pieces, goal, index, merge = [pieces[i] for i in forced.pieces], forced.residual.goal, forced.residual, forced.merge
+    if deadline.expired():
+        return SolveResult('unknown')
+
+    if backend in ['dlx', 'bitboard']:
+        with stats.phase('solve'):
+            try:
+                solution = solve_exact_cover(pieces, goal, index, deadline) if backend == 'dlx' else next(enumerate_bitboard(pieces, goal, index, deadline), None)
+            except TimeoutError:
+                return SolveResult('unknown')
+        stats.solutions = int(bool(solution))
+        return SolveResult('solved', merge(solution)) if solution else SolveResult('unsolvable')
+
+    if backend == 'sat':
+        with stats.phase('constraints'):
+            formula, placements = make_cnf(index, sat_solver.cardinality)
+        stats.constraints = len(formula.clauses)
+        with stats.phase('solve'):
+            try:
+                model = next(sat_solver.models(formula, len(placements), deadline), None)
+            except TimeoutError:
+                return SolveResult('unknown')
+        if model is None:
+            return SolveResult('unsolvable')
+        stats.solutions = 1
+        return SolveResult('solved', merge(index.decode([k for v, k in enumerate(placements, 1) if v in model])))
+
+    with stats.phase('constraints'):
+        solver = z3.Solver()
+        puzzle = add_puzzle(solver, pieces, goal, index, encoding)
+        if puzzle is None:
+            return SolveResult('unsolvable')
+        variables, stats.constraints = puzzle
+        propagator = RegionPropagator(solver, RegionPropagator.placement_terms(variables, index, encoding), index) if propagate else None
+    remaining = deadline.remaining()
+    if remaining is not None:
+        solver.set(timeout=max(1, int(remaining * 1000)))
+    with stats.phase('solve'), deadline.interruptible(solver.ctx):
+        result = solver.check() if not deadline.expired() else z3.unknown
+    stats.record_solver(solver)
+    if result == z3.sat:
+        stats.solutions = 1
+        return SolveResult('solved', merge(decode_model(solver.model(), variables, pieces, index, encoding)))
+    return SolveResult('unsolvable' if result == z3.unsat else 'unknown')
+
+
+def print_result(result: SolveResult) -> None:
+    if result.status == 'solved':
+        print_solution(result.solution)
+    elif result.status == 'unsolvable':
+        print(f'No solution possible: {result.reason}' if result.reason else 'No solution possible')
+    else:
+        print('No solution found within the time limit')
+
+
+def solve_puzzle(pieces: List[Piece], goal: Piece, backend: str = 'z3', encoding: str = 'int', symmetry_breaking: bool = False, index: Optional[PlacementIndex] = None, pruning: Optional[bool] = None, propagate: bool = False, stats: Optional[SolveStats] = None, timeout: Optional[float] = None, forcing: bool = True) -> Optional[List[Piece]]:
+    """
+    Solves a puzzle and prints the solution. Use solve_with_budget to distinguish
+    between puzzles without a solution and searches that were given up.
+
+    Args:
+        pieces (List[Piece]): The pieces of the puzzle.
+        goal (Piece): The goal of the puzzle.
+        backend (str): The solver backend, 'z3', 'dlx', 'bitboard', 'sat' or 'auto', see select_backend.
+        encoding (str): The encoding of the Z3 model, 'int' or 'bool'.
+        symmetry_breaking (bool): If true, the solver uses symmetry breaking.
+        index (Optional[PlacementIndex]): The placements of the pieces. It is computed if it is not given.
+        pruning (Optional[bool]): If true, placements that split off an unfillable region
+            are removed. By default this is done for planar goals.
+        propagate (bool): If true, the Z3 search is pruned by a RegionPropagator.
+        stats (Optional[SolveStats]): If given, statistics about the search are stored in it.
+        timeout (Optional[float]): The maximum number of seconds.
+        forcing (bool): If true, the forced placements are committed before solving, see ForcedPlacements.
+
+    Returns:
+        Optional[List[Piece]]: For each piece its position in the goal, or None if no solution was found.
+    """
+    if stats is None:
+        stats = SolveStats()
+    deadline = Deadline(timeout)
+    checked = index is None
+    if index is None:
+        reason = find_infeasibility(pieces, goal)
+        if reason:
+            print_result(SolveResult('unsolvable', reason=reason))
+            return None
+        with stats.phase('placements'):
+            index = PlacementIndex(pieces, goal, symmetry_breaking, pruning)
+    result = find_solution(pieces, goal, index, backend, encoding, propagate, stats, deadline, forcing, checked)
+    print_result(result)
+    return result.solution
+
+
+# The configurations of solve_with_budget with escalate=True, together with the fraction
+# of the remaining time budget that they may use. Cheap configurations come first.
+ESCALATION = [('dlx', 'int', 0.1), ('z3', 'bool', 0.6), ('z3', 'int', 1.0)]
+
+
+def solve_with_budget(pieces: List[Piece], goal: Piece, backend: str = 'z3', encoding: str = 'int', symmetry_breaking: bool = False, timeout: Optional[float] = None, deadline: Optional[Deadline] = None, escalate: bool = False, pruning: Optional[bool] = None, stats: Optional[SolveStats] = None) -> SolveResult:
+    """
+    Solves a puzzle within a wall clock budget, and returns whether it was solved, proven
+    to be unsolvable, or given up. The search can be cancelled from another thread by
+    calling cancel on the deadline.
+
+    Args:
+        pieces (List[Piece]): The pieces of the puzzle.
+        goal (Piece): The goal of the puzzle.
+        backend (str): The solver backend, 'z3', 'dlx', 'bitboard', 'sat' or 'auto', see select_backend.
+        encoding (str): The encoding of the Z3 model, 'int' or 'bool'.
+        symmetry_breaking (bool): If true, the solvers use symmetry breaking.
+        timeout (Optional[float]): The maximum number of seconds. It is ignored if a deadline is given.
+        deadline (Optional[Deadline]): The budget of the search.
+        escalate (bool): If true, the configurations of ESCALATION are tried one after
+            another, each with a fraction of the remaining budget, instead of the given backend
+            and encoding. This requires a finite budget, otherwise a ValueError is raised.
+        pruning (Optional[bool]): If true, placements that split off an unfillable region
+            are removed. By default this is done for planar goals.
+        stats (Optional[SolveStats]): Collects statistics. With escalate, the times of all
+            configurations that are tried are added.
+
+    Returns:
+        SolveResult: The status and the solution.
+    """
+    if stats is None:
+        stats = SolveStats()
+    if deadline is None:
+        deadline = Deadline(timeout)
+    if escalate and deadline.end is None:
+        raise ValueError('Escalation requires a timeout, since each configuration gets a fraction of it')
+    reason = find_infeasibility(pieces, goal)
+    if reason:
+        return SolveResult('unsolvable', reason=reason)
+    with stats.phase('placements'):
+        index = PlacementIndex(pieces, goal, symmetry_breaking, pruning)
+    if not escalate:
+        return find_solution(pieces, goal, index, backend, encoding, stats=stats, deadline=deadline, checked=True)
+
+    for backend, encoding, fraction in ESCALATION:
+        if deadline.expired():
+            break
+        result = find_solution(pieces, goal, index, backend, encoding, stats=stats, deadline=deadline.fraction(fraction), checked=True)
+        if result.status != 'unknown':
+            return result
+    return SolveResult('unknown')
+
+
+def enumerate_z3_solutions(pieces: List[Piece], goal: Piece, index: PlacementIndex, encoding: str = 'int', propagate: bool = False, stats: Optional[SolveStats] = None, deadline: Optional[Deadline] = None) -> Iterator[List[Piece]]:
+    """
+    Enumerates the solutions of a puzzle using one Z3 solver. Each solution that has
+    been found is blocked before searching for the next one. If propagate is true, a
+    RegionPropagator is attached to the solver. If the deadline expires, TimeoutError
+    is raised.
+    """
+    if stats is None:
+        stats = SolveStats()
+    if deadline is None:
+        deadline = Deadline()
+    with stats.phase('constraints'):
+        solver = z3.Solver()
+        puzzle = add_puzzle(solver, pieces, goal, index, encoding)
+        if puzzle is None:
+            return
+        variables, stats.constraints = puzzle
+        propagator = RegionPropagator(solver, RegionPropagator.placement_terms(variables, index, encoding), index) if propagate else None
+    while True:
+        remaining = deadline.remaining()
+        if remaining is not None:
+            solver.set(timeout=max(1, int(remaining * 1000)))
+        with stats.phase('solve'), deadline.interruptible(solver.ctx):
+            result = solver.check() if not deadline.expired() else z3.unknown
+        stats.record_solver(solver)
+        if result == z3.unknown and deadline.expired():
+            raise TimeoutError
+        if result != z3.sat:
+            break
+        model = solver.model()
+        yield decode_model(model, variables, pieces, index, encoding)
+        if encoding == 'bool':
+            solver.add(z3.Or([z3.Not(x) for x in variables if z3.is_true(model.evaluate(x))]))
+        else:
+            solver.add(z3.Or([x != model.evaluate(x, model_completion=True) for x in variables]))
+
+
+def enumerate_solutions(pieces: List[Piece], goal: Piece, backend: str = 'z3', encoding: str = 'int', symmetry_breaking: bool = False, pruning: Optional[bool] = None, propagate: bool = False, stats: Optional[SolveStats] = None, forcing: bool = True, deadline: Optional[Deadline] = None) -> Iterator[List[Piece]]:
+    """
+    Enumerates all solutions of a puzzle. The solutions are generated lazily.
+
+    Args:
+        pieces (List[Piece]): The pieces of the puzzle.
+        goal (Piece): The goal of the puzzle.
+        backend (str): The solver backend, 'z3', 'dlx', 'bitboard', 'sat' or 'auto', see select_backend.
+        encoding (str): The encoding of the Z3 model, 'int' or 'bool'.
+        symmetry_breaking (bool): If true, solutions that are equal up to a symmetry of
+            the goal or a permutation of congruent pieces are reported only once.
+        pruning (Optional[bool]): If true, placements that split off an unfillable region
+            are removed. By default this is done for planar goals.
+        propagate (bool): If true, the Z3 search is pruned by a RegionPropagator.
+        stats (Optional[SolveStats]): If given, statistics about the search are stored in it.
+        forcing (bool): If true, the forced placements are committed before solving, see ForcedPlacements.
+        deadline (Optional[Deadline]): If it expires, TimeoutError is raised. The solutions
+            that have been generated before are valid.
+
+    Returns:
+        Iterator[List[Piece]]: The solutions. Each solution contains for each piece its position in the goal.
+    """
+    if stats is None:
+        stats = SolveStats()
+    if find_infeasibility(pieces, goal):
+        return
+    with stats.phase('placements'):
+        index = PlacementIndex(pieces, goal, symmetry_breaking, pruning)
+    stats.record_index(pieces, index)
+    if find_missing_placements(index):
+        return
+    subproblem, residual, merge = pieces, index, lambda solution: solution
+    if forcing:
+        with stats.phase('forcing'):
+            forced = ForcedPlacements(index)
+        stats.record_forced(forced)
+        if forced.reason:
+            return
+        subproblem, residual, merge = [pieces[i] for i in forced.pieces], forced.residual, forced.merge
+    backend = select_backend(backend, goal)
+    if backend == 'bitboard':
+        solutions = stats.timed('solve', enumerate_bitboard(subproblem, residual.goal, residual, deadline))
+    elif backend == 'dlx':
+        solutions = stats.timed('solve', enumerate_exact_cover(subproblem, residual.goal, residual, deadline))
+    elif backend == 'sat':
+        solutions = stats.timed('solve', enumerate_sat(subproblem, residual.goal, residual, deadline))
+    else:
+        solutions = enumerate_z3_solutions(subproblem, residual.goal, residual, encoding, propagate, stats, deadline)
+    for solution in map(merge, solutions):
+        if index.is_canonical(solution):
+            stats.solutions += 1
+            yield solution
+
+
+def until_timeout(solutions: Iterator[List[Piece]]) -> Iterator[List[Piece]]:
+    """
+    Generates solutions until the enumeration raises TimeoutError.
+    """
+    with contextlib.suppress(TimeoutError):
+        yield from solutions
+
+
+def count_solutions(pieces: List[Piece], goal: Piece, symmetry_breaking: bool = False, pruning: Optional[bool] = None, stats: Optional[SolveStats] = None, cache_size: Optional[int] = FRONTIER_CACHE_SIZE, deadline: Optional[Deadline] = None) -> int:
+    """
+    Counts the solutions of a puzzle that enumerate_solutions would generate, without
+    generating them, using the dynamic programming of BitboardSolver.count. This is
+    feasible for goals that are thin in all but one direction, for which there may be far
+    too many solutions to enumerate.
+
+    With symmetry breaking, the solutions that are canonical are counted. These are the
+    orbits of the solutions under the goal symmetries that fix the placement of the anchor
+    piece, or under all goal symmetries if there is no anchor piece. By Burnside's lemma,
+    the number of orbits is the average number of solutions that each of these symmetries
+    maps onto itself, which is counted by BitboardSolver.count as well.
+
+    Args:
+        pieces (List[Piece]): The pieces of the puzzle.
+        goal (Piece): The goal of the puzzle.
+        symmetry_breaking (bool): If true, solutions that are equal up to a symmetry of
+            the goal or a permutation of congruent pieces are counted only once.
+        pruning (Optional[bool]): If true, placements that split off an unfillable region
+            are removed. By default this is done for planar goals.
+        stats (Optional[SolveStats]): If given, statistics about the search are stored in it.
+        cache_size (Optional[int]): The maximum number of states that are cached, or None
+            for an unbounded cache.
+        deadline (Optional[Deadline]): If it expires, TimeoutError is raised.
+
+    Returns:
+        int: The number of solutions.
+    """
+    if stats is None:
+        stats = SolveStats()
+    if find_infeasibility(pieces, goal):
+        return 0
+    with stats.phase('placements'):
+        index = PlacementIndex(pieces, goal, symmetry_breaking, pruning)
+    stats.record_index(pieces, index)
+    if find_missing_placements(index):
+        return 0
+    permutations = 1
+    if not symmetry_breaking:
+        # Congruent pieces have the same placements, so the solutions are counted with
+        # the pieces of each class placed interchangeably, and multiplied by their permutations
+        forms = {}
+        index.congruent = [forms.setdefault(canonical_piece(Piece(piece)), i) for i, piece in enumerate(pieces)]
+        permutations = math.prod(math.factorial(index.congruent.count(i)) for i in set(index.congruent))
+    with stats.phase('solve'):
+        if index.anchor is None:
+            symmetries = index.symmetries or [None]
+            count = sum(BitboardSolver(index).count(cache_size, symmetry, deadline) for symmetry in symmetries) // len(symmetries)
+        else:
+            anchor_placements = set(index.piece_placements[index.anchor])
+            others = [k for k in range(len(index.placements)) if k not in anchor_placements]
+            fixed = [k for k in anchor_placements if index.placements[k][1] in index.stabilizers]
+            count = BitboardSolver(index, [k for k in range(len(index.placements)) if k not in fixed]).count(cache_size, deadline=deadline)
+            # The solutions with an anchor placement that is fixed by a symmetry are counted
+            # separately, since they are only canonical once for each of their orbits
+            for k in fixed:
+                stabilizers = index.stabilizers[index.placements[k][1]]
+                count += sum(BitboardSolver(index, others + [k]).count(cache_size, symmetry, deadline) for symmetry in stabilizers) // len(stabilizers)
+    count *= permutations
+    stats.solutions = count
+    return count
+
+
+def solve_goals(pieces: List[Piece], goals: List[Piece], backend: str = 'z3', encoding: str = 'int', symmetry_breaking: bool = False, pruning: Optional[bool] = None, incremental: bool = False, propagate: bool = False, stats: Optional[SolveStats] = None, timeout: Optional[float] = None, forcing: bool = True) -> Iterator[Optional[List[Piece]]]:
+    """
+    Solves a puzzle for several goals. The pieces and their rotations are processed only
+    once. By default a new solver is used for each goal, since the solver has the least
+    work with only the placements of one goal. With incremental=True one Z3 solver is
+    shared between the goals, see solve_goals_incremental. It requires the z3 (or auto)
+    backend and the bool encoding, and doesn't support propagate; other choices raise a
+    ValueError. Like solve_puzzle, the result for each goal is printed.
+
+    Args:
+        pieces (List[Piece]): The pieces of the puzzle.
+        goals (List[Piece]): The goals.
+        backend (str): The solver backend, 'z3', 'dlx', 'bitboard', 'sat' or 'auto', see select_backend.
+        encoding (str): The encoding of the Z3 model, 'int' or 'bool'.
+        symmetry_breaking (bool): If true, the solvers use symmetry breaking.
+        pruning (Optional[bool]): If true, placements that split off an unfillable region
+            are removed. By default this is done for planar goals.
+        incremental (bool): If true, one incremental Z3 solver is used for all goals.
+        propagate (bool): If true, the Z3 search is pruned by a RegionPropagator.
+        stats (Optional[SolveStats]): If given, statistics about the searches are stored in it.
+            The times of the phases are summed over the goals.
+        timeout (Optional[float]): The maximum number of seconds per goal.
+        forcing (bool): If true, the forced placements are committed before solving, see ForcedPlacements.
+
+    Returns:
+        Iterator[Optional[List[Piece]]]: For each goal a solution, or None if no solution was found.
+    """
+    if stats is None:
+        stats = SolveStats()
+    if incremental:
+        if backend not in ['auto', 'z3'] or encoding != 'bool':
+            raise ValueError('Incremental solving requires the z3 backend and the bool encoding')
+        if propagate:
+            raise ValueError('Incremental solving does not support the RegionPropagator')
+        yield from solve_goals_incremental(pieces, goals, symmetry_breaking, pruning, stats, timeout)
+        return
+    rotations = [normalized_rotations(sorted(set(piece))) for piece in pieces]
+    for goal in goals:
+        if sum(len(set(piece)) for piece in pieces) != len(goal):
+            print('The size of the goal does not match with the pieces')
+            yield None
+            continue
+        with stats.phase('placements'):
+            index = PlacementIndex(pieces, goal, symmetry_breaking, pruning, rotations)
+        yield solve_puzzle(pieces, goal, backend, encoding, index=index, propagate=propagate, stats=stats, timeout=timeout, forcing=forcing)
+
+
+def solve_goals_incremental(pieces: List[Piece], goals: List[Piece], symmetry_breaking: bool = False, pruning: Optional[bool] = None, stats: Optional[SolveStats] = None, timeout: Optional[float] = None) -> Iterator[Optional[List[Piece]]]:
+    """
+    Solves a puzzle for several goals using one incremental Z3 solver with the bool
+    encoding. The placements of the pieces are computed once inside the union of the
+    goals, and the constraints that don't depend on the goal are shared: each piece has
+    exactly one placement, and each position is covered at most once. For each goal a
+    selector literal excludes the placements that are not in the placement index of the
+    goal, and the solver is called with that literal as assumption, and requires that
+    the positions of the goal are covered. Hence, lemmas that the solver learns for one
+    goal are reused for the next ones. On the other hand, the solver has to deal with
+    the placements inside all goals. The result for each goal is printed like in
+    solve_puzzle.
+
+    Args:
+        pieces (List[Piece]): The pieces of the puzzle.
+        goals (List[Piece]): The goals, in the same coordinate system.
+        symmetry_breaking (bool): If true, the placements of the anchor piece of each goal
+            are restricted like in its PlacementIndex.
+        pruning (Optional[bool]): If true, placements that split off an unfillable region
+            of a goal are excluded as well. By default this is done for planar goals.
+        stats (Optional[SolveStats]): If given, the times of the phases are summed in it.
+        timeout (Optional[float]): The maximum number of seconds per goal.
+
+    Returns:
+        Iterator[Optional[List[Piece]]]: For each goal a solution, or None if no solution was found.
+    """
+    if stats is None:
+        stats = SolveStats()
+    universe = sorted(set(pos for goal in goals for pos in goal))
+    with stats.phase('placements'):
+        index = PlacementIndex(pieces, universe)
+    rotations = [normalized_rotations(sorted(set(piece))) for piece in pieces]
+    variables = [z3.Bool(f'p_{i}_{k}') for k, (i, mask) in enumerate(index.placements)]
+    with stats.phase('constraints'):
+        solver = z3.Solver()
+        solver.add([z3.PbEq([(variables[k], 1) for k in placements], 1) for placements in index.piece_placements])
+        solver.add([z3.PbLe([(variables[k], 1) for k in placements], 1) for placements in index.cell_placements if len(placements) > 1])
+
+    for n, goal in enumerate(goals):
+        if sum(index.sizes) != len(goal):
+            print('The size of the goal does not match with the pieces')
+            yield None
+            continue
+        deadline = Deadline(timeout)
+        goal_mask = index.mask(goal)
+        with stats.phase('placements'):
+            goal_index = PlacementIndex(pieces, goal, symmetry_breaking, pruning, rotations)
+        allowed = [set(goal_index.placements[k][1] for k in placements) for placements in goal_index.piece_placements]
+        selector = z3.Bool(f'goal_{n}')
+        with stats.phase('constraints'):
+            for k, (i, mask) in enumerate(index.placements):
+                if mask & ~goal_mask or goal_index.mask(index.positions(mask)) not in allowed[i]:
+                    solver.add(z3.Implies(selector, z3.Not(variables[k])))
+            for pos in goal:
+                solver.add(z3.Implies(selector, z3.Or([variables[k] for k in index.cell_placements[index.cells[pos]]])))
+
+        remaining = deadline.remaining()
+        if remaining is not None:
+            solver.set(timeout=max(1, int(remaining * 1000)))
+        with stats.phase('solve'), deadline.interruptible(solver.ctx):
+            check = solver.check(selector) if not deadline.expired() else z3.unknown
+        if check == z3.sat:
+            result = SolveResult('solved', decode_model(solver.model(), variables, pieces, index, 'bool'))
+        else:
+            result = SolveResult('unsolvable' if check == z3.unsat else 'unknown')
+        print_result(result)
+        yield result.solution
+
+
+def print_piece(piece: Piece) -> str:
+    return '   '.join(f'{x} {y} {z}' for (x, y, z) in piece)
+
+
+def save_puzzle(path: Path, pieces: List[Piece]) -> None:
+    """
+    Writes pieces to a file. If the file name ends with '.blk' a PieceContainer is
+    written, and otherwise the text format.
+    """
+    if path.suffix == PieceContainer.SUFFIX:
+        PieceContainer.write(path, [pieces])
+        return
+    text = '\n'.join(print_piece(piece) for piece in pieces)
+    path.write_text(text)
+
+
+def save_solutions(path: Path, solutions: Iterator[List[Piece]]) -> int:
+    """
+    Writes solutions to a file while they are generated. Each line contains one
+    solution, in which the pieces are separated by a '|' character. If the file name
+    ends with '.blk', a PieceContainer with a group per solution is written instead.
+
+    Returns:
+        int: The number of solutions.
+    """
+    if path.suffix == PieceContainer.SUFFIX:
+        return PieceContainer.write(path, solutions)
+    count = 0
+    with path.open('w') as f:
+        for solution in solutions:
+            f.write('   |   '.join(print_piece(piece) for piece in solution) + '\n')
+            count += 1
+    return count
+
+
+def load_solutions(filename: str) -> Iterator[List[Piece]]:
+    """
+    Reads the solutions from a file that was written by save_solutions.
+    """
+    if PieceContainer.is_container(filename):
+        with PieceContainer(filename) as container:
+            yield from container
+        return
+    with open(filename) as f:
+        for line in f:
+            if line.strip():
+                yield parse_pieces(line.replace('|', '\n'))
+
+
+def draw_pieces(path: Path, pieces: List[Piece], grid: bool, scatter: float = 0, merge: bool = False, colors: Optional[List[RGB]] = None):
+    if colors is None:
+        colors = parse_colors(COLORS)
+    with path.open('w') as f:
+        write_vrml(f, pieces, colors, grid, scatter, merge)
+
+
+def save_solution(wrl_path: Path, solution: List[Piece], merge: bool = False) -> None:
+    """
+    Saves a solution in VRML format, and its coordinates to a text file with the same name.
+    """
+    print(f"Saving solution to file '{wrl_path}'")
+    draw_pieces(wrl_path, solution, False, merge=merge)
+    solution_path = wrl_path.with_suffix('.txt')
+    print(f"Saving solution coordinates to file '{solution_path}'")
+    save_puzzle(solution_path, solution)
+
+
+class SolverConfig(NamedTuple):
+    """
+    A configuration of a solver in a portfolio.
+
+    Attributes:
+        backend (str): The solver backend, 'z3' or 'dlx'.
+        encoding (str): The encoding of the Z3 model, 'int' or 'bool'.
+        seed (int): The random seed. If it is non-zero, the order of the pieces and
+            of the goal positions is shuffled as well.
+        logic (str): The logic passed to z3.SolverFor, or the empty string for the default solver.
+    """
+    backend: str
+    encoding: str = 'int'
+    seed: int = 0
+    logic: str = ''
+
+    def __str__(self):
+        text = f'{self.backend}' if self.backend == 'dlx' else f'{self.backend}:{self.encoding}'
+        if self.logic:
+            text += f':{self.logic}'
+        return f'{text} seed={self.seed}'
+
+
+def portfolio_configs(n: int) -> List[SolverConfig]:
+    """
+    Returns n different solver configurations.
+    """
+    configs = [SolverConfig('dlx'), SolverConfig('z3', 'bool', logic='QF_FD'), SolverConfig('z3', 'bool'), SolverConfig('z3', 'int')]
+    return [configs[k % len(configs)]._replace(seed=k // len(configs)) for k in range(n)]
+
+
+def solve_with_config(pieces: List[Piece], goal: Piece, config: SolverConfig, symmetry_breaking: bool = False) -> Optional[List[Piece]]:
+    """
+    Solves a puzzle using the given solver configuration.
+    """
+    order = list(range(len(pieces)))
+    goal = list(goal)
+    if config.seed:
+        generator = random.Random(config.seed)
+        generator.shuffle(order)
+        generator.shuffle(goal)
+    shuffled_pieces = [pieces[i] for i in order]
+
+    index = PlacementIndex(shuffled_pieces, goal, symmetry_breaking, None)
+    if config.backend == 'dlx':
+        solution = solve_exact_cover(shuffled_pieces, goal, index)
+    else:
+        solver = z3.SolverFor(config.logic) if config.logic else z3.Solver()
+        solver.set(random_seed=config.seed)
+        variables, _ = add_puzzle(solver, shuffled_pieces, goal, index, config.encoding)
+        solution = None
+        if solver.check() == z3.sat:
+            solution = decode_model(solver.model(), variables, shuffled_pieces, index, config.encoding)
+
+    if solution is None:
+        return None
+    result = [list() for piece in pieces]
+    for k, i in enumerate(order):
+        result[i] = solution[k]
+    return result
+
+
+def portfolio_worker(connection, pieces: List[Piece], goal: Piece, config: SolverConfig, symmetry_breaking: bool, settings: tuple) -> None:
+    apply_worker_settings(settings)
+    with contextlib.redirect_stdout(io.StringIO()):
+        solution = solve_with_config(pieces, goal, config, symmetry_breaking)
+    connection.send(solution)
+
+
+def solve_portfolio(pieces: List[Piece], goal: Piece, processes: int, symmetry_breaking: bool = False) -> Optional[List[Piece]]:
+    """
+    Solves a puzzle by running a portfolio of differently configured solvers in
+    separate processes. The answer of the first solver that finishes is returned,
+    and the other solvers are terminated. Since all solvers are complete, this
+    answer is definitive.
+
+    Args:
+        pieces (List[Piece]): The pieces of the puzzle.
+        goal (Piece): The goal of the puzzle.
+        processes (int): The number of solvers that are run in parallel.
+        symmetry_breaking (bool): If true, the solvers use symmetry breaking.
+
+    Returns:
+        Optional[List[Piece]]: For each piece its position in the goal, or None if there is no solution.
+    """
+    pieces_size = sum(len(piece) for piece in pieces)
+    if pieces_size != len(goal):
+        print('The size of the goal does not match with the pieces')
+        return None
+
+    context = multiprocessing.get_context()
+    workers = {}
+    for config in portfolio_configs(processes):
+        connection, child_connection = context.Pipe(duplex=False)
+        process = context.Process(target=portfolio_worker, args=(child_connection, pieces, goal, config, symmetry_breaking, worker_settings()), daemon=True)
+        process.start()
+        workers[connection] = (process, config)
+
+    try:
+        solution = None
+        while workers:
+            connection = multiprocessing.connection.wait(list(workers))[0]
+            process, config = workers.pop(connection)
+            try:
+                solution = connection.recv()
+            except EOFError:
+                print(f'The solver {config} failed')
+                continue
+            print(f'The solver {config} finished first')
+            break
+    finally:
+        for process, config in workers.values():
+            process.terminate()
+        for process, config in workers.values():
+            process.join()
+
+    if solution:
+        print_solution(solution)
+    else:
+        print('No solution possible')
+    return solution
+
+
+def split_cube(index: PlacementIndex, cube: List[int]) -> Optional[List[List[int]]]:
+    """
+    Splits the subproblem in which the placements of a cube are used. The goal position
+    with the fewest remaining placements is chosen, and for each of these placements a
+    new cube is returned. Since every solution covers that position with exactly one
+    placement, the new cubes partition the solutions of the cube.
+
+    Only placements of the first piece of each congruence class are used, like in the
+    exact cover problem of make_exact_cover; a cube may contain several of them.
+
+    Args:
+        index (PlacementIndex): The placements of the pieces.
+        cube (List[int]): Compatible placements of the index.
+
+    Returns:
+        Optional[List[List[int]]]: The new cubes, which is an empty list if the cube has no
+        solutions, or None if the cube covers the whole goal.
+    """
+    occupied = 0
+    used = {}
+    for k in cube:
+        i, mask = index.placements[k]
+        occupied |= mask
+        used[i] = used.get(i, 0) + 1
+    if occupied == (1 << len(index.goal)) - 1:
+        return None
+
+    best = None
+    for bit, placements in enumerate(index.cell_placements):
+        if occupied >> bit & 1:
+            continue
+        candidates = []
+        for k in placements:
+            i, mask = index.placements[k]
+            if index.congruent[i] == i and not mask & occupied and used.get(i, 0) < index.congruent.count(i):
+                candidates.append(k)
+        if best is None or len(candidates) < len(best):
+            best = candidates
+            if not best:
+                break
+    return [cube + [k] for k in best]
+
+
+def make_cubes(index: PlacementIndex, n: int) -> List[List[int]]:
+    """
+    Splits a puzzle into at least n cubes if possible, by repeatedly splitting all cubes
+    on their most constrained goal position. Cubes without solutions are dropped.
+    """
+    cubes = [[]]
+    while len(cubes) < n:
+        next_cubes = []
+        for cube in cubes:
+            split = split_cube(index, cube)
+            next_cubes.extend([cube] if split is None else split)
+        if next_cubes == cubes:
+            break
+        cubes = next_cubes
+    return cubes
+
+
+class CubeSolver(object):
+    """
+    Solves the subproblems (cubes) of a puzzle in a worker process of solve_cubes and count_cubes.
+    With the z3 backend the solver is created once, and each cube is added inside a push/pop scope.
+
+    Attributes:
+        pieces (List[Piece]): The pieces of the puzzle.
+        index (PlacementIndex): The placements of the pieces.
+        backend (str): The solver backend, 'z3' or 'dlx'.
+    """
+    def __init__(self, pieces: List[Piece], index: PlacementIndex, backend: str):
+        self.pieces = pieces
+        self.index = index
+        # The bitboard solver cannot start from the placements of a cube, so the exact cover solver is used instead
+        self.backend = backend = 'z3' if select_backend(backend, index.goal) == 'z3' else 'dlx'
+        if backend == 'z3':
+            self.solver = z3.Solver()
+            self.variables, _ = add_puzzle(self.solver, pieces, index.goal, index, 'bool')
+        else:
+            self.columns, self.rows, self.multiplicities = make_exact_cover(index)
+
+    def cube_constraints(self, cube: List[int]) -> List[z3.BoolRef]:
+        """
+        Returns constraints stating that the placements of a cube are used by one of the
+        pieces that are congruent to its piece. Congruent pieces have the same placements.
+        """
+        constraints = []
+        for k in cube:
+            i, mask = self.index.placements[k]
+            t = self.index.piece_placements[i].index(k)
+            members = [j for j, c in enumerate(self.index.congruent) if c == i]
+            constraints.append(z3.Or([self.variables[self.index.piece_placements[j][t]] for j in members]))
+        return constraints
+
+    def solutions(self, cube: List[int], deadline: Optional[Deadline] = None) -> Iterator[List[Piece]]:
+        """
+        Enumerates the canonical solutions that contain the placements of a cube. The
+        deadline is only used by the dlx backend; if it expires, TimeoutError is raised.
+        """
+        if self.backend == 'z3':
+            self.solver.push()
+            try:
+                self.solver.add(self.cube_constraints(cube))
+                while self.solver.check() == z3.sat:
+                    model = self.solver.model()
+                    solution = decode_model(model, self.variables, self.pieces, self.index, 'bool')
+                    if self.index.is_canonical(solution):
+                        yield solution
+                    self.solver.add(z3.Or([z3.Not(x) for x in self.variables if z3.is_true(model.evaluate(x))]))
+            finally:
+                self.solver.pop()
+        else:
+            # The columns are not restored when the deadline expires, so then a copy is searched
+            columns = self.columns if deadline is None else {j: set(rows) for j, rows in self.columns.items()}
+            for selected in exact_cover(columns, self.rows, self.multiplicities, cube, deadline):
+                solution = self.index.decode(selected)
+                if self.index.is_canonical(solution):
+                    yield solution
+
+    def solve_within(self, cube: List[int], timeout: float) -> Tuple[str, object]:
+        """
+        Searches a solution that contains the placements of a cube for at most timeout
+        seconds. If none is found in time, TimeoutError is raised.
+        """
+        if self.backend == 'z3':
+            self.solver.push()
+            try:
+                self.solver.add(self.cube_constraints(cube))
+                self.solver.set(timeout=max(1, int(timeout * 1000)))
+                result = self.solver.check()
+                if result == z3.sat:
+                    return 'sat', decode_model(self.solver.model(), self.variables, self.pieces, self.index, 'bool')
+                if result == z3.unsat:
+                    return 'unsat', None
+            finally:
+                self.solver.set(timeout=4294967295)
+                self.solver.pop()
+            raise TimeoutError
+        solution = next(self.solutions(cube, Deadline(timeout)), None)
+        return ('sat', solution) if solution else ('unsat', None)
+
+    def solve(self, cube: List[int], timeout: Optional[float]) -> Tuple[str, object]:
+        """
+        Searches a solution that contains the placements of a cube. The search is stopped
+        after timeout seconds, and the cube is split into smaller cubes.
+
+        Returns:
+            One of ('sat', solution), ('unsat', None) and ('split', cubes).
+        """
+        if timeout:
+            try:
+                return self.solve_within(cube, timeout)
+            except TimeoutError:
+                cubes = split_cube(self.index, cube)
+                # A cube that covers the whole goal cannot be split, so it is solved without a time limit
+                if cubes is not None:
+                    return 'split', cubes
+        solution = next(self.solutions(cube), None)
+        return ('sat', solution) if solution else ('unsat', None)
+
+
+def cube_worker(connection, pieces: List[Piece], index: PlacementIndex, backend: str, count: bool, timeout: Optional[float], settings: tuple) -> None:
+    apply_worker_settings(settings)
+    cube_solver = CubeSolver(pieces, index, backend)
+    for cube in iter(connection.recv, None):
+        if count:
+            connection.send(('count', sum(1 for _ in cube_solver.solutions(cube))))
+        else:
+            connection.send(cube_solver.solve(cube, timeout))
+
+
+def conquer_cubes(pieces: List[Piece], index: PlacementIndex, backend: str, processes: Optional[int], count: bool, cubes_per_process: int, timeout: Optional[float]) -> Iterator[Tuple[str, object]]:
+    """
+    Solves the cubes of a puzzle in worker processes, and generates the results in the
+    order in which they are finished. Cubes that are split by a worker are solved as well.
+    The workers are terminated as soon as the generator is closed.
+    """
+    processes = processes or os.cpu_count() or 1
+    context = multiprocessing.get_context()
+    pending = deque(make_cubes(index, processes * cubes_per_process))
+    workers = {}  # maps connections to [process, busy]
+    try:
+        for _ in range(min(processes, len(pending))):
+            connection, child_connection = context.Pipe()
+            process = context.Process(target=cube_worker, args=(child_connection, pieces, index, backend, count, timeout, worker_settings()), daemon=True)
+            process.start()
+            workers[connection] = [process, False]
+
+        while True:
+            for connection, worker in workers.items():
+                if not worker[1] and pending:
+                    worker[1] = True
+                    connection.send(pending.popleft())
+            busy = [connection for connection, worker in workers.items() if worker[1]]
+            if not busy:
+                break
+            for connection in multiprocessing.connection.wait(busy):
+                process, _ = workers[connection]
+                try:
+                    status, value = connection.recv()
+                except EOFError:
+                    process.join()
+                    raise RuntimeError(f'A cube worker process exited with code {process.exitcode}')
+                workers[connection][1] = False
+                if status == 'split':
+                    pending.extend(value)
+                yield status, value
+    finally:
+        for connection, (process, busy) in workers.items():
+            if busy:
+                process.terminate()
+            else:
+                connection.send(None)
+        for process, busy in workers.values():
+            process.join()
+
+
+def solve_cubes(pieces: List[Piece], goal: Piece, backend: str = 'z3', symmetry_breaking: bool = False, processes: Optional[int] = None, cubes_per_process: int = 4, timeout: Optional[float] = 10) -> Optional[List[Piece]]:
+    """
+    Solves a puzzle using cube-and-conquer. The puzzle is split into subproblems (cubes)
+    by choosing the goal position with the fewest placements, with one cube for each of
+    these placements. The cubes are split recursively until there are enough of them
+    for all processes, and they are solved in a pool of processes. A cube that is not
+    solved within timeout seconds is split further. The first
+    solution that is found is returned, and the other processes are terminated.
+
+    Args:
+        pieces (List[Piece]): The pieces of the puzzle.
+        goal (Piece): The goal of the puzzle.
+        backend (str): The solver backend, 'z3' (with encoding 'bool') or 'dlx'.
+        symmetry_breaking (bool): If true, the solvers use symmetry breaking.
+        processes (Optional[int]): The number of processes. By default the number of CPUs is used.
+        cubes_per_process (int): The minimal number of initial cubes per process.
+        timeout (Optional[float]): The number of seconds after which a cube is split further.
+
+    Returns:
+        Optional[List[Piece]]: For each piece its position in the goal, or None if there is no solution.
+    """
+    pieces_size = sum(len(piece) for piece in pieces)
+    if pieces_size != len(goal):
+        print('The size of the goal does not match with the pieces')
+        return None
+
+    index = PlacementIndex(pieces, goal, symmetry_breaking, None)
+    solution = None
+    for status, value in conquer_cubes(pieces, index, backend, processes, False, cubes_per_process, timeout):
+        if status == 'sat':
+            solution = value
+            break
+
+    if solution:
+        print_solution(solution)
+    else:
+        print('No solution possible')
+    return solution
+
+
+def count_cubes(pieces: List[Piece], goal: Piece, backend: str = 'z3', symmetry_breaking: bool = False, processes: Optional[int] = None, cubes_per_process: int = 4) -> int:
+    """
+    Counts the solutions of a puzzle using cube-and-conquer, see solve_cubes. Since the
+    cubes partition the solutions, the counts of the cubes are added.
+    """
+    if sum(len(piece) for piece in pieces) != len(goal):
+        return 0
+    index = PlacementIndex(pieces, goal, symmetry_breaking, None)
+    return sum(value for status, value in conquer_cubes(pieces, index, backend, processes, True, cubes_per_process, None))
+
+
+def batch_jobs(pieces_pattern: str, goal_pattern: str) -> List[Tuple[str, str]]:
+    """
+    Returns all combinations of a pieces file and a goal file matching the given glob
+    patterns, for which the total size of the pieces equals the size of the goal.
+    """
+    goals = [(path, len(load_pieces(path)[0])) for path in sorted(glob.glob(goal_pattern))]
+    jobs = []
+    for pieces_path in sorted(glob.glob(pieces_pattern)):
+        size = sum(len(piece) for piece in load_pieces(pieces_path))
+        jobs.extend((pieces_path, goal_path) for goal_path, goal_size in goals if goal_size == size)
+    return jobs
+
+
+def load_manifest(filename: str) -> List[Tuple[str, str]]:
+    """
+    Reads a manifest of batch jobs. Each line contains the name of a pieces file and
+    the name of a goal file, separated by whitespace. Lines starting with '#' are ignored.
+    """
+    lines = Path(filename).read_text().strip().split('\n')
+    return [tuple(line.split()) for line in lines if line.strip() and not line.startswith('#')]
+
+
+def run_batch_job(pieces_path: str, goal_path: str, backend: str, encoding: str, symmetry_breaking: bool) -> dict:
+    """
+    Solves one puzzle of a batch, and returns the result as a JSON compatible record.
+    """
+    record = {'pieces': pieces_path, 'goal': goal_path}
+    start = time.perf_counter()
+    try:
+        pieces = load_pieces(pieces_path)
+        goal = load_pieces(goal_path)[0]
+        reason = find_infeasibility(pieces, goal)
+        if reason is None:
+            index = PlacementIndex(pieces, goal, symmetry_breaking, None)
+            record['placements'] = [len(placements) for placements in index.piece_placements]
+            result = find_solution(pieces, goal, index, backend, encoding, checked=True)
+            reason = result.reason
+        else:
+            result = SolveResult('unsolvable')
+        record['status'] = result.status
+        record['solution'] = [list(piece) for piece in result.solution] if result.solution else None
+        if reason:
+            record['reason'] = reason
+    except Exception as e:
+        record['status'] = 'error'
+        record['error'] = str(e)
+    record['seconds'] = time.perf_counter() - start
+    return record
+
+
+def batch_worker(connection, backend: str, encoding: str, symmetry_breaking: bool, settings: tuple) -> None:
+    apply_worker_settings(settings)
+    for pieces_path, goal_path in iter(connection.recv, None):
+        connection.send(run_batch_job(pieces_path, goal_path, backend, encoding, symmetry_breaking))
+
+
+def run_batch(jobs: List[Tuple[str, str]], backend: str = 'z3', encoding: str = 'int', symmetry_breaking: bool = False, processes: Optional[int] = None, timeout: Optional[float] = None) -> Iterator[dict]:
+    """
+    Solves a batch of puzzles in a pool of worker processes. The results are generated
+    in the order in which the jobs finish. A worker that exceeds the time limit is
+    terminated and replaced by a new one, and so is a worker that crashes, in which
+    case an error record is generated for its job.
+
+    Args:
+        jobs (List[Tuple[str, str]]): The names of the pieces and goal files of the puzzles.
+        backend (str): The solver backend, 'z3', 'dlx', 'bitboard', 'sat' or 'auto', see select_backend.
+        encoding (str): The encoding of the Z3 model, 'int' or 'bool'.
+        symmetry_breaking (bool): If true, the solvers use symmetry breaking.
+        processes (Optional[int]): The number of worker processes. By default the number of CPUs is used.
+        timeout (Optional[float]): The maximum number of seconds per job.
+
+    Returns:
+        Iterator[dict]: A record for each job, with its status, the number of seconds, the
+        number of placements of each piece and the solution.
+    """
+    context = multiprocessing.get_context()
+    pending = deque(jobs)
+    processes = min(processes or os.cpu_count() or 1, len(jobs))
+    workers = {}  # maps connections to [process, job, start time]
+
+    def start_worker():
+        connection, child_connection = context.Pipe()
+        process = context.Process(target=batch_worker, args=(child_connection, backend, encoding, symmetry_breaking, worker_settings()), daemon=True)
+        process.start()
+        workers[connection] = [process, None, None]
+
+    for _ in range(processes):
+        start_worker()
+
+    try:
+        while True:
+            for connection, worker in workers.items():
+                if worker[1] is None and pending:
+                    worker[1] = pending.popleft()
+                    worker[2] = time.perf_counter()
+                    connection.send(worker[1])
+            busy = [connection for connection, worker in workers.items() if worker[1] is not None]
+            if not busy:
+                break
+
+            wait_time = None
+            if timeout is not None:
+                wait_time = max(0.0, min(workers[connection][2] + timeout for connection in busy) - time.perf_counter())
+            for connection in multiprocessing.connection.wait(busy, wait_time):
+                process, job, start = workers[connection]
+                try:
+                    record = connection.recv()
+                except EOFError:
+                    # The worker crashed, for example because it ran out of memory
+                    process.join()
+                    del workers[connection]
+                    yield {'pieces': job[0], 'goal': job[1], 'status': 'error', 'error': f'The worker process exited with code {process.exitcode}', 'seconds': time.perf_counter() - start}
+                    if pending:
+                        start_worker()
+                    continue
+                workers[connection][1] = None
+                yield record
+
+            if timeout is not None:
+                now = time.perf_counter()
+                for connection, (process, job, start) in list(workers.items()):
+                    if job is not None and now - start >= timeout:
+                        process.terminate()
+                        process.join()
+                        del workers[connection]
+                        yield {'pieces': job[0], 'goal': job[1], 'status': 'timeout', 'seconds': now - start}
+                        if pending:
+                            start_worker()
+    finally:
+        for connection, (process, job, start) in workers.items():
+            if job is None:
+                connection.send(None)
+            else:
+                process.terminate()
+            process.join()
+
+
+class SolverService(object):
+    """
+    Answers the requests of a long running solver process, see serve_stream and serve_socket.
+    Since the process stays alive, Z3 is loaded only once, and the pieces that have been
+    read and the placement indices that have been computed are kept in memory. Both caches
+    are bounded: if one of them is full, its least recently used entry is evicted. Files are
+    identified by their name, modification time and size, so changed files are read again.
+
+    A request is a JSON object with a 'command' and the settings of the corresponding
+    command line options, for example
+
+        {"id": 1, "command": "solve", "pieces": "puzzles/pentomino.txt", "goal": "goals/6x10x1.txt", "backend": "dlx"}
+
+    The commands are 'solve', 'draw', 'transform', 'export' (the SMT format of --smt, or with
+    'format': 'dimacs' the CNF format of --dimacs) and 'cancel', which stops the request with
+    the id given by 'target'. The answer contains the same 'id', a 'status' and the number of
+    'seconds', and for 'solve' also the 'reason', the 'placements' of each piece and the
+    'solution', like the records of run_batch. The requests other than 'cancel' need an 'id'
+    that differs from the ids of the pending requests of the same connection, and a cancel
+    request only stops requests of its own connection.
+
+    Attributes:
+        max_entries (int): The maximum number of entries of each cache.
+        pieces (OrderedDict): Maps file keys to the pieces in the file.
+        indices (OrderedDict): Maps the file keys and settings of a puzzle to its PlacementIndex.
+        deadlines (Dict[Tuple[Hashable, Hashable], Deadline]): The deadlines of the requests that
+            have not been answered yet, by connection and id.
+        hits (int): The number of cache hits.
+        misses (int): The number of cache misses.
+    """
+    COMMANDS = ['solve', 'draw', 'transform', 'export', 'cancel']
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self.pieces: OrderedDict = OrderedDict()
+        self.indices: OrderedDict = OrderedDict()
+        self.deadlines: Dict[Tuple[Hashable, Hashable], Deadline] = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _cached(self, cache: OrderedDict, key: Hashable, compute):
+        if key in cache:
+            self.hits += 1
+            cache.move_to_end(key)
+            return cache[key]
+        self.misses += 1
+        value = cache[key] = compute()
+        if len(cache) > self.max_entries:
+            cache.popitem(last=False)
+        return value
+
+    @staticmethod
+    def file_key(filename: str) -> Tuple[str, int, int]:
+        status = os.stat(filename)
+        return str(Path(filename).resolve()), status.st_mtime_ns, status.st_size
+
+    def load(self, filename: str) -> List[Piece]:
+        """
+        Returns the pieces in a file, see load_pieces.
+        """
+        return self._cached(self.pieces, self.file_key(filename), lambda: load_pieces(filename))
+
+    def placement_index(self, pieces_file: str, goal_file: str, symmetry_breaking: bool = False, pruning: Optional[bool] = False) -> PlacementIndex:
+        """
+        Returns the placements of the pieces in pieces_file inside the goal in goal_file.
+        """
+        key = (self.file_key(pieces_file), self.file_key(goal_file), symmetry_breaking, pruning)
+        return self._cached(self.indices, key, lambda: PlacementIndex(self.load(pieces_file), self.load(goal_file)[0], symmetry_breaking, pruning))
+
+    def submit(self, line: str, write, executor: concurrent.futures.Executor, connection: Hashable = None) -> Optional[concurrent.futures.Future]:
+        """
+        Handles a request, given as a line of JSON, asynchronously in the executor, and passes
+        the answer to write. Cancel requests and invalid requests are answered immediately.
+        The connection identifies the client, so that clients can use the same ids.
+        """
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('A request must be a JSON object')
+        except ValueError as e:
+            write({'id': None, 'status': 'error', 'error': str(e)})
+            return None
+        if request.get('command') == 'cancel':
+            write(self.handle(request, connection))
+            return None
+        request_id = request.get('id')
+        if not isinstance(request_id, (int, float, str)):
+            write({'id': None, 'status': 'error', 'error': "A request needs an 'id', which is a number or a string"})
+            return None
+        key = (connection, request_id)
+        with self.lock:
+            pending = key in self.deadlines
+            if not pending:
+                self.deadlines[key] = Deadline(request.get('timeout'))
+        if pending:
+            write({'id': request_id, 'status': 'error', 'error': f'A request with id {request_id!r} is still pending'})
+            return None
+        return executor.submit(lambda: write(self.handle(request, connection)))
+
+    def handle(self, request: dict, connection: Hashable = None) -> dict:
+        """
+        Handles a request of a connection, and returns the answer.
+        """
+        answer = {'id': request.get('id')}
+        command = request.get('command')
+        key = (connection, request.get('id'))
+        start = time.perf_counter()
+        try:
+            if command not in self.COMMANDS:
+                raise ValueError(f"Unknown command '{command}'")
+            # Messages are written to standard error, since standard output may contain the answers
+            with contextlib.redirect_stdout(sys.stderr):
+                if command == 'cancel':
+                    answer.update(self.cancel(request, connection))
+                elif command == 'solve':
+                    with self.lock:
+                        deadline = self.deadlines.get(key)
+                    answer.update(self.solve(request, deadline))
+                else:
+                    answer.update(getattr(self, command)(request))
+        except Exception as e:
+            answer['status'] = 'error'
+            answer['error'] = str(e)
+        finally:
+            if command != 'cancel':
+                with self.lock:
+                    self.deadlines.pop(key, None)
+        answer['seconds'] = time.perf_counter() - start
+        return answer
+
+    def solve(self, request: dict, deadline: Optional[Deadline] = None) -> dict:
+        pieces = self.load(request['pieces'])
+        goal = self.load(request['goal'])[0]
+        if deadline is None:
+            deadline = Deadline(request.get('timeout'))
+        reason = find_infeasibility(pieces, goal)
+        if reason is None:
+            index = self.placement_index(request['pieces'], request['goal'], request.get('symmetry_breaking', True), request.get('pruning'))
+            result = find_solution(pieces, goal, index, request.get('backend', 'auto'), request.get('encoding', 'int'), deadline=deadline, forcing=request.get('forcing', True), checked=True)
+        else:
+            index = None
+            result = SolveResult('unsolvable', reason=reason)
+        answer = {'status': result.status}
+        if result.reason:
+            answer['reason'] = result.reason
+        if index is not None:
+            answer['placements'] = [len(placements) for placements in index.piece_placements]
+        answer['solution'] = [list(piece) for piece in result.solution] if result.solution else None
+        if result.solution and request.get('output'):
+            save_solution(Path(request['output']), result.solution, request.get('merge', False))
+        return answer
+
+    def draw(self, request: dict) -> dict:
+        pieces = self.load(request['pieces'])
+        path = Path(request.get('output') or Path(request['pieces']).with_suffix('.wrl'))
+        draw_pieces(path, pieces, request.get('grid', False), request.get('scatter', 0), request.get('merge', False))
+        return {'status': 'ok', 'output': str(path)}
+
+    def transform(self, request: dict) -> dict:
+        index = self.placement_index(request['pieces'], request['goal'])
+        folder = Path(request.get('output', '.'))
+        colors = parse_colors(COLORS)
+        outputs = []
+        for i in range(len(index.piece_placements)):
+            path = folder / f'{Path(request["pieces"]).stem}-{i}.wrl'
+            draw_pieces(path, index.orientations(i), True, merge=request.get('merge', False), colors=[colors[i % len(colors)]])
+            outputs.append(str(path))
+        return {'status': 'ok', 'orientations': [len(placements) for placements in index.piece_placements], 'outputs': outputs}
+
+    def export(self, request: dict) -> dict:
+        pieces = self.load(request['pieces'])
+        goal = self.load(request['goal'])[0]
+        index = self.placement_index(request['pieces'], request['goal'], request.get('symmetry_breaking', True), request.get('pruning'))
+        if request.get('format') == 'dimacs':
+            path = Path(request.get('output') or f'{Path(request["pieces"]).stem}-{Path(request["goal"]).stem}.cnf')
+            save_cnf(path, index, request.get('cardinality', 'sequential'))
+            return {'status': 'ok', 'output': str(path)}
+        solver = z3.Solver()
+        if add_puzzle(solver, pieces, goal, index, request.get('encoding', 'int')) is None:
+            raise ValueError('The size of the goal does not match with the pieces')
+        path = Path(request.get('output') or f'{Path(request["pieces"]).stem}-{Path(request["goal"]).stem}.smt')
+        path.write_text(solver.to_smt2())
+        return {'status': 'ok', 'output': str(path)}
+
+    def cancel(self, request: dict, connection: Hashable = None) -> dict:
+        with self.lock:
+            deadline = self.deadlines.get((connection, request.get('target')))
+        if deadline is None:
+            return {'status': 'error', 'error': f"There is no pending request with id {request.get('target')!r}"}
+        deadline.cancel()
+        return {'status': 'ok'}
+
+
+def serve_stream(service: SolverService, input: TextIO, output: TextIO) -> None:
+    """
+    Reads requests from input, one JSON object per line, and writes the answers to output
+    in the order in which they are finished. The requests are handled one at a time in a
+    separate thread, such that cancel requests are read while a puzzle is solved.
+    """
+    lock = threading.Lock()
+
+    def write(answer: dict) -> None:
+        with lock:
+            output.write(json.dumps(answer) + '\n')
+            output.flush()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        for line in input:
+            if line.strip():
+                service.submit(line, write, executor)
+
+
+def serve_socket(service: SolverService, path: str) -> None:
+    """
+    Accepts connections on a Unix domain socket, and handles the requests of each
+    connection like serve_stream. The requests of all connections share one worker thread,
+    while the ids of the requests are separate per connection.
+    Unix domain sockets are not available on Windows, in which case RuntimeError is raised.
+    """
+    if not hasattr(socketserver, 'ThreadingUnixStreamServer'):
+        raise RuntimeError('Unix domain sockets are not supported on this platform')
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            lock = threading.Lock()
+
+            def write(answer: dict) -> None:
+                with lock, contextlib.suppress(OSError):
+                    self.wfile.write((json.dumps(answer) + '\n').encode())
+                    self.wfile.flush()
+
+            futures = [service.submit(line.decode(), write, executor, self) for line in self.rfile if line.strip()]
+            concurrent.futures.wait([future for future in futures if future is not None])
+
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+    with socketserver.ThreadingUnixStreamServer(path, Handler) as server:
+        try:
+            server.serve_forever()
+        finally:
+            executor.shutdown(cancel_futures=True)
+            os.unlink(path)
+
+
+def main():
+    cmdline_parser = argparse.ArgumentParser()
+    cmdline_parser.add_argument('--pieces', type=str, help='A file containing pieces. Each line contains a piece')
+    cmdline_parser.add_argument('--goal', type=str, help='A file containing the coordinates of a 3D object. It is the goal of a puzzle. With --solve it can be a glob pattern, to solve the puzzle for several goals')
+    cmdline_parser.add_argument('--make-cube', type=str, help="A string like '4x4x4'. Writes the positions of a cube to a file. If the --output file name ends with '.blk', the binary format is used")
+    cmdline_parser.add_argument('--output', type=str, help='A filename')
+    cmdline_parser.add_argument('--draw', help='Draws the pieces in VRML format to the given output file', action='store_true')
+    cmdline_parser.add_argument('--grid', help='Scatters the pieces to a grid when drawing them', action='store_true')
+    cmdline_parser.add_argument('--scatter', type=float, default=0, help='Moves the pieces away from the center of gravity')
+    cmdline_parser.add_argument('--merge', help='Draws the cubes of each piece as one surface, without the sides between cubes', action='store_true')
+    cmdline_parser.add_argument('--solve', help='Solves a puzzle. The specified pieces are fitted into the goal', action='store_true')
+    cmdline_parser.add_argument('--smt', help='Save the problem in .smt format', action='store_true')
+    cmdline_parser.add_argument('--dimacs', help='Save the problem as a CNF formula in DIMACS format, with a variable for each placement', action='store_true')
+    cmdline_parser.add_argument('--all', help='Saves all solutions of a puzzle to a file, one solution per line', action='store_true')
+    cmdline_parser.add_argument('--count', help='Counts the solutions of a puzzle', action='store_true')
+    cmdline_parser.add_argument('--frontier', help='With --count, counts the solutions without enumerating them, using dynamic programming over the empty positions at the frontier of the filled part of the goal. This is much faster for goals that are thin in all but one direction', action='store_true')
+    cmdline_parser.add_argument('--frontier-cache', type=int, default=FRONTIER_CACHE_SIZE, help='The maximum number of states that are cached by --frontier, or 0 for no limit')
+    cmdline_parser.add_argument('--transform', help='Draws the transformed pieces to the given output file', action='store_true')
+    cmdline_parser.add_argument('--backend', type=str, choices=['auto', 'z3', 'dlx', 'bitboard', 'sat'], default='auto', help='The solver that is used for solving a puzzle: the Z3 solver, the exact cover solver, the bitboard solver, or the SAT solver of --sat-solver. By default the bitboard solver is used for planar goals, and Z3 otherwise')
+    cmdline_parser.add_argument('--sat-solver', type=str, default='pysat', help="The SAT solver of the sat backend: 'pysat' or 'pysat:<name>' for a solver of the python-sat package, or the command line of a DIMACS solver like 'kissat -q', to which the name of the formula file is appended")
+    cmdline_parser.add_argument('--cardinality', type=str, choices=CARDINALITY_ENCODINGS, default='sequential', help='The encoding of the exactly-one constraints of the CNF formula of --dimacs and the sat backend. The pairwise encoding is quadratic in the number of placements of a goal position')
+    cmdline_parser.add_argument('--encoding', type=str, choices=['int', 'bool'], help='The encoding of the Z3 model: an integer variable per goal position, or a boolean variable per placement. By default the int encoding is used, and the bool encoding with --incremental')
+    cmdline_parser.add_argument('--no-symmetry-breaking', help='Disables the removal of solutions that are symmetric to another one', action='store_true')
+    cmdline_parser.add_argument('--pruning', action=argparse.BooleanOptionalAction, help='Enables or disables the removal of placements that split off a region of the goal that cannot be filled. By default it is enabled for planar goals')
+    cmdline_parser.add_argument('--no-forcing', help='Disables committing the placements that are forced, and removing the placements that make another piece or a neighboring goal position uncoverable, before solving', action='store_true')
+    cmdline_parser.add_argument('--propagate', help='Prunes the Z3 search by checking the empty regions of the goal whenever a placement is chosen', action='store_true')
+    cmdline_parser.add_argument('--stats', nargs='?', const='text', choices=['text', 'json'], help="Prints statistics about solving a puzzle: the time per phase, the numbers of rotations, placements and constraints, the peak memory and the Z3 statistics. With '--stats=json' they are printed in JSON format")
+    cmdline_parser.add_argument('--incremental', help='When solving a puzzle for several goals, one incremental Z3 solver is shared between them', action='store_true')
+    cmdline_parser.add_argument('--batch', help="Solves a batch of puzzles in parallel. The jobs are read from --manifest, or are all matching combinations of the glob patterns --pieces and --goal. One JSON record per job is written to --output, or to standard output", action='store_true')
+    cmdline_parser.add_argument('--manifest', type=str, help='A file containing batch jobs. Each line contains a pieces file and a goal file')
+    cmdline_parser.add_argument('--jobs', type=int, help='The number of processes used for a batch or with --split. By default the number of CPUs is used')
+    cmdline_parser.add_argument('--split', help='Solves or counts using cube-and-conquer: the puzzle is split into subproblems on the goal positions with the fewest placements, which are solved in parallel', action='store_true')
+    cmdline_parser.add_argument('--split-timeout', type=float, default=10, help='With --split, a subproblem that is not solved within this number of seconds is split further')
+    cmdline_parser.add_argument('--timeout', type=float, help='The maximum number of seconds for solving a puzzle, for enumerating or counting its solutions, or for each puzzle in a batch. If it is exceeded, the puzzle is reported as unknown instead of unsolvable')
+    cmdline_parser.add_argument('--escalate', help='Solves a puzzle by trying the exact cover solver, the boolean and the integer Z3 encoding one after another, each with a part of the remaining --timeout, which is required', action='store_true')
+    cmdline_parser.add_argument('--cache-dir', type=str, help='A folder in which the placements of pieces are cached between runs')
+    cmdline_parser.add_argument('--cache-size', type=int, default=100, help='The maximum size of the placement cache in megabytes')
+    cmdline_parser.add_argument('--serve', help='Starts a server that reads requests from standard input, one JSON object per line, and writes the answers to standard output. Z3, the pieces and the placements are kept in memory between requests', action='store_true')
+    cmdline_parser.add_argument('--socket', type=str, help='With --serve, the requests are read from connections to a Unix domain socket with this name instead')
+    cmdline_parser.add_argument('--serve-cache', type=int, default=32, help='With --serve, the maximum number of piece files and placement indices that are kept in memory')
+    cmdline_parser.add_argument('--threads', type=int, default=1, help='The number of processes used for solving a puzzle. If it is more than one, a portfolio of differently configured solvers is run in parallel')
+    args = cmdline_parser.parse_args()
+    stats = SolveStats()
+
+    if args.timeout is not None and (args.split or args.threads > 1):
+        cmdline_parser.error('--timeout cannot be combined with --split or --threads; with --split, --split-timeout limits the time per subproblem')
+    if args.stats and (args.split or args.threads > 1):
+        cmdline_parser.error('--stats cannot be combined with --split or --threads, since the puzzle is then solved in other processes')
+    if args.incremental and (args.backend not in ['auto', 'z3'] or args.encoding == 'int'):
+        cmdline_parser.error('--incremental shares one Z3 solver with the bool encoding between the goals, so it cannot be combined with another backend or with --encoding=int')
+    if args.escalate and args.timeout is None:
+        cmdline_parser.error('--escalate requires --timeout, since each configuration gets a part of it')
+    if args.incremental and args.propagate:
+        cmdline_parser.error('--incremental cannot be combined with --propagate')
+    if args.solve and len(glob.glob(args.goal)) > 1 and (args.split or args.threads > 1 or args.escalate or args.output):
+        cmdline_parser.error('--split, --threads, --escalate and --output cannot be used when --goal matches several files; the solution for each goal is saved to its own file')
+    if args.encoding is None:
+        args.encoding = 'bool' if args.incremental else 'int'
+
+    if args.cache_dir:
+        global placement_cache
+        placement_cache = PlacementCache(Path(args.cache_dir), args.cache_size * 1_000_000)
+
+    global sat_solver
+    sat_solver = SatSolver(args.sat_solver, args.cardinality)
+
+    if args.socket and not hasattr(socketserver, 'ThreadingUnixStreamServer'):
+        cmdline_parser.error('--socket is not supported on Windows, since it has no Unix domain sockets; without --socket, --serve reads the requests from standard input')
+
+    if args.serve:
+        service = SolverService(args.serve_cache)
+        if args.socket:
+            serve_socket(service, args.socket)
+        else:
+            serve_stream(service, sys.stdin, sys.stdout)
+
+    if args.draw:
+        pieces = load_pieces(args.pieces)
+        path = Path(args.pieces).with_suffix('.wrl')
+        print(f"Saving pieces to file '{path}'")
+        draw_pieces(path, pieces, args.grid, args.scatter, args.merge)
+
+    if args.make_cube:
+        X, Y, Z = map(int, args.make_cube.split('x'))
+        if not args.output:
+            args.output = f'goals/{args.make_cube}.txt'
+        print(f"Saving {args.make_cube} cube to file '{args.output}'")
+        save_puzzle(Path(args.output), [cube_positions(X, Y, Z)])
+
+    if args.smt:
+        pieces = load_pieces(args.pieces)
+        goal = load_pieces(args.goal)[0]
+        index = PlacementIndex(pieces, goal, not args.no_symmetry_breaking, args.pruning)
+        solver = z3.Solver()
+        add_puzzle(solver, pieces, goal, index, args.encoding)
+        text = solver.to_smt2()
+        path = Path(f'{Path(args.pieces).stem}-{Path(args.goal).stem}.smt')
+        print(f"Saving SMT formula to file '{path}'")
+        path.write_text(text)
+
+    if args.dimacs:
+        pieces = load_pieces(args.pieces)
+        goal = load_pieces(args.goal)[0]
+        index = PlacementIndex(pieces, goal, not args.no_symmetry_breaking, args.pruning)
+        path = Path(f'{Path(args.pieces).stem}-{Path(args.goal).stem}.cnf')
+        print(f"Saving CNF formula to file '{path}'")
+        save_cnf(path, index, args.cardinality)
+
+    if args.solve and len(glob.glob(args.goal)) > 1:
+        pieces = load_pieces(args.pieces)
+        goal_paths = sorted(glob.glob(args.goal))
+        goals = [load_pieces(path)[0] for path in goal_paths]
+        solutions = solve_goals(pieces, goals, args.backend, args.encoding, not args.no_symmetry_breaking, args.pruning, args.incremental, args.propagate, stats, args.timeout, not args.no_forcing)
+        for goal_path, solution in zip(goal_paths, solutions):
+            if solution:
+                save_solution(Path(f'{Path(args.pieces).stem}-{Path(goal_path).stem}.wrl'), solution, args.merge)
+
+    elif args.solve:
+        pieces = load_pieces(args.pieces)
+        goal = load_pieces(args.goal)[0]
+        if args.split:
+            solution = solve_cubes(pieces, goal, args.backend, not args.no_symmetry_breaking, args.jobs, timeout=args.split_timeout)
+        elif args.threads > 1:
+            solution = solve_portfolio(pieces, goal, args.threads, not args.no_symmetry_breaking)
+        elif args.escalate:
+            result = solve_with_budget(pieces, goal, args.backend, args.encoding, not args.no_symmetry_breaking, args.timeout, escalate=True, pruning=args.pruning, stats=stats)
+            print_result(result)
+            solution = result.solution
+        else:
+            solution = solve_puzzle(pieces, goal, args.backend, args.encoding, not args.no_symmetry_breaking, pruning=args.pruning, propagate=args.propagate, stats=stats, timeout=args.timeout, forcing=not args.no_forcing)
+        if solution:
+            save_solution(Path(args.output) if args.output else Path(f'{Path(args.pieces).stem}-{Path(args.goal).stem}.wrl'), solution, args.merge)
+
+    if args.all:
+        pieces = load_pieces(args.pieces)
+        goal = load_pieces(args.goal)[0]
+        path = Path(args.output) if args.output else Path(f'{Path(args.pieces).stem}-{Path(args.goal).stem}-all.txt')
+        print(f"Saving all solutions to file '{path}'")
+        deadline = Deadline(args.timeout)
+        count = save_solutions(path, until_timeout(enumerate_solutions(pieces, goal, args.backend, args.encoding, not args.no_symmetry_breaking, args.pruning, args.propagate, stats, not args.no_forcing, deadline)))
+        print(f'Found {count} solutions')
+        if deadline.expired():
+            print('The time limit was reached, so there may be more solutions')
+
+    if args.count:
+        pieces = load_pieces(args.pieces)
+        goal = load_pieces(args.goal)[0]
+        deadline = Deadline(args.timeout)
+        if args.split:
+            count = count_cubes(pieces, goal, args.backend, not args.no_symmetry_breaking, args.jobs)
+        elif args.frontier:
+            try:
+                count = count_solutions(pieces, goal, not args.no_symmetry_breaking, args.pruning, stats, args.frontier_cache or None, deadline)
+            except TimeoutError:
+                count = None
+        else:
+            count = sum(1 for _ in until_timeout(enumerate_solutions(pieces, goal, args.backend, args.encoding, not args.no_symmetry_breaking, args.pruning, args.propagate, stats, not args.no_forcing, deadline)))
+        if count is None:
+            print('The solutions could not be counted within the time limit')
+        else:
+            print(f'Found {count} solutions')
+            if deadline.expired():
+                print('The time limit was reached, so there may be more solutions')
+
+    if args.batch:
+        jobs = load_manifest(args.manifest) if args.manifest else batch_jobs(args.pieces, args.goal)
+        with (open(args.output, 'w') if args.output else contextlib.nullcontext(sys.stdout)) as f:
+            for record in run_batch(jobs, args.backend, args.encoding, not args.no_symmetry_breaking, args.jobs, args.timeout):
+                f.write(json.dumps(record) + '\n')
+                f.flush()
+
+    if args.transform:
+        pieces = load_pieces(args.pieces)
+        goal = load_pieces(args.goal)[0]
+        index = PlacementIndex(pieces, goal)
+        colors = parse_colors(COLORS)
+        for i in range(len(pieces)):
+            transformed_pieces = index.orientations(i)
+            filename = f'{Path(args.pieces).stem}-{i}.wrl'
+            print(f"Saving {len(transformed_pieces)} piece orientations to file '{filename}'")
+            draw_pieces(Path(filename), transformed_pieces, True, merge=args.merge, colors=[colors[i % len(colors)]])
+
+    if args.stats and stats.phases:
+        print(json.dumps(stats.to_dict()) if args.stats == 'json' else stats)
+
+    if placement_cache is not None:
+        print(placement_cache)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+# Copyright 2024 Wieger Wesselink + Huub van de Wetering.
+# Distributed under the Boost Software License, Version 1.0.
+# (See accompanying file LICENSE_1_0.txt or http://www.boost.org/LICENSE_1_0.txt)
+
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import re
+import signal
+import sys
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from blocks import load_pieces, solve_portfolio, solve_puzzle
+
+
+def puzzle_goal_pairs(goal_pattern: str = '*.txt'):
+    """
+    Returns all combinations of a file in puzzles/ and a file in goals/ for
+    which the volume of the pieces matches the volume of the goal.
+    """
+    goals = [(path, len(load_pieces(str(path))[0])) for path in sorted(Path('goals').glob(goal_pattern))]
+    for pieces_path in sorted(Path('puzzles').glob('*.txt')):
+        volume = sum(len(piece) for piece in load_pieces(str(pieces_path)))
+        for goal_path, goal_volume in goals:
+            if volume == goal_volume:
+                yield pieces_path, goal_path
+
+
+def script_pairs(script: Path):
+    """
+    Returns the puzzle/goal combinations that are solved by a script like solve_puzzles.
+    """
+    for line in script.read_text().splitlines():
+        pieces = re.search(r'--pieces="?([^"\s]+)', line)
+        goal = re.search(r'--goal="?([^"\s]+)', line)
+        if '--solve' in line and pieces and goal:
+            yield Path(pieces.group(1)), Path(goal.group(1))
+
+
+def run_solver(pieces_path: Path, goal_path: Path, config: str, queue) -> None:
+    """
+    Solves a puzzle using a solver configuration like 'z3', 'z3:bool', 'dlx' or 'portfolio:4'.
+    """
+    # Start a new process group, such that the solver processes of a portfolio can be killed as well
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()
+    backend, _, encoding = config.partition(':')
+    pieces = load_pieces(str(pieces_path))
+    goal = load_pieces(str(goal_path))[0]
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if backend == 'portfolio':
+            solution = solve_portfolio(pieces, goal, int(encoding))
+        else:
+            solution = solve_puzzle(pieces, goal, backend, encoding or 'int')
+    queue.put((time.perf_counter() - start, solution is not None))
+
+
+def time_solver(pieces_path: Path, goal_path: Path, config: str, timeout: float) -> Tuple[Optional[float], bool]:
+    """
+    Returns the number of seconds needed to solve a puzzle in a separate process, or None
+    if it takes more than timeout seconds, and whether a solution was found.
+    """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=run_solver, args=(pieces_path, goal_path, config, queue))
+    process.start()
+    process.join(timeout)
+    if process.is_alive():
+        if hasattr(os, 'killpg'):
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+        process.join()
+        return None, False
+    return queue.get()
+
+
+def benchmark(pieces_path: Path, goal_path: Path, config: str, timeout: float) -> str:
+    seconds, solved = time_solver(pieces_path, goal_path, config, timeout)
+    if seconds is None:
+        return 'timeout'
+    return f'{seconds:.3f}s' if solved else f'{seconds:.3f}s (no solution)'
+
+
+def benchmark_configs(pairs, configs, timeout: float) -> None:
+    print(f'{"pieces":<24} {"goal":<12}' + ''.join(f' {config:>20}' for config in configs))
+    for pieces_path, goal_path in pairs:
+        results = [benchmark(pieces_path, goal_path, config, timeout) for config in configs]
+        print(f'{pieces_path.stem:<24} {goal_path.stem:<12}' + ''.join(f' {result:>20}' for result in results), flush=True)
+
+
+if __name__ == '__main__':
+    os.chdir(Path(__file__).resolve().parent.parent)
+
+    cmdline_parser = argparse.ArgumentParser()
+    cmdline_parser.add_argument('--configs', type=str, default='z3,dlx', help="A comma separated list of solver configurations, e.g. 'z3:int,z3:bool,dlx,portfolio:4'")
+    cmdline_parser.add_argument('--goals', type=str, default='*.txt', help="A glob pattern for the goals that are used, e.g. '4x4x4.txt'")
+    cmdline_parser.add_argument('--script', type=str, help="Only benchmark the puzzles solved by the given script, e.g. 'solve_puzzles'")
+    cmdline_parser.add_argument('--timeout', type=float, default=300, help='The maximum number of seconds per puzzle')
+    args = cmdline_parser.parse_args()
+
+    pairs = script_pairs(Path(args.script)) if args.script else puzzle_goal_pairs(args.goals)
+    benchmark_configs(pairs, args.configs.split(','), args.timeout)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+# Copyright 2024 Wieger Wesselink + Huub van de Wetering.
+# Distributed under the Boost Software License, Version 1.0.
+# (See accompanying file LICENSE_1_0.txt or http://www.boost.org/LICENSE_1_0.txt)
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import z3
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmark import puzzle_goal_pairs, time_solver
+from blocks import COLORS, Piece, PlacementIndex, cube_positions, find_orientations, make_puzzle, make_vrml, parse_colors, parse_pieces, print_piece, rotated_pieces
+
+STAGES = ['parse_pieces', 'rotated_pieces', 'find_orientations', 'placement_index', 'make_puzzle', 'solve_puzzle', 'make_vrml']
+
+
+def random_dissection(goal: Piece, piece_size: int, seed: int = 0) -> List[Piece]:
+    """
+    Splits a goal into random connected pieces of about the given size, which gives
+    a puzzle that has at least one solution.
+    """
+    generator = random.Random(seed)
+    free = set(goal)
+    pieces = []
+    for start in goal:
+        if start not in free:
+            continue
+        free.remove(start)
+        piece = [start]
+        frontier = [start]
+        while len(piece) < piece_size and frontier:
+            x, y, z = generator.choice(frontier)
+            neighbors = [pos for pos in [(x - 1, y, z), (x + 1, y, z), (x, y - 1, z), (x, y + 1, z), (x, y, z - 1), (x, y, z + 1)] if pos in free]
+            if not neighbors:
+                frontier.remove((x, y, z))
+                continue
+            pos = generator.choice(neighbors)
+            free.remove(pos)
+            piece.append(pos)
+            frontier.append(pos)
+        pieces.append(piece)
+    return pieces
+
+
+def synthetic_cases(folder: Path, sizes: List[str]) -> List[tuple]:
+    """
+    Writes a random dissection of a cube for each size like '5x5x5' to folder, and
+    returns the corresponding (pieces file, goal file) pairs.
+    """
+    cases = []
+    for size in sizes:
+        X, Y, Z = map(int, size.split('x'))
+        goal = cube_positions(X, Y, Z)
+        pieces_path = folder / f'random_{size}.txt'
+        goal_path = folder / f'{size}.txt'
+        pieces_path.write_text('\n'.join(print_piece(piece) for piece in random_dissection(goal, 5)) + '\n')
+        goal_path.write_text(print_piece(goal) + '\n')
+        cases.append((pieces_path, goal_path))
+    return cases
+
+
+def measure(function: Callable[[], object], repeat: int) -> float:
+    """
+    Returns the minimum number of seconds of a number of calls of function.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark_case(pieces_path: Path, goal_path: Path, args) -> Dict[str, Optional[float]]:
+    """
+    Measures all stages of the pipeline for one puzzle. The solver runs in a separate
+    process; if it exceeds the timeout the result is None.
+    """
+    pieces_text = pieces_path.read_text()
+    goal_text = goal_path.read_text()
+    pieces = parse_pieces(pieces_text)
+    goal = parse_pieces(goal_text)[0]
+    index = PlacementIndex(pieces, goal)
+    colors = parse_colors(COLORS)
+
+    results = {}
+    results['parse_pieces'] = measure(lambda: (parse_pieces(pieces_text), parse_pieces(goal_text)), args.repeat)
+    results['rotated_pieces'] = measure(lambda: [rotated_pieces(piece) for piece in pieces], args.repeat)
+    results['find_orientations'] = measure(lambda: [find_orientations(piece, goal) for piece in pieces], args.repeat)
+    results['placement_index'] = measure(lambda: PlacementIndex(pieces, goal, args.symmetry_breaking), args.repeat)
+    results['make_puzzle'] = measure(lambda: make_puzzle(pieces, goal, index, args.encoding), args.repeat)
+    results['make_vrml'] = measure(lambda: make_vrml(pieces, colors, True), args.repeat)
+    seconds, solved = time_solver(pieces_path, goal_path, args.solver, args.timeout)
+    results['solve_puzzle'] = seconds
+    return results
+
+
+def run_benchmarks(args) -> dict:
+    with tempfile.TemporaryDirectory() as folder:
+        pairs = list(puzzle_goal_pairs(args.goals))
+        if args.synthetic:
+            pairs += synthetic_cases(Path(folder), args.synthetic.split(','))
+        results = {}
+        for pieces_path, goal_path in pairs:
+            case = f'{pieces_path.stem}/{goal_path.stem}'
+            results[case] = benchmark_case(pieces_path, goal_path, args)
+            print(f'{case:<32}' + ''.join(f' {format_seconds(results[case][stage]):>12}' for stage in STAGES), flush=True)
+
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'z3': z3.get_version_string(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+        },
+        'settings': {'solver': args.solver, 'encoding': args.encoding, 'symmetry_breaking': args.symmetry_breaking, 'repeat': args.repeat, 'timeout': args.timeout},
+        'results': results,
+    }
+
+
+def format_seconds(seconds: Optional[float]) -> str:
+    return 'timeout' if seconds is None else f'{seconds:.4f}s'
+
+
+def compare(baseline: dict, current: dict, threshold: float, min_difference: float) -> int:
+    """
+    Prints the stages that became slower or faster than the baseline by more than the
+    given relative threshold and absolute difference, and returns the number of regressions.
+    """
+    regressions = 0
+    for case, stages in current['results'].items():
+        for stage, seconds in stages.items():
+            old = baseline['results'].get(case, {}).get(stage)
+            if case not in baseline['results'] or (old is None and seconds is None):
+                continue
+            if seconds is None:
+                verdict = 'REGRESSION'
+            elif old is None:
+                verdict = 'improved'
+            elif seconds > old * (1 + threshold) and seconds - old > min_difference:
+                verdict = 'REGRESSION'
+            elif seconds < old / (1 + threshold) and old - seconds > min_difference:
+                verdict = 'improved'
+            else:
+                continue
+            regressions += verdict == 'REGRESSION'
+            print(f'{verdict:<12} {case:<32} {stage:<20} {format_seconds(old):>12} -> {format_seconds(seconds):>12}')
+    print(f'{regressions} regressions')
+    return regressions
+
+
+if __name__ == '__main__':
+    os.chdir(Path(__file__).resolve().parent.parent)
+
+    cmdline_parser = argparse.ArgumentParser(description='Measures the running time of each stage of the pipeline on all bundled puzzles.')
+    cmdline_parser.add_argument('--goals', type=str, default='*.txt', help="A glob pattern for the goals that are used, e.g. '4x4x4.txt'")
+    cmdline_parser.add_argument('--synthetic', type=str, default='5x5x5,6x6x6', help="A comma separated list of cube sizes, that are split into random pieces of size 5. Use '' to disable them")
+    cmdline_parser.add_argument('--solver', type=str, default='dlx', help="The solver configuration used for the solve_puzzle stage, e.g. 'z3:bool' or 'dlx'")
+    cmdline_parser.add_argument('--encoding', type=str, choices=['int', 'bool'], default='bool', help='The encoding used for the make_puzzle stage')
+    cmdline_parser.add_argument('--symmetry-breaking', help='Enables symmetry breaking in the placement_index stage', action='store_true')
+    cmdline_parser.add_argument('--repeat', type=int, default=3, help='The number of repetitions of each stage. The minimum time is reported')
+    cmdline_parser.add_argument('--timeout', type=float, default=60, help='The maximum number of seconds for the solve_puzzle stage')
+    cmdline_parser.add_argument('--output', type=str, help='Saves the results in JSON format to this file, e.g. to create a baseline')
+    cmdline_parser.add_argument('--compare', type=str, help='A JSON file with baseline results. Stages that are slower than the baseline are reported as regressions')
+    cmdline_parser.add_argument('--threshold', type=float, default=0.25, help='The relative slowdown that counts as a regression')
+    cmdline_parser.add_argument('--min-difference', type=float, default=0.005, help='Differences of less than this number of seconds are ignored')
+    args = cmdline_parser.parse_args()
+
+    print(f'{"case":<32}' + ''.join(f' {stage[:12]:>12}' for stage in STAGES))
+    report = run_benchmarks(args)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + '\n')
+        print(f"Saving results to file '{args.output}'")
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        sys.exit(1 if compare(baseline, report, args.threshold, args.min_difference) else 0)
@@ -2,10 +2,19 @@
 # Distributed under the Boost Software License, Version 1.0.
 # (See accompanying file LICENSE_1_0.txt or http://www.boost.org/LICENSE_1_0.txt)
 
-from unittest import TestCase
+import io
+import json
+import multiprocessing
+import os
+import pickle
+import tempfile
+import threading
+from pathlib import Path
+from unittest import TestCase, mock, skipUnless
 from more_itertools import flatten
 
-from blocks import solve_puzzle, parse_pieces
+import blocks
+from blocks import BitboardSolver, add_puzzle, count_solutions, decode_model, make_puzzle, CnfFormula, Deadline, ForcedPlacements, find_infeasibility, Piece, PieceContainer, PlacementCache, PlacementIndex, SolveStats, SolverService, count_cubes, enumerate_solutions, solve_cubes, solve_goals, mask_bits, normalized_rotations, planar_axis, run_batch, solve_portfolio, solve_puzzle, solve_with_budget, load_pieces, load_solutions, make_cnf, make_vrml, parse_pieces, print_piece, rotated_pieces, save_cnf, save_puzzle, save_solutions, select_backend
 
 # This test solves a very simple puzzle with 3 pieces.
 #
@@ -27,4 +36,409 @@ class Test(TestCase):
         pieces = parse_pieces(PIECES)
         goal = parse_pieces(GOAL)[0]
         solution = solve_puzzle(pieces, goal)
-        self.assertEqual(set(goal), set(flatten(solution)))
\ No newline at end of file
+        self.assertEqual(set(goal), set(flatten(solution)))
+
+    def test_puzzle_dlx(self):
+        pieces = parse_pieces(PIECES)
+        goal = parse_pieces(GOAL)[0]
+        solution = solve_puzzle(pieces, goal, backend='dlx')
+        self.assertEqual(set(goal), set(flatten(solution)))
+        self.assertEqual([len(piece) for piece in pieces], [len(piece) for piece in solution])
+
+    def test_placement_index(self):
+        pieces = parse_pieces(PIECES)
+        goal = parse_pieces(GOAL)[0]
+        index = PlacementIndex(pieces, goal)
+        self.assertEqual([16, 16, 6], [len(placements) for placements in index.piece_placements])
+        for bit, placements in enumerate(index.cell_placements):
+            for k in placements:
+                self.assertIn(bit, mask_bits(index.placements[k][1]))
+
+    def test_vectorized_placements(self):
+        # Compare with the scalar rotations and translations that the placements used to be generated with
+        folder = Path(__file__).resolve().parent.parent
+        for pieces_name, goal_name in [('stand_up_soma_cube', '3x3x3'), ('hara_cube', '4x4x4'), ('pentomino', '6x10x1')]:
+            pieces = load_pieces(str(folder / 'puzzles' / f'{pieces_name}.txt'))
+            goal = load_pieces(str(folder / 'goals' / f'{goal_name}.txt'))[0]
+            cells = {pos: k for k, pos in enumerate(goal)}
+            origin, grid = blocks.occupancy_grid(cells)
+            for piece in pieces:
+                rotations = blocks.unique_orientations([blocks.move_to_origin([rotate(pos) for pos in piece]) for rotate in blocks.rotation_group()])
+                self.assertEqual(set(rotations), set(rotated_pieces(piece)))
+                masks = set()
+                for rotation in rotations:
+                    for translation in blocks.find_translations(rotation, goal):
+                        placement = [translation(pos) for pos in rotation]
+                        if blocks.is_sub_piece(placement, goal):
+                            masks.add(sum(1 << cells[pos] for pos in placement))
+                self.assertEqual(sorted(masks), blocks.bits_to_masks(blocks.find_placement_bits(piece, grid), len(goal)))
+
+    def test_puzzle_bool_encoding(self):
+        pieces = parse_pieces(PIECES)
+        goal = parse_pieces(GOAL)[0]
+        solution = solve_puzzle(pieces, goal, encoding='bool')
+        self.assertEqual(set(goal), set(flatten(solution)))
+        self.assertEqual([len(piece) for piece in pieces], [len(piece) for piece in solution])
+
+    def test_add_puzzle(self):
+        pieces = parse_pieces(PIECES)
+        goal = parse_pieces(GOAL)[0]
+        index = PlacementIndex(pieces, goal)
+        for encoding in ['int', 'bool']:
+            solver = blocks.z3.Solver()
+            variables, count = add_puzzle(solver, pieces, goal, index, encoding)
+            self.assertEqual(len(make_puzzle(pieces, goal, index, encoding)[1]), count)
+            self.assertEqual(blocks.z3.sat, solver.check())
+            solution = decode_model(solver.model(), variables, pieces, index, encoding)
+            self.assertEqual(set(goal), set(flatten(solution)))
+        self.assertIsNone(add_puzzle(blocks.z3.Solver(), pieces, goal[1:], None))
+
+    def test_enumerate_solutions(self):
+        pieces = parse_pieces(PIECES)
+        goal = parse_pieces(GOAL)[0]
+        counts = [sum(1 for _ in enumerate_solutions(pieces, goal, backend, encoding)) for backend, encoding in [('z3', 'int'), ('z3', 'bool'), ('dlx', 'int'), ('bitboard', 'int')]]
+        self.assertEqual([16, 16, 16, 16], counts)
+
+    def test_symmetry_breaking(self):
+        pieces = parse_pieces(PIECES)
+        goal = parse_pieces(GOAL)[0]
+        counts = [sum(1 for _ in enumerate_solutions(pieces, goal, backend, encoding, True)) for backend, encoding in [('z3', 'int'), ('z3', 'bool'), ('dlx', 'int'), ('bitboard', 'int')]]
+        self.assertEqual([1, 1, 1, 1], counts)
+
+    def test_planar(self):
+        pieces = parse_pieces(PIECES)
+        goal = parse_pieces(GOAL)[0]
+        self.assertEqual(2, planar_axis(goal))
+        self.assertEqual(None, planar_axis(list(goal) + [(0, 0, 1)]))
+        self.assertEqual([4, 4, 2], [len(normalized_rotations(piece, 2)) for piece in pieces])
+        self.assertEqual(0, len(normalized_rotations([(0, 0, 0), (1, 0, 0), (0, 1, 0), (0, 0, 1)], 2)))
+        self.assertEqual('bitboard', select_backend('auto', goal))
+        self.assertEqual('z3', select_backend('auto', [(x, y, z) for x in range(2) for y in range(2) for z in range(2)]))
+        index = PlacementIndex(pieces, goal)
+        solutions = [index.decode(selected) for selected in BitboardSolver(index).solutions()]
+        self.assertEqual(16, len(solutions))
+        self.assertEqual(sorted(goal), sorted(flatten(solutions[0])))
+
+    def test_count_solutions(self):
+        pieces = parse_pieces(PIECES)
+        goal = parse_pieces(GOAL)[0]
+        self.assertEqual([1, 16], [count_solutions(pieces, goal, symmetry_breaking) for symmetry_breaking in [True, False]])
+        self.assertEqual(16, count_solutions(pieces, goal, cache_size=1))
+
+        # All pieces are congruent, so there is no anchor piece
+        dominoes = parse_pieces('0 0 0   1 0 0') * 3
+        goal = parse_pieces('0 0 0   1 0 0   2 0 0   0 1 0   1 1 0   2 1 0')[0]
+        counts = [sum(1 for _ in enumerate_solutions(dominoes, goal, 'dlx', symmetry_breaking=symmetry_breaking)) for symmetry_breaking in [True, False]]
+        self.assertEqual([2, 18], counts)
+        self.assertEqual(counts, [count_solutions(dominoes, goal, symmetry_breaking) for symmetry_breaking in [True, False]])
+
+    def test_region_pruning(self):
+        pieces = parse_pieces(PIECES)
+        goal = parse_pieces(GOAL)[0]
+        index = PlacementIndex(pieces, goal, pruning=True)
+        self.assertEqual([12, 12, 6], [len(placements) for placements in index.piece_placements])
+        counts = [sum(1 for _ in enumerate_solutions(pieces, goal, 'z3', encoding, pruning=False, propagate=True)) for encoding in ['int', 'bool']]
+        self.assertEqual([16, 16], counts)
+
+    def test_forced_placements(self):
+        pieces = parse_pieces(PIECES)
+        goal = parse_pieces(GOAL)[0]
+        index = PlacementIndex(pieces, goal, symmetry_breaking=True, pruning=True)
+        forced = ForcedPlacements(index)
+        self.assertIsNone(forced.reason)
+        self.assertEqual([2], list(forced.committed))
+        self.assertEqual([0, 1], forced.pieces)
+        self.assertEqual(6, len(forced.residual.goal))
+        self.assertEqual(8, len(forced.residual.placements))
+        for bit, placements in enumerate(forced.residual.cell_placements):
+            for k in placements:
+                self.assertIn(bit, mask_bits(forced.residual.placements[k][1]))
+        solution = forced.merge(solve_puzzle([pieces[i] for i in forced.pieces], forced.residual.goal, index=forced.residual, forcing=False))
+        self.assertEqual(set(goal), set(flatten(solution)))
+        stats = SolveStats()
+        counts = [sum(1 for _ in enumerate_solutions(pieces, goal, 'dlx', symmetry_breaking=symmetry_breaking, stats=stats, forcing=forcing)) for symmetry_breaking in [False, True] for forcing in [False, True]]
+        self.assertEqual([16, 16, 1, 1], counts)
+        self.assertEqual((1, 8), (stats.forced, stats.residual))
+
+    def test_stats(self):
+        pieces = parse_pieces(PIECES)
+        goal = parse_pieces(GOAL)[0]
+        stats = SolveStats()
+        solve_puzzle(pieces, goal, encoding='bool', stats=stats)
+        self.assertEqual(['placements', 'forcing', 'constraints', 'solve'], list(stats.phases))
+        self.assertEqual(9, stats.goal_cells)
+        self.assertEqual([4, 4, 2], stats.rotations)
+        self.assertEqual([12, 12, 6], stats.placements)
+        self.assertEqual(1, stats.solutions)
+        self.assertIn('decisions', stats.to_dict()['solver'])
+        stats = SolveStats()
+        self.assertEqual('solved', solve_with_budget(pieces, goal, timeout=60, escalate=True, stats=stats).status)
+        self.assertEqual(['placements', 'forcing', 'solve'], list(stats.phases)[:3])
+        self.assertEqual(1, stats.solutions)
+        # The resource module is missing on Windows
+        with mock.patch.dict('sys.modules', {'resource': None}):
+            self.assertIsNone(stats.to_dict()['peak_memory'])
+            self.assertNotIn('peak memory', str(stats))
+
+    def test_piece(self):
+        pieces = parse_pieces(PIECES)
+        piece = pieces[0]
+        self.assertEqual([(0, 0, 0), (0, 1, 0), (1, 1, 0)], list(piece))
+        self.assertEqual(PIECES.split('\n')[1], print_piece(piece))
+        self.assertEqual(piece, Piece([(1, 1, 0), (0, 0, 0), (0, 1, 0)]))
+        self.assertNotEqual(piece, pieces[1])
+        self.assertEqual(1, len({piece, Piece(list(reversed(piece)))}))
+        self.assertEqual(((0, 0, 0), (1, 1, 0)), piece.bbox)
+        self.assertEqual((0, 1, 0), piece[1])
+        self.assertEqual(Piece([(0, 0, 0), (0, 1, 0)]), piece[:2])
+        self.assertEqual(piece, pickle.loads(pickle.dumps(piece)))
+        self.assertEqual(12, len(set(rotated_pieces(piece))))
+        self.assertEqual(pieces[0].canonical(), pieces[1].canonical())
+        self.assertNotEqual(pieces[0].canonical(), pieces[2].canonical())
+
+    def test_piece_container(self):
+        pieces = parse_pieces(PIECES)
+        goal = parse_pieces(GOAL)[0]
+        solutions = list(enumerate_solutions(pieces, goal, 'dlx', symmetry_breaking=False))
+        with tempfile.TemporaryDirectory() as folder:
+            for suffix in ['.txt', '.blk']:
+                path = Path(folder) / f'pieces{suffix}'
+                save_puzzle(path, pieces)
+                self.assertEqual([list(piece) for piece in pieces], [list(piece) for piece in load_pieces(str(path))])
+                path = Path(folder) / f'solutions{suffix}'
+                self.assertEqual(16, save_solutions(path, iter(solutions)))
+                self.assertEqual(solutions, list(load_solutions(str(path))))
+            with PieceContainer(str(path)) as container:
+                self.assertEqual(16, len(container))
+                self.assertEqual(solutions[-1], container[-1])
+            self.assertTrue(container.buffer.closed)
+
+    def test_cnf(self):
+        def projections(formula: CnfFormula, n: int):
+            # The assignments of the first n variables that can be extended to a model
+            result = set()
+            for assignment in range(1 << formula.variables):
+                if all(any((assignment >> (abs(x) - 1) & 1) == (x > 0) for x in clause) for clause in formula.clauses):
+                    result.add(assignment & ((1 << n) - 1))
+            return result
+
+        n = 7
+        for cardinality in ['pairwise', 'sequential', 'commander']:
+            formula = CnfFormula(n)
+            formula.exactly_one(list(range(1, n + 1)), cardinality)
+            self.assertEqual(set(1 << i for i in range(n)), projections(formula, n))
+        formula = CnfFormula(5)
+        formula.at_most([1, 2, 3, 4, 5], 2)
+        self.assertEqual(set(a for a in range(32) if bin(a).count('1') <= 2), projections(formula, 5))
+
+        pieces = parse_pieces(PIECES)
+        goal = parse_pieces(GOAL)[0]
+        index = PlacementIndex(pieces, goal)
+        formula, placements = make_cnf(index, 'pairwise')
+        self.assertEqual(len(index.placements), len(placements))
+        self.assertEqual(len(placements), formula.variables)
+        with tempfile.TemporaryDirectory() as folder:
+            path = Path(folder) / 'puzzle.cnf'
+            save_cnf(path, index)
+            lines = path.read_text().splitlines()
+            self.assertEqual(len(placements), sum(1 for line in lines if line.startswith('c placement')))
+            self.assertTrue(any(line.startswith('p cnf ') for line in lines))
+        if blocks.pysat is not None:
+            counts = [sum(1 for _ in enumerate_solutions(pieces, goal, 'sat', symmetry_breaking=symmetry_breaking)) for symmetry_breaking in [False, True]]
+            self.assertEqual([16, 1], counts)
+
+    def test_vrml(self):
+        pieces = parse_pieces(PIECES)
+        goal = parse_pieces(GOAL)[0]
+        orientations = PlacementIndex(pieces, goal).orientations(0)
+        text = make_vrml(orientations, [(1, 0, 0)])
+        self.assertEqual(16, text.count('DEF BLOCK'))
+        self.assertEqual(4, text.count('DEF SHAPE'))
+        self.assertEqual(12, text.count('USE SHAPE'))
+        self.assertEqual(4 * 3, text.count('KUBUS {'))
+        text = make_vrml(pieces[:1], [(1, 0, 0)], merge=True)
+        self.assertEqual(1, text.count('IndexedFaceSet'))
+        self.assertEqual(14, text.count(' -1'))
+
+    def test_solve_goals(self):
+        pieces = parse_pieces(PIECES)
+        goal = parse_pieces(GOAL)[0]
+        goals = [goal, [(x + 3, y, z) for (x, y, z) in goal], goal[:-1]]
+        for incremental in [False, True]:
+            for symmetry_breaking in [False, True]:
+                solutions = list(solve_goals(pieces, goals, encoding='bool', symmetry_breaking=symmetry_breaking, incremental=incremental))
+                self.assertEqual(set(goals[0]), set(flatten(solutions[0])))
+                self.assertEqual(set(goals[1]), set(flatten(solutions[1])))
+                self.assertIsNone(solutions[2])
+        self.assertRaises(ValueError, list, solve_goals(pieces, goals, 'dlx', 'bool', incremental=True))
+        self.assertRaises(ValueError, list, solve_goals(pieces, goals, encoding='int', incremental=True))
+        self.assertRaises(ValueError, list, solve_goals(pieces, goals, encoding='bool', incremental=True, propagate=True))
+        for incremental in [False, True]:
+            stats = SolveStats()
+            solutions = list(solve_goals(pieces, goals[:1], encoding='bool', incremental=incremental, stats=stats, timeout=60))
+            self.assertEqual(set(goals[0]), set(flatten(solutions[0])))
+            self.assertIn('solve', stats.phases)
+
+    def test_budget(self):
+        pieces = parse_pieces(PIECES)
+        goal = parse_pieces(GOAL)[0]
+        for backend, encoding in [('dlx', 'int'), ('z3', 'int'), ('z3', 'bool')]:
+            result = solve_with_budget(pieces, goal, backend, encoding, timeout=60)
+            self.assertEqual('solved', result.status)
+            self.assertEqual(set(goal), set(flatten(result.solution)))
+            self.assertEqual('unsolvable', solve_with_budget(pieces, [(x, 0, 0) for x in range(9)], backend, encoding).status)
+        self.assertEqual('solved', solve_with_budget(pieces, goal, timeout=60, escalate=True).status)
+
+        self.assertRaises(ValueError, solve_with_budget, pieces, goal, escalate=True)
+        deadline = Deadline(60)
+        deadline.cancel()
+        self.assertEqual('unknown', solve_with_budget(pieces, goal, deadline=deadline, escalate=True).status)
+        for backend in ['dlx', 'z3']:
+            self.assertRaises(TimeoutError, list, enumerate_solutions(pieces, goal, backend, forcing=False, deadline=deadline))
+        self.assertEqual(16, len(list(blocks.until_timeout(enumerate_solutions(pieces, goal, 'dlx', deadline=Deadline(60))))))
+        self.assertEqual(16, count_solutions(pieces, goal, deadline=Deadline(60)))
+
+        # The frontier count checks the deadline after every 1024 states
+        folder = Path(__file__).resolve().parent.parent
+        pentomino = load_pieces(str(folder / 'puzzles' / 'pentomino.txt'))
+        self.assertRaises(TimeoutError, count_solutions, pentomino, load_pieces(str(folder / 'goals' / '6x10x1.txt'))[0], deadline=deadline)
+
+        # A search for a hard puzzle is cancelled from another thread
+        pieces = load_pieces(str(folder / 'puzzles' / 'hara_cube.txt'))
+        goal = load_pieces(str(folder / 'goals' / '4x4x4.txt'))[0]
+        for backend, encoding in [('dlx', 'int'), ('z3', 'bool')]:
+            deadline = Deadline()
+            timer = threading.Timer(0.2, deadline.cancel)
+            timer.start()
+            self.assertEqual('unknown', solve_with_budget(pieces, goal, backend, encoding, True, deadline=deadline).status)
+            timer.join()
+
+    def test_infeasibility(self):
+        pieces = parse_pieces(PIECES)
+        goal = parse_pieces(GOAL)[0]
+        self.assertIsNone(find_infeasibility(pieces, goal, PlacementIndex(pieces, goal)))
+        self.assertIn('9 positions, but the goal has 8', find_infeasibility(pieces, goal[:-1]))
+        two_parts = [(0, 0, 0), (1, 0, 0), (0, 1, 0), (1, 1, 0)] + [(x, 5, 0) for x in range(5)]
+        self.assertIn('connected part of 4 positions', find_infeasibility(pieces, two_parts))
+        board = [pos for pos in blocks.cube_positions(4, 4, 1) if pos not in [(0, 0, 0), (3, 3, 0)]]
+        self.assertIn('checkerboard', find_infeasibility([[(0, 0, 0), (1, 0, 0)]] * 7, board))
+        pieces = [[(0, 0, 0), (1, 0, 0), (2, 0, 0), (3, 0, 0)], [(0, 0, 0), (1, 0, 0), (2, 0, 0), (0, 1, 0), (1, 1, 0)]]
+        self.assertIsNone(find_infeasibility(pieces, goal))
+        self.assertEqual('Piece 0 does not fit in the goal', find_infeasibility(pieces, goal, PlacementIndex(pieces, goal)))
+        self.assertEqual('Piece 0 does not fit in the goal', blocks.find_missing_placements(PlacementIndex(pieces, goal)))
+        result = solve_with_budget(pieces, goal, backend='dlx')
+        self.assertEqual(('unsolvable', 'Piece 0 does not fit in the goal'), (result.status, result.reason))
+
+    def test_cubes(self):
+        pieces = parse_pieces(PIECES)
+        goal = parse_pieces(GOAL)[0]
+        counts = [count_cubes(pieces, goal, backend, symmetry_breaking, processes=2) for backend in ['z3', 'dlx'] for symmetry_breaking in [False, True]]
+        self.assertEqual([16, 1, 16, 1], counts)
+        solution = solve_cubes(pieces, goal, processes=2, timeout=1)
+        self.assertEqual(set(goal), set(flatten(solution)))
+        # With a tiny timeout every cube is split, until it covers the goal and is solved without a limit
+        index = PlacementIndex(pieces, goal)
+        self.assertEqual('split', blocks.CubeSolver(pieces, index, 'dlx').solve([], 1e-9)[0])
+        solution = solve_cubes(pieces, goal, backend='dlx', processes=2, timeout=1e-9)
+        self.assertEqual(set(goal), set(flatten(solution)))
+
+    def test_batch(self):
+        with tempfile.TemporaryDirectory() as folder:
+            pieces_path = Path(folder) / 'pieces.txt'
+            goal_path = Path(folder) / 'goal.txt'
+            pieces_path.write_text(PIECES)
+            goal_path.write_text(GOAL)
+            jobs = [(str(pieces_path), str(goal_path))] * 2
+            records = list(run_batch(jobs, backend='dlx', processes=2, timeout=60))
+        self.assertEqual(['solved', 'solved'], [record['status'] for record in records])
+        self.assertEqual([12, 12, 6], records[0]['placements'])
+        self.assertEqual(set(parse_pieces(GOAL)[0]), {tuple(pos) for pos in flatten(records[0]['solution'])})
+
+    @skipUnless(multiprocessing.get_start_method() == 'fork', 'the patched job function is only inherited by forked workers')
+    def test_batch_crash(self):
+        with tempfile.TemporaryDirectory() as folder:
+            pieces_path = Path(folder) / 'pieces.txt'
+            goal_path = Path(folder) / 'goal.txt'
+            pieces_path.write_text(PIECES)
+            goal_path.write_text(GOAL)
+            with mock.patch('blocks.run_batch_job', side_effect=lambda *args: os._exit(3)):
+                records = list(run_batch([(str(pieces_path), str(goal_path))] * 2, backend='dlx', processes=1))
+        self.assertEqual([('error', 'The worker process exited with code 3')] * 2, [(record['status'], record['error']) for record in records])
+
+    def test_service(self):
+        with tempfile.TemporaryDirectory() as folder:
+            pieces_path = Path(folder) / 'pieces.txt'
+            goal_path = Path(folder) / 'goal.txt'
+            pieces_path.write_text(PIECES)
+            goal_path.write_text(GOAL)
+            solve = {'command': 'solve', 'pieces': str(pieces_path), 'goal': str(goal_path), 'backend': 'dlx'}
+            requests = [
+                dict(solve, id=1),
+                dict(solve, id=2, symmetry_breaking=False),
+                dict(solve, id=3),
+                {'id': 4, 'command': 'draw', 'pieces': str(pieces_path), 'output': str(Path(folder) / 'pieces.wrl')},
+                {'id': 5, 'command': 'export', 'pieces': str(pieces_path), 'goal': str(goal_path), 'output': str(Path(folder) / 'puzzle.smt')},
+                {'id': 6, 'command': 'cancel', 'target': 7},
+                {'id': 7, 'command': 'unknown'},
+                solve,
+            ]
+            service = SolverService()
+            output = io.StringIO()
+            blocks.serve_stream(service, io.StringIO('\n'.join(json.dumps(request) for request in requests) + '\nnot json\n'), output)
+            answers = [json.loads(line) for line in output.getvalue().splitlines()]
+            self.assertTrue((Path(folder) / 'pieces.wrl').exists())
+            self.assertTrue((Path(folder) / 'puzzle.smt').exists())
+            small = SolverService(max_entries=1)
+            small.placement_index(str(pieces_path), str(goal_path), True)
+            small.placement_index(str(pieces_path), str(goal_path), False)
+            self.assertEqual(1, len(small.indices))
+        statuses = {answer['id']: answer['status'] for answer in answers}
+        self.assertEqual({None: 'error', 1: 'solved', 2: 'solved', 3: 'solved', 4: 'ok', 5: 'ok', 6: 'error', 7: 'error'}, statuses)
+        self.assertEqual(2, sum(answer['id'] is None for answer in answers))
+        solution = next(answer['solution'] for answer in answers if answer['id'] == 1)
+        self.assertEqual(set(parse_pieces(GOAL)[0]), {tuple(pos) for pos in flatten(solution)})
+        self.assertEqual(2, len(service.indices))
+        self.assertEqual(4, service.misses)
+        # The ids of pending requests are unique per connection, and cancel only finds the requests of its connection
+        answers = []
+        service.deadlines[('a', 8)] = Deadline()
+        self.assertIsNone(service.submit(json.dumps(dict(solve, id=8)), answers.append, None, 'a'))
+        service.submit(json.dumps({'id': 9, 'command': 'cancel', 'target': 8}), answers.append, None, 'b')
+        self.assertEqual(['error', 'error'], [answer['status'] for answer in answers])
+        self.assertFalse(service.deadlines[('a', 8)].expired())
+        service.submit(json.dumps({'id': 9, 'command': 'cancel', 'target': 8}), answers.append, None, 'a')
+        self.assertEqual('ok', answers[-1]['status'])
+        self.assertTrue(service.deadlines[('a', 8)].expired())
+        with mock.patch('blocks.socketserver', object()):
+            self.assertRaises(RuntimeError, blocks.serve_socket, service, 'blocks.sock')
+
+    def test_portfolio(self):
+        pieces = parse_pieces(PIECES)
+        goal = parse_pieces(GOAL)[0]
+        solution = solve_portfolio(pieces, goal, processes=4)
+        self.assertEqual(set(goal), set(flatten(solution)))
+        self.assertEqual([len(piece) for piece in pieces], [len(piece) for piece in solution])
+
+    def test_placement_cache(self):
+        pieces = parse_pieces(PIECES)
+        goal = parse_pieces(GOAL)[0]
+        expected = PlacementIndex(pieces, goal).placements
+        with tempfile.TemporaryDirectory() as folder:
+            blocks.placement_cache = PlacementCache(Path(folder))
+            try:
+                self.assertEqual(expected, PlacementIndex(pieces, goal).placements)
+                self.assertEqual(expected, PlacementIndex(pieces, goal).placements)
+                self.assertEqual((4, 2), (blocks.placement_cache.hits, blocks.placement_cache.misses))
+                # A short or truncated entry is a miss, and is overwritten
+                entries = sorted(Path(folder).glob('*.bin'))
+                sizes = [entry.stat().st_size for entry in entries]
+                entries[0].write_bytes(PlacementCache.MAGIC + bytes(4))
+                entries[1].write_bytes(entries[1].read_bytes()[:-4])
+                self.assertEqual(expected, PlacementIndex(pieces, goal).placements)
+                self.assertEqual((5, 4), (blocks.placement_cache.hits, blocks.placement_cache.misses))
+                self.assertEqual(sizes, [entry.stat().st_size for entry in entries])
+                # The rotations are part of the key, so a subset of them gets its own entries
+                PlacementIndex(pieces, goal, rotations=[normalized_rotations(piece)[:1] for piece in pieces])
+                self.assertEqual((6, 6), (blocks.placement_cache.hits, blocks.placement_cache.misses))
+            finally:
+                blocks.placement_cache = None